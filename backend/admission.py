@@ -0,0 +1,177 @@
+# admission.py - Per-endpoint concurrency limits with a bounded, deadline-aware wait queue
+#
+# Each expensive endpoint gets an AdmissionController. Up to `max_concurrent`
+# requests run at once; the next `max_queue` wait in FIFO order for at most
+# `queue_timeout` seconds. Anything beyond that is turned away immediately
+# with 429, and requests whose wait deadline passes get 503, both with a
+# Retry-After header, so overload shows up as fast failures rather than
+# latency collapse for everyone.
+import asyncio
+import functools
+import math
+import os
+import time
+from collections import deque
+from typing import Deque
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+from metrics import counter, gauge, summary
+
+ADMISSION_CONTROL = os.getenv("ADMISSION_CONTROL", "true").lower() == "true"
+ASK_MAX_CONCURRENT = int(os.getenv("ASK_MAX_CONCURRENT", "16"))
+ASK_MAX_QUEUE = int(os.getenv("ASK_MAX_QUEUE", "64"))
+ASK_QUEUE_TIMEOUT = float(os.getenv("ASK_QUEUE_TIMEOUT", "10"))  # seconds
+GUIDANCE_MAX_CONCURRENT = int(os.getenv("GUIDANCE_MAX_CONCURRENT", "8"))
+GUIDANCE_MAX_QUEUE = int(os.getenv("GUIDANCE_MAX_QUEUE", "32"))
+GUIDANCE_QUEUE_TIMEOUT = float(os.getenv("GUIDANCE_QUEUE_TIMEOUT", "5"))  # seconds
+
+admission_in_flight = gauge("admission_in_flight", "Requests currently admitted", ("endpoint",))
+admission_queue_depth = gauge("admission_queue_depth", "Requests waiting for admission", ("endpoint",))
+admission_wait_seconds = summary(
+    "admission_wait_seconds", "Time requests spent waiting for admission", ("endpoint",)
+)
+admission_rejected = counter(
+    "admission_rejected_total", "Requests turned away by admission control", ("endpoint", "reason")
+)
+
+class AdmissionSlot:
+    """One admitted request; releasing it lets the next queued request in"""
+
+    def __init__(self, controller: "AdmissionController", admitted_at: float):
+        self._controller = controller
+        self._admitted_at = admitted_at
+        self._held = True
+
+    def release(self):
+        if self._held:
+            self._held = False
+            self._controller._release(time.monotonic() - self._admitted_at)
+
+class _HeldStream:
+    """Response body that keeps an admission slot until it is exhausted, closed or dropped"""
+
+    def __init__(self, body, slot: AdmissionSlot):
+        self._iterator = body.__aiter__()
+        self._slot = slot
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            return await self._iterator.__anext__()
+        except BaseException:
+            # End of stream, an error, or the client disconnecting
+            self._slot.release()
+            raise
+
+    async def aclose(self):
+        self._slot.release()
+        if hasattr(self._iterator, "aclose"):
+            await self._iterator.aclose()
+
+    def __del__(self):
+        # Starlette may drop the body without iterating it (client gone before the first chunk)
+        self._slot.release()
+
+class AdmissionController:
+    """Concurrency limit plus bounded FIFO wait queue for one endpoint"""
+
+    def __init__(self, endpoint: str, max_concurrent: int, max_queue: int, queue_timeout: float,
+                 enabled: bool = ADMISSION_CONTROL):
+        self.endpoint = endpoint
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.enabled = enabled
+        self._active = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._avg_hold_seconds = 1.0  # moving average of how long a slot is held
+
+    def retry_after(self) -> int:
+        """Seconds until a slot is likely to be free for a new arrival"""
+        backlog = len(self._waiters) + 1
+        return max(1, math.ceil(self._avg_hold_seconds * backlog / max(1, self.max_concurrent)))
+
+    def _reject(self, status_code: int, reason: str, detail: str):
+        admission_rejected.inc(endpoint=self.endpoint, reason=reason)
+        raise HTTPException(status_code=status_code, detail=detail, headers={"Retry-After": str(self.retry_after())})
+
+    def _update_gauges(self):
+        admission_in_flight.set(self._active, endpoint=self.endpoint)
+        admission_queue_depth.set(len(self._waiters), endpoint=self.endpoint)
+
+    async def admit(self) -> AdmissionSlot:
+        """Wait for a slot; raises HTTPException 429 (queue full) or 503 (wait deadline passed)"""
+        if not self.enabled or (self._active < self.max_concurrent and not self._waiters):
+            self._active += 1
+            self._update_gauges()
+            admission_wait_seconds.observe(0.0, endpoint=self.endpoint)
+            return AdmissionSlot(self, time.monotonic())
+
+        if len(self._waiters) >= self.max_queue:
+            self._reject(429, "queue_full", "Server is busy, please retry shortly")
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self._update_gauges()
+        queued_at = time.monotonic()
+        try:
+            # _release hands the slot over by resolving the future (_active is not decremented)
+            await asyncio.wait_for(waiter, timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            self._reject(503, "timeout", "Timed out waiting for capacity, please retry")
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self._release(0.0, observe=False)  # handed over just as the client left
+            raise
+        finally:
+            try:
+                self._waiters.remove(waiter)
+            except ValueError:
+                pass
+            admission_wait_seconds.observe(time.monotonic() - queued_at, endpoint=self.endpoint)
+            self._update_gauges()
+        return AdmissionSlot(self, time.monotonic())
+
+    def _release(self, held_seconds: float, observe: bool = True):
+        if observe:
+            self._avg_hold_seconds = 0.9 * self._avg_hold_seconds + 0.1 * held_seconds
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                self._update_gauges()
+                return
+        self._active -= 1
+        self._update_gauges()
+
+    def limit(self, handler):
+        """Decorator for an async route handler.
+
+        The slot is held while the handler runs and, for streaming responses,
+        until the stream ends or the client disconnects.
+        """
+        @functools.wraps(handler)
+        async def admitted_handler(*args, **kwargs):
+            slot = await self.admit()
+            try:
+                response = await handler(*args, **kwargs)
+            except BaseException:
+                slot.release()
+                raise
+            if isinstance(response, StreamingResponse):
+                response.body_iterator = _HeldStream(response.body_iterator, slot)
+            else:
+                slot.release()
+            return response
+        return admitted_handler
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": self._active,
+            "queued": len(self._waiters),
+            "max_concurrent": self.max_concurrent,
+            "max_queue": self.max_queue,
+            "avg_hold_seconds": round(self._avg_hold_seconds, 3),
+        }
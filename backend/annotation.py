@@ -0,0 +1,75 @@
+# annotation.py - Ingest-time sentence annotation of chunks
+#
+# Guidance pulls requirement, processing-time and fee sentences out of the
+# retrieved chunks. Finding them means splitting and keyword-scanning the
+# text, and the answer is the same every time a chunk is retrieved, so it is
+# done once per chunk at ingestion and stored in the payload:
+#
+#   "sentences": [[start, end, [tag, ...]], ...]  character spans of tagged sentences
+#   "forms":     ["I-130", "N-400", ...]          form numbers mentioned in the chunk
+#
+# At request time a tagged sentence is a slice of the chunk text.
+import re
+from typing import Dict, List
+
+ANNOTATION_VERSION = 2  # bump when tagging changes; older payloads are re-annotated when read
+
+# A sentence ends at ., ! or ? followed by whitespace, or at a line break;
+# initials like "U.S." do not end one
+SENTENCE_RE = re.compile(r"[^\n]+?(?:[.!?](?<!\b[A-Z]\.)(?=\s)|$)", re.MULTILINE)
+
+# USCIS (I-, N-, G-, AR-), State Department (DS-) and Labor (ETA-) form numbers;
+# visa classes such as H-1B, F-1, EB-5 or B-2 share the shape but are not forms
+FORM_RE = re.compile(r"\b(?:I|N|G|AR|DS|ETA)-\d{1,4}[A-Z]?\b")
+
+SENTENCE_TAGS = {
+    "requirement": re.compile(r"\b(?:must|required|requirements?|needs?|needed|eligib\w*|qualif\w*)\b", re.IGNORECASE),
+    "processing_time": re.compile(r"\b(?:days?|weeks?|months?|years?|processing)\b", re.IGNORECASE),
+    "fee": re.compile(r"\$\s?\d|\bfees?\b", re.IGNORECASE),
+    "form": FORM_RE,
+}
+
+def annotate_text(text: str) -> Dict:
+    """Tagged sentence spans and form numbers for one chunk's text"""
+    sentences = []
+    for match in SENTENCE_RE.finditer(text):
+        sentence = match.group()
+        stripped = sentence.strip()
+        if not stripped:
+            continue
+        tags = [tag for tag, pattern in SENTENCE_TAGS.items() if pattern.search(stripped)]
+        if tags:
+            start = match.start() + (len(sentence) - len(sentence.lstrip()))
+            sentences.append([start, start + len(stripped), tags])
+    forms = sorted(set(FORM_RE.findall(text)))
+    return {"sentences": sentences, "forms": forms, "annotation_version": ANNOTATION_VERSION}
+
+def annotate_chunks(chunks: List[Dict], progress=None) -> List[Dict]:
+    """Add annotations to each chunk in place (the ingestion pipeline's annotate stage)"""
+    for n, chunk in enumerate(chunks, 1):
+        chunk.update(annotate_text(chunk["text"]))
+        if progress and (n % 100 == 0 or n == len(chunks)):
+            progress("annotate", n, len(chunks))
+    return chunks
+
+def annotation_payload(chunk: Dict) -> Dict:
+    """The annotation fields of a chunk, for Qdrant payloads and the lexical index
+    (annotating it first if the annotate stage did not run)"""
+    if chunk.get("annotation_version") != ANNOTATION_VERSION:
+        chunk.update(annotate_text(chunk["text"]))
+    return {
+        "sentences": chunk["sentences"],
+        "forms": chunk["forms"],
+        "annotation_version": chunk["annotation_version"],
+    }
+
+def tagged_sentences(chunk: Dict, tag: str) -> List[str]:
+    """Sentences of a retrieved chunk carrying `tag`.
+
+    Chunks indexed before annotation existed (or restored from an old
+    snapshot) are annotated on the fly.
+    """
+    if chunk.get("annotation_version") != ANNOTATION_VERSION:
+        chunk.update(annotate_text(chunk["text"]))
+    text = chunk["text"]
+    return [text[start:end] for start, end, tags in chunk["sentences"] if tag in tags]
@@ -1,16 +1,27 @@
 # api.py
 from fastapi import FastAPI
-from fastapi.responses import StreamingResponse
+from fastapi.responses import Response, JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 import os
+import asyncio
+import threading
+from typing import List
 from qdrant_client import QdrantClient
-from qdrant_client.http.models import Distance, VectorParams
-from sentence_transformers import SentenceTransformer
 from pydantic import BaseModel
-from transformers import AutoTokenizer, AutoModelForCausalLM, TextIteratorStreamer
-from threading import Thread
-import torch
 from db import init_db, log_conversation, create_lead
+from embeddings import ensure_collection, add_index_listener
+from retrieval import (
+    hybrid_search_async, embed_query, watch_index_version, qdrant_reachable, close_async_qdrant_client
+)
+from generation import GenerationScheduler
+from llm_backend import load_causal_lm, LLM_MODEL_NAME, LLM_BACKEND, LLM_DRAFT_MODEL_NAME, SPECULATIVE_TOKENS
+from context_packer import ContextPacker, CONTEXT_TOKEN_BUDGET
+from streaming import sse_response, split_words
+from semantic_cache import SemanticCache, SEMANTIC_CACHE_ENABLED
+from admission import AdmissionController, ASK_MAX_CONCURRENT, ASK_MAX_QUEUE, ASK_QUEUE_TIMEOUT
+from warmup import Warmup, warm_embedding_model, warm_lexical_index
+from metrics import counter, gauge, render_metrics, PROMETHEUS_CONTENT_TYPE
+from instrumentation import ServerTimingMiddleware, stage
 
 app = FastAPI(title="AI Immigration Consultant API")
 
@@ -21,56 +32,151 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(ServerTimingMiddleware)
 
 # Load environment variables
 QDRANT_URL = os.getenv("QDRANT_URL", "http://localhost:6333")
 HF_TOKEN = os.getenv("HF_TOKEN")
+GENERATION_MAX_BATCH = int(os.getenv("GENERATION_MAX_BATCH", "8"))
+# Cached prompt positions beyond the pinned system prompt (prompt + frequent chunks); 0 disables
+PREFIX_CACHE_TOKENS = int(os.getenv("PREFIX_CACHE_TOKENS", "0"))
+
+# Fixed start of every RAG prompt; its KV cache is computed once and reused
+SYSTEM_PROMPT_PREFIX = "You are an AI immigration consultant. You have access to the following official information:\n"
+ANSWER_MAX_TOKENS = 512
 
-# Initialize Qdrant client and embedding model globally
+# Initialize Qdrant client globally (retrieval shares the embedding model from embeddings.py)
 qdrant = QdrantClient(url=QDRANT_URL)
-embed_model = SentenceTransformer("sentence-transformers/all-MiniLM-L6-v2")
 
 # Collection configuration
 COLLECTION_NAME = "immigration_docs"
 VECTOR_SIZE = 384
 
-# Ensure our collection exists
-try:
-    qdrant.get_collection(COLLECTION_NAME)
-except:
-    qdrant.create_collection(
-        collection_name=COLLECTION_NAME,
-        vectors_config=VectorParams(size=VECTOR_SIZE, distance=Distance.COSINE)
-    )
+# Ensure our collection exists (layout follows QDRANT_PROFILE)
+ensure_collection(COLLECTION_NAME, VECTOR_SIZE)
 
 # Initialize database
 init_db()
 
+# Concurrency limits and bounded wait queues for the expensive endpoints
+ask_admission = AdmissionController("/ask", ASK_MAX_CONCURRENT, ASK_MAX_QUEUE, ASK_QUEUE_TIMEOUT)
+
+# Answers to paraphrased questions are replayed from the semantic cache
+answer_cache = SemanticCache("ask") if SEMANTIC_CACHE_ENABLED else None
+if answer_cache is not None:
+    add_index_listener(answer_cache.on_index_version)
+
+ask_abandoned = counter(
+    "ask_requests_abandoned_total", "Streaming answers stopped because the client disconnected", ("endpoint",)
+)
+
 # Initialize LLM (will be loaded on first use for faster startup)
 llm_model = None
 llm_tokenizer = None
+draft_model = None
+generation_scheduler = None
+context_packer = None
+llm_lock = threading.Lock()
+
+# Hit ratios of the generation-side caches, read at scrape time (absent until the model loads)
+gauge("generation_prefix_cache_hit_ratio", "Share of prompt segments served from the KV prefix cache",
+      callback=lambda: generation_scheduler.prefix_cache.hits
+      / (generation_scheduler.prefix_cache.hits + generation_scheduler.prefix_cache.misses))
+gauge("context_packer_hit_ratio", "Share of retrieved chunks whose token counts were cached",
+      callback=lambda: context_packer.hits / (context_packer.hits + context_packer.misses))
 
 def load_llm():
     """Load the LLM model and tokenizer"""
-    global llm_model, llm_tokenizer
-    if llm_model is None:
-        print("Loading LLaMA model...")
-        model_name = "microsoft/DialoGPT-medium"  # Using a smaller model for Apple Silicon
-        # For production, you could use: "meta-llama/Llama-2-7b-chat-hf"
-        
-        llm_tokenizer = AutoTokenizer.from_pretrained(model_name, token=HF_TOKEN)
-        llm_model = AutoModelForCausalLM.from_pretrained(
-            model_name,
-            token=HF_TOKEN,
-            torch_dtype=torch.float16 if torch.cuda.is_available() else torch.float32,
-            device_map="auto" if torch.cuda.is_available() else None
-        )
-        
-        if llm_tokenizer.pad_token is None:
-            llm_tokenizer.pad_token = llm_tokenizer.eos_token
-        
+    global llm_model, llm_tokenizer, draft_model, context_packer
+    with llm_lock:
+        if llm_model is not None:
+            return
+        print(f"Loading LLaMA model ({LLM_BACKEND} backend)...")
+        llm_model, llm_tokenizer = load_causal_lm(LLM_MODEL_NAME, LLM_BACKEND, token=HF_TOKEN)
+        if LLM_DRAFT_MODEL_NAME:
+            print(f"Loading draft model {LLM_DRAFT_MODEL_NAME} for speculative decoding...")
+            draft_model, _ = load_causal_lm(LLM_DRAFT_MODEL_NAME, LLM_BACKEND, token=HF_TOKEN)
+        context_packer = ContextPacker(llm_tokenizer)
         print("LLaMA model loaded successfully!")
 
+def preload():
+    """Called by serve.py before it forks workers, so they share the LLM weights"""
+    load_llm()
+
+def get_generation_scheduler() -> GenerationScheduler:
+    """Get the generation scheduler, loading the model on first use"""
+    global generation_scheduler
+    load_llm()
+    with llm_lock:
+        if generation_scheduler is None:
+            generation_scheduler = GenerationScheduler(
+                llm_model,
+                llm_tokenizer,
+                max_batch_size=GENERATION_MAX_BATCH,
+                prefix_cache_tokens=PREFIX_CACHE_TOKENS,
+                draft_model=draft_model,
+                num_draft_tokens=SPECULATIVE_TOKENS
+            )
+            generation_scheduler.register_prefix(SYSTEM_PROMPT_PREFIX)
+            generation_scheduler.start()
+    return generation_scheduler
+
+async def submit_generation(scheduler: GenerationScheduler, prompt_segments, **kwargs):
+    """Queue a prompt for generation, tokenizing off the event loop.
+
+    If the caller is cancelled while the prompt is being queued, the queued
+    request is cancelled as soon as it exists.
+    """
+    submission = asyncio.ensure_future(
+        asyncio.to_thread(scheduler.submit, prompt_segments, asyncio.get_running_loop(), **kwargs)
+    )
+    try:
+        return await asyncio.shield(submission)
+    except asyncio.CancelledError:
+        submission.add_done_callback(
+            lambda done: done.cancelled() or done.exception() or done.result().cancel()
+        )
+        raise
+
+def build_prompt_segments(question: str, retrieved_texts: List[str]) -> List[str]:
+    """RAG prompt as segments, with the retrieved chunks packed into the token budget.
+
+    Segments let the fixed prefix (and frequently retrieved chunks) be served
+    from the KV prefix cache. The context budget shrinks when needed so the
+    prompt plus ANSWER_MAX_TOKENS fits the model's context window.
+    """
+    instructions = (
+        "\n"
+        "Using this information, answer the user's question about immigration. "
+        "Be accurate, concise, and helpful. If the information is insufficient, say you don't know.\n\n"
+        f"User question: {question}\n"
+        "Answer:"
+    )
+    budget = CONTEXT_TOKEN_BUDGET
+    if generation_scheduler.max_context:
+        fixed_tokens = context_packer.count_tokens(SYSTEM_PROMPT_PREFIX) + context_packer.count_tokens(instructions)
+        budget = min(budget, generation_scheduler.max_context - ANSWER_MAX_TOKENS - fixed_tokens)
+    context = context_packer.pack(retrieved_texts, budget)
+    if not context:
+        context = ["No relevant information found in knowledge base.\n"]
+    return [SYSTEM_PROMPT_PREFIX] + context + [instructions]
+
+def warm_llm():
+    """Load the LLM and run a short generation through the RAG prompt shape"""
+    scheduler = get_generation_scheduler()
+    scheduler.warm_up([
+        SYSTEM_PROMPT_PREFIX,
+        "Form I-130 is used to establish a relationship to an eligible relative.\n",
+        "\nUser question: What is Form I-130?\nAnswer:"
+    ])
+
+# Models load and run once in the background at startup; /health/ready
+# reports ready only afterwards, while /ask still lazy-loads if called earlier
+warmup = Warmup()
+warmup.add_stage("embedding_model", warm_embedding_model)
+warmup.add_stage("lexical_index", warm_lexical_index)
+warmup.add_stage("llm", warm_llm)
+
 class QuestionRequest(BaseModel):
     question: str
 
@@ -79,88 +185,101 @@ class LeadRequest(BaseModel):
     country: str
     intent: str
 
+@app.on_event("startup")
+async def startup_event():
+    warmup.start()
+    # Notice index swaps made by the ingestion API, which invalidate cached answers
+    asyncio.create_task(watch_index_version(COLLECTION_NAME))
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    if generation_scheduler is not None:
+        generation_scheduler.stop()
+    await close_async_qdrant_client()
+
 @app.get("/")
 async def root():
     return {"message": "AI Immigration Consultant API"}
 
 @app.post("/ask")
+@ask_admission.limit
 async def ask_question(req: QuestionRequest):
     question = req.question
     
-    # 1. Embed the user's question
-    q_vector = embed_model.encode(question).tolist()
+    # 1. Embed the user's question; a close enough earlier question replays its answer
+    question_vector = await embed_query(question)
+    with stage("answer_cache_lookup"):
+        cached_answer = answer_cache.lookup(question_vector) if answer_cache is not None else None
+    if cached_answer is not None:
+        async def stream_cached_answer():
+            for word in split_words(cached_answer):
+                yield word
+            try:
+                await asyncio.to_thread(log_conversation, question, cached_answer)
+            except Exception as e:
+                print(f"Error logging conversation: {e}")
+        
+        return sse_response(stream_cached_answer())
     
-    # 2. Retrieve relevant docs from Qdrant
-    try:
-        results = qdrant.search(
-            collection_name=COLLECTION_NAME, 
-            query_vector=q_vector, 
-            limit=3
-        )
-        retrieved_texts = [res.payload.get("text", "") for res in results if res.payload]
-        context = "\n".join(retrieved_texts)
-    except Exception as e:
-        print(f"Vector search error: {e}")
-        context = "No relevant information found in knowledge base."
+    # 2. Retrieve relevant docs without blocking the event loop
+    results = await hybrid_search_async(question, collection_name=COLLECTION_NAME, limit=5,
+                                        query_vector=question_vector)
+    retrieved_texts = [res["text"] for res in results if res["text"]]
     
-    # 3. Construct prompt for LLM
-    system_context = (
-        "You are an AI immigration consultant. You have access to the following official information:\n"
-        f"{context}\n\n"
-        "Using this information, answer the user's question about immigration. "
-        "Be accurate, concise, and helpful. If the information is insufficient, say you don't know.\n\n"
-        f"User question: {question}\n"
-        "Answer:"
-    )
-    
-    # 4. Generate LLM response (streaming)
-    def stream_llm_response():
+    # 3-4. Pack the retrieved chunks into the prompt's token budget and generate
+    # the LLM response (streaming); the scheduler batches this request with the
+    # other in-flight ones and streams tokens back as they are sampled
+    async def stream_llm_response():
         accumulated_response = ""
+        generation = None
+        finished = False
         try:
-            # Load model on first use
-            load_llm()
-            
-            # Tokenize input
-            inputs = llm_tokenizer.encode(system_context, return_tensors="pt")
-            
-            # Set up streaming
-            streamer = TextIteratorStreamer(llm_tokenizer, skip_prompt=True, skip_special_tokens=True)
+            # Load model on first use (off the event loop)
+            scheduler = await asyncio.to_thread(get_generation_scheduler)
+            with stage("build_prompt"):
+                prompt_segments = await asyncio.to_thread(build_prompt_segments, question, retrieved_texts)
             
-            # Generation parameters
-            generation_kwargs = {
-                "input_ids": inputs,
-                "max_new_tokens": 512,
-                "do_sample": True,
-                "temperature": 0.7,
-                "top_p": 0.9,
-                "streamer": streamer,
-                "pad_token_id": llm_tokenizer.eos_token_id
-            }
-            
-            # Start generation in a separate thread
-            thread = Thread(target=llm_model.generate, kwargs=generation_kwargs)
-            thread.start()
+            generation = await submit_generation(
+                scheduler,
+                prompt_segments,
+                max_new_tokens=ANSWER_MAX_TOKENS,
+                temperature=0.7,
+                top_p=0.9
+            )
             
             # Stream the response
-            for new_text in streamer:
+            async for new_text in generation.stream():
                 if new_text:
                     accumulated_response += new_text
-                    yield f"data: {new_text}\n\n"
+                    yield new_text
+            finished = True
             
-            thread.join()
+            if answer_cache is not None and accumulated_response.strip():
+                answer_cache.store(question, question_vector, accumulated_response)
             
         except Exception as e:
+            finished = True
             error_msg = f"I apologize, but I'm having trouble generating a response right now. Please try again. Error: {str(e)}"
-            yield f"data: {error_msg}\n\n"
+            yield error_msg
             accumulated_response = error_msg
+        finally:
+            if not finished:
+                # The client disconnected (the stream was cancelled or closed):
+                # free the batch slot and keep the partial answer. Nothing can
+                # be awaited here, so the log write is fire-and-forget.
+                if generation is not None:
+                    generation.cancel()
+                ask_abandoned.inc(endpoint="/ask")
+                print(f"Client disconnected after {len(accumulated_response)} chars; generation cancelled")
+                asyncio.get_running_loop().run_in_executor(None, log_conversation, question, accumulated_response)
         
         # Log the conversation
         try:
-            log_conversation(question, accumulated_response)
+            await asyncio.to_thread(log_conversation, question, accumulated_response)
         except Exception as e:
             print(f"Error logging conversation: {e}")
     
-    return StreamingResponse(stream_llm_response(), media_type="text/event-stream")
+    return sse_response(stream_llm_response())
 
 @app.post("/lead")
 async def submit_lead(req: LeadRequest):
@@ -171,6 +290,32 @@ async def submit_lead(req: LeadRequest):
     except Exception as e:
         return {"status": "error", "message": str(e)}
 
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics"""
+    return Response(render_metrics(), media_type=PROMETHEUS_CONTENT_TYPE)
+
+@app.get("/health/live")
+async def liveness():
+    """Liveness probe: 200 while the process is serving, 503 once warm-up has failed for good"""
+    if warmup.failed:
+        return JSONResponse({"status": "warmup_failed", "warmup": warmup.to_dict()}, status_code=503)
+    return {"status": "alive"}
+
+@app.get("/health/ready")
+async def readiness():
+    """Readiness probe: 200 once models are warmed up and Qdrant is reachable, 503 before"""
+    qdrant_ok = await qdrant_reachable(COLLECTION_NAME)
+    ready = warmup.ready and qdrant_ok
+    return JSONResponse(
+        {
+            "status": "ready" if ready else "not_ready",
+            "warmup": warmup.to_dict(),
+            "qdrant": "connected" if qdrant_ok else "disconnected"
+        },
+        status_code=200 if ready else 503
+    )
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
@@ -184,5 +329,11 @@ async def health_check():
     return {
         "status": "healthy",
         "qdrant": qdrant_status,
-        "llm_loaded": llm_model is not None
+        "llm_loaded": llm_model is not None,
+        "llm_backend": LLM_BACKEND,
+        "warmup": warmup.to_dict(),
+        "generation": generation_scheduler.stats() if generation_scheduler else None,
+        "context_packer": context_packer.stats() if context_packer else None,
+        "answer_cache": answer_cache.stats() if answer_cache else None,
+        "admission": ask_admission.stats()
     } 
\ No newline at end of file
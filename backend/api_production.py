@@ -1,18 +1,36 @@
 # api_production.py - Production API with real USCIS content and RAG
-from fastapi import FastAPI
-from fastapi.responses import StreamingResponse
+from fastapi import FastAPI, Header, HTTPException, Query
+from fastapi.responses import Response, JSONResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-import time
 import json
 import os
-from typing import Optional, List
-from sentence_transformers import SentenceTransformer
+import hmac
+import asyncio
+from typing import Annotated, Optional, List, Dict, Tuple
 from qdrant_client import QdrantClient
 from qdrant_client.http.models import Distance, VectorParams
-from scraper import load_scraped_content, scrape_immigration_content, save_scraped_content
-from embeddings import index_documents, search_similar, get_qdrant_client, ensure_collection
-from db import init_db, log_conversation, create_lead
+from embeddings import get_index_version, add_index_listener
+from ingestion import start_ingestion_job, get_job, list_jobs, get_active_job
+from retrieval import (
+    hybrid_search_async, is_relevant, embed_query, watch_index_version, qdrant_reachable, close_async_qdrant_client
+)
+from semantic_cache import SemanticCache, SEMANTIC_CACHE_ENABLED
+from retrieval_cache import RetrievalCache
+from annotation import tagged_sentences
+from knowledge_base import get_manifest, get_manifest_async, reload_manifest, CollectionStats
+from admission import (
+    AdmissionController, ASK_MAX_CONCURRENT, ASK_MAX_QUEUE, ASK_QUEUE_TIMEOUT,
+    GUIDANCE_MAX_CONCURRENT, GUIDANCE_MAX_QUEUE, GUIDANCE_QUEUE_TIMEOUT
+)
+from streaming import sse_response, split_words, paced_words
+from warmup import Warmup, warm_embedding_model, warm_lexical_index
+from metrics import render_metrics, PROMETHEUS_CONTENT_TYPE
+from instrumentation import ServerTimingMiddleware, stage
+from profiling import (
+    SlowRequestMiddleware, profile, recent_slow_requests, PROFILE_INTERVAL_MS, PROFILE_MAX_SECONDS, SLOW_REQUEST_SECONDS
+)
+from db import init_db, log_conversation, create_lead, get_top_countries
 
 app = FastAPI(title="AI Immigration Consultant API - Production")
 
@@ -23,13 +41,45 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(SlowRequestMiddleware)  # runs inside ServerTimingMiddleware to see the stages
+app.add_middleware(ServerTimingMiddleware)
 
 # Initialize database
 init_db()
 
-# Initialize components
-embed_model = SentenceTransformer("sentence-transformers/all-MiniLM-L6-v2")
+# Initialize components (the embedding model is shared with retrieval, in embeddings.py)
 COLLECTION_NAME = "immigration_docs"
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+# Countries whose guidance context is loaded at startup (the most common ones in the logs are added)
+PROFILE_CACHE_COUNTRIES = os.getenv(
+    "PROFILE_CACHE_COUNTRIES",
+    "India,China,Mexico,Philippines,Vietnam,Nigeria,Brazil,Canada,United Kingdom,Germany,France,"
+    "Australia,Japan,South Korea,Other"
+)
+PROFILE_CACHE_TOP_COUNTRIES = int(os.getenv("PROFILE_CACHE_TOP_COUNTRIES", "20"))
+
+# Concurrency limits and bounded wait queues for the expensive endpoints
+ask_admission = AdmissionController("/ask", ASK_MAX_CONCURRENT, ASK_MAX_QUEUE, ASK_QUEUE_TIMEOUT)
+guidance_admission = AdmissionController(
+    "/get-guidance", GUIDANCE_MAX_CONCURRENT, GUIDANCE_MAX_QUEUE, GUIDANCE_QUEUE_TIMEOUT
+)
+
+# Answers to paraphrased questions are replayed from the semantic cache
+answer_cache = SemanticCache("ask") if SEMANTIC_CACHE_ENABLED else None
+if answer_cache is not None:
+    add_index_listener(answer_cache.on_index_version)
+
+# Encode once and load the BM25 index and manifest in the background; /health/ready waits for it
+warmup = Warmup()
+warmup.add_stage("embedding_model", warm_embedding_model)
+warmup.add_stage("lexical_index", warm_lexical_index)
+warmup.add_stage("kb_manifest", get_manifest)
+
+# /knowledge-base-status is polled by monitoring: serve it from the manifest
+# and briefly cached collection stats
+collection_stats = CollectionStats(COLLECTION_NAME)
+add_index_listener(reload_manifest)
+add_index_listener(collection_stats.invalidate)
 
 class UserProfileRequest(BaseModel):
     current_country: str
@@ -51,90 +101,93 @@ class LeadRequest(BaseModel):
     timeline: Optional[str] = None
     additional_info: Optional[str] = None
 
-async def ensure_knowledge_base():
-    """Ensure we have scraped content and vector database ready"""
-    
-    # Check if we have scraped content
-    content = load_scraped_content()
-    
-    if not content:
-        print("No scraped content found. Scraping USCIS/State Department...")
-        content = scrape_immigration_content()
-        save_scraped_content(content)
-    
-    # Ensure Qdrant collection exists and has content
-    try:
-        qdrant = get_qdrant_client()
-        collection_info = qdrant.get_collection(COLLECTION_NAME)
-        if collection_info.points_count == 0:
-            print("Vector database is empty. Indexing content...")
-            index_documents(content)
-        else:
-            print(f"Vector database ready with {collection_info.points_count} documents")
-    except:
-        print("Creating vector database and indexing content...")
-        ensure_collection(COLLECTION_NAME)
-        index_documents(content)
+class IngestionJobRequest(BaseModel):
+    kind: str = "full"  # "full" (scrape/re-index) or "restore" (latest snapshot)
+    rescrape: bool = False
 
-def get_context_for_profile(profile: UserProfileRequest) -> str:
-    """Get relevant context based on user profile"""
+def require_admin(token: Optional[str]):
+    """Reject admin calls unless ADMIN_TOKEN is configured and matches"""
+    if not ADMIN_TOKEN or not token or not hmac.compare_digest(token, ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Admin token required")
+
+def ensure_knowledge_base():
+    """Make sure a knowledge base is (or will be) available without blocking.
+
+    Starts a background job that keeps the current index if it has points,
+    otherwise restores the latest snapshot, otherwise scrapes and indexes.
+    """
+    return start_ingestion_job("bootstrap", collection_name=COLLECTION_NAME)
+
+# Search terms per goal; get_context_for_profile adds the country
+PROFILE_SEARCH_TERMS = {
+    "work": ["H-1B", "work visa", "employment", "job offer"],
+    "study": ["F-1", "student visa", "school", "university"],
+    "family": ["family immigration", "I-130", "spouse", "relative"],
+    "permanent_residence": ["green card", "permanent resident", "I-485"],
+    "citizenship": ["naturalization", "citizenship", "N-400"],
+    "visit": ["tourist visa", "B-1", "B-2", "visitor"],
+}
+
+def profile_context_key(profile: UserProfileRequest) -> Tuple[str, str]:
+    """The only profile fields the context search depends on, normalized"""
+    goal = profile.goal if profile.goal in PROFILE_SEARCH_TERMS else ""
+    country = " ".join(profile.current_country.split()).lower()
+    return goal, country
+
+async def load_profile_context(key: Tuple[str, str]) -> List[Dict]:
+    """Search for the chunks relevant to a (goal, country) pair"""
+    goal, country = key
     
     # Build a search query based on profile
-    search_terms = []
-    
-    if profile.goal == "work":
-        search_terms.extend(["H-1B", "work visa", "employment", "job offer"])
-    elif profile.goal == "study":
-        search_terms.extend(["F-1", "student visa", "school", "university"])
-    elif profile.goal == "family":
-        search_terms.extend(["family immigration", "I-130", "spouse", "relative"])
-    elif profile.goal == "permanent_residence":
-        search_terms.extend(["green card", "permanent resident", "I-485"])
-    elif profile.goal == "citizenship":
-        search_terms.extend(["naturalization", "citizenship", "N-400"])
-    elif profile.goal == "visit":
-        search_terms.extend(["tourist visa", "B-1", "B-2", "visitor"])
+    search_terms = list(PROFILE_SEARCH_TERMS.get(goal, []))
     
     # Add country-specific terms
-    search_terms.append(profile.current_country)
+    search_terms.append(country)
     
     # Search for relevant content
     search_query = " ".join(search_terms)
-    results = search_similar(search_query, limit=5)
+    results = await hybrid_search_async(search_query, collection_name=COLLECTION_NAME, limit=5)
     
-    # Combine the most relevant content
-    context_texts = []
+    # Keep the most relevant content, with its sentence annotations
+    context_chunks = []
     for result in results:
-        if result.get("score", 0) > 0.6:  # Only high-relevance content
-            context_texts.append(result["text"])
+        if is_relevant(result, 0.6):  # Only high-relevance content
+            context_chunks.append(result)
     
-    return "\n".join(context_texts[:3])  # Top 3 most relevant
+    return context_chunks[:3]  # Top 3 most relevant
+
+# Few distinct (goal, country) pairs exist, so their context is cached and
+# reloaded in the background whenever the index changes
+profile_context_cache = RetrievalCache("profile_context", load_profile_context)
+add_index_listener(profile_context_cache.on_index_version)
+
+def profile_cache_warm_keys() -> List[Tuple[str, str]]:
+    """Every goal for the configured countries plus the most common ones in our traffic"""
+    countries = [country.strip().lower() for country in PROFILE_CACHE_COUNTRIES.split(",") if country.strip()]
+    for country in get_top_countries(PROFILE_CACHE_TOP_COUNTRIES):
+        if country not in countries:
+            countries.append(country)
+    return [(goal, country) for country in countries for goal in PROFILE_SEARCH_TERMS]
 
-def generate_guidance_with_context(profile: UserProfileRequest, context: str) -> dict:
+async def get_context_for_profile(profile: UserProfileRequest) -> List[Dict]:
+    """Get relevant context based on user profile"""
+    return await profile_context_cache.get(profile_context_key(profile))
+
+def generate_guidance_with_context(profile: UserProfileRequest, context: List[Dict]) -> dict:
     """Generate guidance using real USCIS content as context"""
     
-    # Extract key information from context for structured response
+    # Sentences were tagged at ingestion (see annotation.py), so this only merges them
     processing_times = []
     requirements = []
+    fees = []
+    forms = []
     next_steps = []
     
-    # Parse context for structured information
-    context_lower = context.lower()
-    
-    # Look for processing times
-    if "months" in context_lower or "years" in context_lower:
-        # Extract time-related sentences
-        sentences = context.split('.')
-        for sentence in sentences:
-            if any(word in sentence.lower() for word in ["month", "year", "week", "processing"]):
-                processing_times.append(sentence.strip())
-    
-    # Look for requirements
-    requirement_keywords = ["must", "required", "need", "eligible", "qualify"]
-    sentences = context.split('.')
-    for sentence in sentences:
-        if any(word in sentence.lower() for word in requirement_keywords):
-            requirements.append(sentence.strip())
+    for chunk in context:
+        processing_times.extend(tagged_sentences(chunk, "processing_time"))
+        requirements.extend(tagged_sentences(chunk, "requirement"))
+        fees.extend(tagged_sentences(chunk, "fee"))
+        forms.extend(form for form in chunk["forms"] if form not in forms)
     
     # Generate next steps based on goal and context
     if profile.goal == "work":
@@ -169,24 +222,40 @@ def generate_guidance_with_context(profile: UserProfileRequest, context: str) ->
         "next_steps": next_steps[:5],  # Top 5 steps
         "requirements": requirements[:3],  # Top 3 requirements
         "processing_info": processing_times[:2],  # Top 2 time references
+        "fee_info": fees[:2],  # Top 2 fee references
+        "forms": forms[:5],
         "source": "Official USCIS/State Department Information"
     }
 
 @app.on_event("startup")
 async def startup_event():
-    """Initialize knowledge base on startup"""
-    await ensure_knowledge_base()
+    """Initialize knowledge base on startup (in the background, so /health answers immediately)"""
+    # Under serve.py only the first worker bootstraps; the others serve the index it builds
+    if os.getenv("SERVE_WORKER_INDEX", "0") == "0":
+        ensure_knowledge_base()
+    warmup.start()
+    # Load the manifest off the event loop even when warm-up is disabled: without
+    # one (an index older than manifests) it is derived by hashing the corpus
+    asyncio.create_task(get_manifest_async())
+    # Notice index swaps made by other instances, which invalidate cached answers
+    asyncio.create_task(watch_index_version(COLLECTION_NAME))
+    keys = await asyncio.to_thread(profile_cache_warm_keys)
+    asyncio.create_task(profile_context_cache.warm(keys))
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await close_async_qdrant_client()
 
 @app.get("/")
 async def root():
     return {"message": "AI Immigration Consultant API - Production with Real USCIS Data", "status": "ready"}
 
-@app.post("/get-guidance")
-async def get_guidance(profile: UserProfileRequest):
+async def guidance_for_profile(profile: UserProfileRequest) -> dict:
     """Get personalized immigration guidance using real USCIS content"""
     
     # Get relevant context from scraped USCIS content
-    context = get_context_for_profile(profile)
+    with stage("profile_context"):
+        context = await get_context_for_profile(profile)
     
     if not context:
         return {
@@ -195,7 +264,8 @@ async def get_guidance(profile: UserProfileRequest):
         }
     
     # Generate structured guidance
-    guidance = generate_guidance_with_context(profile, context)
+    with stage("build_guidance"):
+        guidance = generate_guidance_with_context(profile, context)
     
     # Log the consultation
     try:
@@ -206,22 +276,61 @@ async def get_guidance(profile: UserProfileRequest):
     
     return guidance
 
+@app.get("/get-guidance")
+@guidance_admission.limit
+async def get_guidance_query(profile: Annotated[UserProfileRequest, Query()]):
+    """Same as POST /get-guidance with the profile in the query string (what the frontend sends)"""
+    return await guidance_for_profile(profile)
+
+@app.post("/get-guidance")
+@guidance_admission.limit
+async def get_guidance(profile: UserProfileRequest):
+    """Get personalized immigration guidance using real USCIS content"""
+    return await guidance_for_profile(profile)
+
+DATABASE_ERROR_MESSAGE = "I apologize, but I'm having trouble accessing the immigration database right now. Please try again or contact us directly."
+
+async def stream_database_error():
+    """The SSE answer sent when the question cannot be embedded or searched"""
+    yield DATABASE_ERROR_MESSAGE
+
 @app.post("/ask")
+@ask_admission.limit
 async def ask_question(req: QuestionRequest):
     """Answer questions using RAG with real USCIS content"""
     
-    def stream_uscis_response():
+    # A close enough earlier question replays its answer without retrieval or pacing
+    try:
+        question_vector = await embed_query(req.question)
+        with stage("answer_cache_lookup"):
+            cached_answer = answer_cache.lookup(question_vector) if answer_cache is not None else None
+    except Exception as e:
+        print(f"Error embedding question: {e}")
+        return sse_response(stream_database_error())
+    if cached_answer is not None:
+        async def stream_cached_answer():
+            for word in split_words(cached_answer):
+                yield word
+            try:
+                await asyncio.to_thread(log_conversation, req.question, cached_answer)
+            except Exception as e:
+                print(f"Error logging: {e}")
+        
+        return sse_response(stream_cached_answer())
+    
+    # Search for relevant USCIS content before streaming, off the event loop
+    results = await hybrid_search_async(req.question, collection_name=COLLECTION_NAME, limit=3,
+                                        query_vector=question_vector)
+    
+    async def stream_uscis_response():
         try:
-            # Search for relevant USCIS content
-            results = search_similar(req.question, limit=3)
-            
+            relevant_content = []
             if not results:
                 response = "I don't have specific information about that topic in my knowledge base of official USCIS sources. Please contact an immigration attorney for guidance on this specific question."
             else:
                 # Combine the most relevant content
-                relevant_content = []
                 for result in results:
-                    if result.get("score", 0) > 0.5:  # Reasonable relevance threshold
+                    if is_relevant(result, 0.5):  # Reasonable relevance threshold
                         relevant_content.append(result["text"])
                 
                 if relevant_content:
@@ -232,23 +341,24 @@ async def ask_question(req: QuestionRequest):
                 else:
                     response = "I found some related information but it may not directly answer your question. For specific guidance, please contact an immigration attorney."
             
-            # Stream the response
-            words = response.split()
-            for word in words:
-                yield f"data: {word} \n\n"
-                time.sleep(0.02)
+            # Only real answers are cached; a fallback would be replayed to every paraphrase
+            if answer_cache is not None and relevant_content:
+                answer_cache.store(req.question, question_vector, response)
+            
+            # Stream the response (paced without holding a thread)
+            async for word in paced_words(response):
+                yield word
             
             # Log the Q&A
             try:
-                log_conversation(req.question, response)
+                await asyncio.to_thread(log_conversation, req.question, response)
             except Exception as e:
                 print(f"Error logging: {e}")
                 
         except Exception as e:
-            error_msg = f"I apologize, but I'm having trouble accessing the immigration database right now. Please try again or contact us directly."
-            yield f"data: {error_msg}\n\n"
+            yield DATABASE_ERROR_MESSAGE
     
-    return StreamingResponse(stream_uscis_response(), media_type="text/event-stream")
+    return sse_response(stream_uscis_response())
 
 @app.post("/lead")
 async def submit_lead(req: LeadRequest):
@@ -265,29 +375,92 @@ async def submit_lead(req: LeadRequest):
     except Exception as e:
         return {"status": "error", "message": str(e)}
 
+@app.post("/ingestion-jobs", status_code=202)
+async def create_ingestion_job(req: IngestionJobRequest, x_admin_token: Optional[str] = Header(None)):
+    """Start a background ingestion run; the current index keeps serving until it is swapped"""
+    require_admin(x_admin_token)
+    if req.kind not in ("full", "restore"):
+        raise HTTPException(status_code=400, detail="kind must be 'full' or 'restore'")
+    job = start_ingestion_job(req.kind, rescrape=req.rescrape, collection_name=COLLECTION_NAME)
+    return job.to_dict()
+
+@app.get("/ingestion-jobs")
+async def get_ingestion_jobs():
+    """Recent ingestion jobs with progress and ETA, newest first"""
+    return {"jobs": [job.to_dict() for job in list_jobs()]}
+
+@app.get("/ingestion-jobs/{job_id}")
+async def get_ingestion_job(job_id: str):
+    job = get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
+
 @app.get("/knowledge-base-status")
 async def knowledge_base_status():
-    """Check the status of our knowledge base"""
+    """Check the status of our knowledge base (from memory; collection stats are cached briefly)"""
+    manifest = await get_manifest_async()
+    scraped_count = manifest["chunk_count"] if manifest else 0
+    stats = await collection_stats.get()
+    vector_count = stats["points"]
+    
+    return {
+        "scraped_documents": scraped_count,
+        "indexed_documents": vector_count,
+        "status": "ready" if scraped_count > 0 and vector_count > 0 else "needs_initialization",
+        "index_version": manifest["index_version"] if manifest else get_index_version(),
+        "corpus_sha256": manifest["corpus_sha256"] if manifest else None,
+        "ingested_at": manifest["ingested_at"] if manifest else None,
+        "sources": manifest["sources"] if manifest else {},
+        "collection_status": stats["status"],
+        "stats_age_seconds": collection_stats.age(),
+    }
+
+@app.get("/admin/profile", response_class=PlainTextResponse)
+async def admin_profile(seconds: float = 10, interval_ms: float = PROFILE_INTERVAL_MS, idle: bool = False,
+                        x_admin_token: Optional[str] = Header(None)):
+    """Sample every thread for `seconds`; returns folded stacks for flamegraph.pl or speedscope"""
+    require_admin(x_admin_token)
+    if not 0 < seconds <= PROFILE_MAX_SECONDS or not 1 <= interval_ms <= 1000:
+        raise HTTPException(status_code=400,
+                            detail=f"seconds must be in (0, {PROFILE_MAX_SECONDS}] and interval_ms in [1, 1000]")
     try:
-        # Check scraped content
-        content = load_scraped_content()
-        scraped_count = len(content) if content else 0
-        
-        # Check vector database
-        qdrant = get_qdrant_client()
-        try:
-            collection_info = qdrant.get_collection(COLLECTION_NAME)
-            vector_count = collection_info.points_count
-        except:
-            vector_count = 0
-        
-        return {
-            "scraped_documents": scraped_count,
-            "indexed_documents": vector_count,
-            "status": "ready" if scraped_count > 0 and vector_count > 0 else "needs_initialization"
-        }
-    except Exception as e:
-        return {"status": "error", "message": str(e)}
+        folded = await asyncio.to_thread(profile, seconds, interval_ms, idle)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return PlainTextResponse(folded)
+
+@app.get("/admin/slow-requests")
+async def admin_slow_requests(x_admin_token: Optional[str] = Header(None)):
+    """Stage timings and stack samples of recent slow /ask and /get-guidance calls, newest first"""
+    require_admin(x_admin_token)
+    return {"threshold_seconds": SLOW_REQUEST_SECONDS, "requests": recent_slow_requests()}
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics"""
+    return Response(render_metrics(), media_type=PROMETHEUS_CONTENT_TYPE)
+
+@app.get("/health/live")
+async def liveness():
+    """Liveness probe: 200 while the process is serving, 503 once warm-up has failed for good"""
+    if warmup.failed:
+        return JSONResponse({"status": "warmup_failed", "warmup": warmup.to_dict()}, status_code=503)
+    return {"status": "alive"}
+
+@app.get("/health/ready")
+async def readiness():
+    """Readiness probe: 200 once warmed up and the collection is reachable, 503 before"""
+    qdrant_ok = await qdrant_reachable(COLLECTION_NAME)
+    ready = warmup.ready and qdrant_ok
+    return JSONResponse(
+        {
+            "status": "ready" if ready else "not_ready",
+            "warmup": warmup.to_dict(),
+            "qdrant": "connected" if qdrant_ok else "disconnected"
+        },
+        status_code=200 if ready else 503
+    )
 
 @app.get("/health")
 async def health_check():
@@ -295,5 +468,11 @@ async def health_check():
         "status": "healthy",
         "mode": "production_with_real_uscis_data",
         "database": "connected",
-        "data_source": "Official USCIS/State Department"
+        "data_source": "Official USCIS/State Department",
+        "index_version": get_index_version(),
+        "warmup": warmup.to_dict(),
+        "ingestion": get_active_job().status if get_active_job() else None,
+        "answer_cache": answer_cache.stats() if answer_cache else None,
+        "profile_context_cache": profile_context_cache.stats(),
+        "admission": {"ask": ask_admission.stats(), "get_guidance": guidance_admission.stats()}
     } 
\ No newline at end of file
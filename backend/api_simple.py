@@ -1,12 +1,18 @@
 # api_simple.py - Structured Immigration Consultant API
-from fastapi import FastAPI
-from fastapi.responses import StreamingResponse
+from fastapi import FastAPI, Request, Query, BackgroundTasks
+from fastapi.responses import Response
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-import time
+import asyncio
 import json
-from typing import Optional, List
+from itertools import product
+from typing import Annotated, Optional, List, Tuple
 from db import init_db, log_conversation, create_lead
+from streaming import sse_response, paced_words
+from intents import load_intent_router
+from http_cache import PrecomputedResponse
+from metrics import render_metrics, PROMETHEUS_CONTENT_TYPE
+from instrumentation import ServerTimingMiddleware
 
 app = FastAPI(title="AI Immigration Consultant API - Guided Mode")
 
@@ -23,6 +29,7 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(ServerTimingMiddleware)
 
 # Initialize database
 init_db()
@@ -210,65 +217,126 @@ def get_tailored_guidance(profile: UserProfileRequest) -> dict:
         "estimated_timeline": VISA_TYPES[recommended_visa]["processing_time"] if recommended_visa else "Varies"
     }
 
+# The profile fields get_tailored_guidance actually branches on, and the
+# values that make a difference; anything else behaves like OTHER
+GUIDANCE_GOALS = ["work", "study", "family", "permanent_residence", "citizenship", "visit"]
+GUIDANCE_STATUSES = {"permanent_residence": ["worker", "student"], "citizenship": ["resident"]}
+FAMILY_RELATIONS = ["spouse", "parent", "child", "sibling"]
+OTHER = "other"
+
+GuidanceKey = Tuple[str, str, bool, Optional[str], str]
+
+def guidance_key(profile: UserProfileRequest) -> GuidanceKey:
+    """Normalize a profile to (goal, status, has_job_offer, family_in_us, country); profiles
+    with the same key get the same guidance"""
+    goal = profile.goal.lower()
+    if goal not in GUIDANCE_GOALS:
+        goal = OTHER
+    status = profile.current_status.lower()
+    statuses = GUIDANCE_STATUSES.get(goal)
+    status = (status if status in statuses else OTHER) if statuses else ""
+    has_job_offer = bool(profile.has_job_offer) if goal == "work" else False
+    # The relation is quoted verbatim in the next steps, so it is kept as given
+    family = profile.family_in_us if goal == "family" and profile.family_in_us not in (None, "", "none") else None
+    country = profile.current_country.lower()
+    if country not in COUNTRIES_SPECIAL_PROGRAMS:
+        country = ""
+    return goal, status, has_job_offer, family, country
+
+def build_guidance_table() -> dict:
+    """Pre-serialized guidance for every distinct profile, keyed by guidance_key"""
+    table = {}
+    countries = list(COUNTRIES_SPECIAL_PROGRAMS) + [""]
+    for goal in GUIDANCE_GOALS + [OTHER]:
+        statuses = GUIDANCE_STATUSES[goal] + [OTHER] if goal in GUIDANCE_STATUSES else [""]
+        job_offers = [True, False] if goal == "work" else [False]
+        families = [None] + FAMILY_RELATIONS if goal == "family" else [None]
+        for status, has_job_offer, family, country in product(statuses, job_offers, families, countries):
+            profile = UserProfileRequest(
+                current_country=country or OTHER,
+                current_status=status or OTHER,
+                goal=goal,
+                has_job_offer=has_job_offer,
+                family_in_us=family,
+            )
+            guidance = get_tailored_guidance(profile)
+            table[guidance_key(profile)] = (guidance, PrecomputedResponse(guidance))
+    return table
+
+guidance_table = build_guidance_table()
+visa_types_response = PrecomputedResponse({"visa_types": VISA_TYPES})
+print(f"Precomputed guidance for {len(guidance_table)} profiles")
+
 @app.get("/")
 async def root():
     return {"message": "AI Immigration Consultant API - Guided Mode", "status": "ready"}
 
 @app.get("/visa-types")
-async def get_visa_types():
+async def get_visa_types(request: Request):
     """Get all available visa types"""
-    return {"visa_types": VISA_TYPES}
+    return visa_types_response.respond(request)
 
-@app.post("/get-guidance")
-async def get_guidance(profile: UserProfileRequest):
-    """Get personalized immigration guidance based on user profile"""
-    guidance = get_tailored_guidance(profile)
-    
-    # Log the consultation
+def log_guidance(profile: UserProfileRequest, guidance: dict):
     try:
         profile_summary = f"Country: {profile.current_country}, Status: {profile.current_status}, Goal: {profile.goal}"
         response_summary = f"Recommended: {guidance['recommended_visa']}, Timeline: {guidance['estimated_timeline']}"
         log_conversation(profile_summary, response_summary)
     except Exception as e:
         print(f"Error logging: {e}")
-    
-    return guidance
+
+def guidance_response(profile: UserProfileRequest, request: Request, background_tasks: BackgroundTasks):
+    entry = guidance_table.get(guidance_key(profile))
+    if entry is None:
+        # Only a free-form family relation can miss; answer it without caching
+        guidance = get_tailored_guidance(profile)
+        entry = (guidance, PrecomputedResponse(guidance, compress=False))
+    guidance, response = entry
+
+    # Log the consultation after the response is sent
+    background_tasks.add_task(log_guidance, profile, guidance)
+    return response.respond(request)
+
+@app.get("/get-guidance")
+async def get_guidance_cached(profile: Annotated[UserProfileRequest, Query()], request: Request,
+                              background_tasks: BackgroundTasks):
+    """Same as POST /get-guidance with the profile in the query string, so browsers and CDNs can cache it"""
+    return guidance_response(profile, request, background_tasks)
+
+@app.post("/get-guidance")
+async def get_guidance(profile: UserProfileRequest, request: Request, background_tasks: BackgroundTasks):
+    """Get personalized immigration guidance based on user profile"""
+    return guidance_response(profile, request, background_tasks)
+
+# Canned answers for /ask, keyed by the intents in intent_rules.json
+ASK_RESPONSES = {
+    "cost": "💰 Immigration costs vary by case type:\n• Tourist visa: $160\n• Work visa (H-1B): $2,000-$5,000+\n• Green card: $3,000-$8,000+\n• Citizenship: $725\n\nNote: These are government fees only. Attorney fees are additional.",
+    "timeline": "⏱️ Processing times vary significantly:\n• Tourist visa: 2 weeks-2 months\n• Work visa: 3-8 months\n• Family immigration: 8 months-several years\n• Green card: 1-3 years\n• Citizenship: 10-13 months\n\nTimes depend on your country, case complexity, and current backlogs.",
+    "interview": "🏢 Visa interviews are typically required for first-time applicants.\n• Schedule through your country's US embassy/consulate\n• Bring all required documents\n• Be prepared to explain your case\n• Dress professionally and arrive early\n• Answer questions honestly and directly",
+    "documents": "📋 Required documents vary by visa type but commonly include:\n• Valid passport\n• Application forms\n• Photos\n• Financial documents\n• Supporting evidence (job offer, school acceptance, etc.)\n• Medical exam (for some visas)\n• Police certificates\n\nSpecific requirements depend on your case type.",
+}
+ASK_FALLBACK_RESPONSE = "I can help with specific questions about:\n• Processing times and costs\n• Required documents\n• Interview preparation\n• Next steps for your case\n\nPlease ask a more specific question, or use the guided consultation for personalized advice."
+
+intent_router = load_intent_router(only=ASK_RESPONSES)
 
 @app.post("/ask")
 async def ask_question(req: QuestionRequest):
     """Handle follow-up questions with context"""
-    question = req.question.lower()
-    
     # Determine response based on question content
-    if any(word in question for word in ["cost", "fee", "price", "expensive"]):
-        response = "💰 Immigration costs vary by case type:\n• Tourist visa: $160\n• Work visa (H-1B): $2,000-$5,000+\n• Green card: $3,000-$8,000+\n• Citizenship: $725\n\nNote: These are government fees only. Attorney fees are additional."
+    intent = intent_router.match(req.question)
+    response = ASK_RESPONSES.get(intent, ASK_FALLBACK_RESPONSE)
     
-    elif any(word in question for word in ["time", "long", "wait", "processing"]):
-        response = "⏱️ Processing times vary significantly:\n• Tourist visa: 2 weeks-2 months\n• Work visa: 3-8 months\n• Family immigration: 8 months-several years\n• Green card: 1-3 years\n• Citizenship: 10-13 months\n\nTimes depend on your country, case complexity, and current backlogs."
-    
-    elif any(word in question for word in ["interview", "appointment", "embassy"]):
-        response = "🏢 Visa interviews are typically required for first-time applicants.\n• Schedule through your country's US embassy/consulate\n• Bring all required documents\n• Be prepared to explain your case\n• Dress professionally and arrive early\n• Answer questions honestly and directly"
-    
-    elif any(word in question for word in ["document", "paperwork", "required"]):
-        response = "📋 Required documents vary by visa type but commonly include:\n• Valid passport\n• Application forms\n• Photos\n• Financial documents\n• Supporting evidence (job offer, school acceptance, etc.)\n• Medical exam (for some visas)\n• Police certificates\n\nSpecific requirements depend on your case type."
-    
-    else:
-        response = "I can help with specific questions about:\n• Processing times and costs\n• Required documents\n• Interview preparation\n• Next steps for your case\n\nPlease ask a more specific question, or use the guided consultation for personalized advice."
-    
-    # Stream the response
-    def stream_response():
-        words = response.split()
-        for word in words:
-            yield f"data: {word} \n\n"
-            time.sleep(0.03)
+    # Stream the response (paced without holding a thread)
+    async def stream_response():
+        async for word in paced_words(response):
+            yield word
         
         # Log the Q&A
         try:
-            log_conversation(req.question, response)
+            await asyncio.to_thread(log_conversation, req.question, response)
         except Exception as e:
             print(f"Error logging: {e}")
     
-    return StreamingResponse(stream_response(), media_type="text/event-stream")
+    return sse_response(stream_response())
 
 @app.post("/lead")
 async def submit_lead(req: LeadRequest):
@@ -286,11 +354,17 @@ async def submit_lead(req: LeadRequest):
     except Exception as e:
         return {"status": "error", "message": str(e)}
 
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics"""
+    return Response(render_metrics(), media_type=PROMETHEUS_CONTENT_TYPE)
+
 @app.get("/health")
 async def health_check():
     return {
         "status": "healthy",
         "mode": "guided_consultation",
         "database": "connected",
-        "visa_types": len(VISA_TYPES)
+        "visa_types": len(VISA_TYPES),
+        "guidance_profiles": len(guidance_table)
     } 
\ No newline at end of file
@@ -1,10 +1,14 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Query
+from fastapi.responses import Response
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-from typing import Dict, List, Optional
+from typing import Annotated, Dict, List, Optional
 import uvicorn
 import logging
 from db import init_db, log_conversation, save_lead
+from intents import load_intent_router
+from metrics import render_metrics, PROMETHEUS_CONTENT_TYPE
+from instrumentation import ServerTimingMiddleware
 
 # Initialize FastAPI app
 app = FastAPI(title="AI Immigration Consultant API", version="1.0.0")
@@ -17,6 +21,7 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(ServerTimingMiddleware)
 
 # Initialize database
 init_db()
@@ -89,6 +94,11 @@ async def root():
 async def health_check():
     return {"status": "healthy", "service": "AI Immigration API"}
 
+@app.get("/get-guidance")
+async def get_guidance_query(profile: Annotated[UserProfile, Query()]):
+    """Same as POST /get-guidance with the profile in the query string (what the frontend sends)"""
+    return await get_guidance(profile)
+
 @app.post("/get-guidance")
 async def get_guidance(profile: UserProfile):
     """Get personalized immigration guidance based on user profile"""
@@ -151,53 +161,39 @@ async def get_guidance(profile: UserProfile):
         logging.error(f"Error in get_guidance: {str(e)}")
         raise HTTPException(status_code=500, detail="Internal server error")
 
-@app.post("/ask")
-async def ask_question(request: QuestionRequest):
-    """Handle specific immigration questions"""
-    try:
-        question = request.question.lower()
-        
-        # Simple keyword-based responses
-        response = "Thank you for your question. Based on current immigration regulations, here's what I can tell you:\n\n"
-        
-        if "h1b" in question or "h-1b" in question:
-            response += """The H-1B visa is for specialty occupations requiring a bachelor's degree. Key points:
+# Answers for /ask, keyed by the intents in intent_rules.json
+ASK_PREAMBLE = "Thank you for your question. Based on current immigration regulations, here's what I can tell you:\n\n"
+ASK_RESPONSES = {
+    "h1b": """The H-1B visa is for specialty occupations requiring a bachelor's degree. Key points:
             
 • Annual filing period: March 1-31 (for October start)
 • 85,000 total visas available annually
 • Requires employer sponsorship
 • 3-year initial period, extendable to 6 years
-• Premium processing available for faster decisions"""
-            
-        elif "green card" in question or "permanent resident" in question:
-            response += """Green cards provide permanent residence in the US. Main categories:
+• Premium processing available for faster decisions""",
+    "green_card": """Green cards provide permanent residence in the US. Main categories:
             
 • Employment-based (EB-1, EB-2, EB-3)
 • Family-based (immediate relatives, family preference)
 • Diversity visa lottery
 • Special categories (refugees, asylum, etc.)
-• Processing times vary widely by category and country"""
-            
-        elif "timeline" in question or "how long" in question:
-            response += """Immigration timelines vary significantly by visa type:
+• Processing times vary widely by category and country""",
+    "timeline": """Immigration timelines vary significantly by visa type:
             
 • H-1B: 6-8 months (with employer petition)
 • L-1: 2-4 months
 • Employment-based green card: 1-3+ years
 • Family-based green card: 6 months to 10+ years
-• Processing times change frequently - check USCIS website for current estimates"""
-            
-        elif "cost" in question or "fee" in question:
-            response += """Immigration costs include government fees and legal fees:
+• Processing times change frequently - check USCIS website for current estimates""",
+    "cost": """Immigration costs include government fees and legal fees:
             
 • H-1B: $2,000-$5,000 in government fees
 • L-1: $1,500-$3,000 in government fees  
 • Green card: $1,500-$4,000+ in government fees
 • Legal fees: $2,000-$15,000+ depending on complexity
-• Additional costs may apply for premium processing"""
-            
-        else:
-            response += """I'd be happy to help with your specific situation. For the most accurate guidance, I recommend:
+• Additional costs may apply for premium processing""",
+}
+ASK_FALLBACK_RESPONSE = """I'd be happy to help with your specific situation. For the most accurate guidance, I recommend:
 
 • Consulting with a qualified immigration attorney
 • Checking the latest USCIS policy manual
@@ -205,6 +201,16 @@ async def ask_question(request: QuestionRequest):
 • Considering your specific circumstances and goals
 
 Would you like me to connect you with an immigration specialist for personalized advice?"""
+
+intent_router = load_intent_router(only=ASK_RESPONSES)
+
+@app.post("/ask")
+async def ask_question(request: QuestionRequest):
+    """Handle specific immigration questions"""
+    try:
+        # Keyword-based responses
+        intent = intent_router.match(request.question)
+        response = ASK_PREAMBLE + ASK_RESPONSES.get(intent, ASK_FALLBACK_RESPONSE)
         
         # Log the conversation
         log_conversation(
@@ -237,5 +243,10 @@ async def submit_lead(lead_data: LeadData):
         logging.error(f"Error in submit_lead: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to save lead information")
 
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics"""
+    return Response(render_metrics(), media_type=PROMETHEUS_CONTENT_TYPE)
+
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000) 
\ No newline at end of file
@@ -0,0 +1,474 @@
+# benchmark_api.py - Offline load test of the API modules: throughput, latency percentiles, stream TTFB
+#
+# Each API module runs in its own process, in a scratch directory (its SQLite
+# log, lexical index and manifest go there), with local stand-ins for the
+# external services:
+#
+#   Qdrant                 an in-memory qdrant-client (local mode) loaded with the corpus
+#   sentence-transformers  a hashing bag-of-words embedder with the same 384 dimensions
+#   LLM (api.py)           a randomly initialised 2-layer GPT-2 and a byte tokenizer
+#
+# Requests go straight through the app's ASGI interface, so the numbers are
+# the API code's own cost, and time to first byte is the first body chunk a
+# server would write. The corpus is scraped_content.json when present,
+# otherwise a fixed synthetic one. Results are saved as JSON; pass
+# --baseline with an earlier file to print the changes.
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import platform
+import re
+import subprocess
+import sys
+import tempfile
+import time
+import types
+from typing import Dict, List, Optional
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+API_MODULES = ["api", "api_production", "api_simple", "api_simple_no_qdrant"]
+QDRANT_MODULES = {"api", "api_production"}
+COLLECTION_NAME = "immigration_docs"
+VECTOR_SIZE = 384
+
+SAMPLE_QUESTIONS = [
+    "How do I apply for naturalization?",
+    "What are the requirements for an H-1B visa?",
+    "How long does it take to get a green card through marriage?",
+    "How much does it cost to file Form I-130?",
+    "What documents do I need for a student visa interview?",
+    "Can I travel abroad while my green card application is pending?",
+    "What is the processing time for Form N-400?",
+    "How do I bring my parents to the United States?",
+]
+
+PROFILES = [
+    {"current_country": country, "current_status": status, "goal": goal}
+    for country, status, goal in [
+        ("India", "student", "work"), ("Mexico", "none", "family"), ("China", "worker", "permanent_residence"),
+        ("Philippines", "resident", "citizenship"), ("Brazil", "none", "visit"), ("Nigeria", "none", "study"),
+        ("Canada", "worker", "work"), ("Vietnam", "none", "family"),
+    ]
+]
+
+# Synthetic corpus: every topic is written out once per template, so each
+# chunk mixes requirement, fee and processing-time sentences like real pages
+SYNTHETIC_TOPICS = [
+    ("H-1B specialty occupation", "I-129", 780), ("Family-based green card", "I-130", 675),
+    ("Adjustment of status", "I-485", 1440), ("Naturalization", "N-400", 760),
+    ("F-1 student visa", "I-20", 350), ("B-1/B-2 visitor visa", "DS-160", 185),
+    ("Employment authorization", "I-765", 520), ("Removal of conditions", "I-751", 750),
+    ("Fiance(e) visa", "I-129F", 675), ("Travel document", "I-131", 630),
+]
+SYNTHETIC_TEMPLATES = [
+    "{topic} applicants must file Form {form} with USCIS. The filing fee is ${fee}. "
+    "Processing usually takes {months} months, depending on the service center.",
+    "To qualify for {topic}, you need evidence of eligibility and a valid passport. "
+    "Submit Form {form} with supporting documents; incomplete forms are rejected.",
+    "Most {topic} cases are decided within {months} to {months2} months. "
+    "Biometrics fees of $85 may apply in addition to the ${fee} fee for Form {form}.",
+    "After filing Form {form}, {topic} applicants may be asked to attend an interview. "
+    "Bring the original documents and your appointment notice.",
+]
+
+# --- local stand-ins -------------------------------------------------------
+
+class HashingEmbedder:
+    """Stand-in for SentenceTransformer: hashed word counts, L2-normalised"""
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return VECTOR_SIZE
+
+    def _embed(self, text: str):
+        import numpy as np
+        vector = np.zeros(VECTOR_SIZE, dtype=np.float32)
+        for word in re.findall(r"[a-z0-9]+(?:-[a-z0-9]+)*", text.lower()):
+            bucket = int.from_bytes(hashlib.blake2b(word.encode("utf-8"), digest_size=4).digest(), "little")
+            vector[bucket % VECTOR_SIZE] += 1.0
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def encode(self, sentences, **kwargs):
+        import numpy as np
+        if isinstance(sentences, str):
+            return self._embed(sentences)
+        return np.stack([self._embed(text) for text in sentences]) if sentences else np.zeros((0, VECTOR_SIZE))
+
+class AsyncClientFacade:
+    """AsyncQdrantClient-shaped view of a sync client, so sync and async callers share one store"""
+
+    def __init__(self, client):
+        self._client = client
+
+    async def close(self):
+        pass
+
+    def __getattr__(self, name):
+        method = getattr(self._client, name)
+
+        async def call(*args, **kwargs):
+            return method(*args, **kwargs)
+        return call
+
+class ByteTokenizer:
+    """Stand-in LLM tokenizer: id 0 is end of sequence, ids 1-256 are bytes.
+    Decoding maps non-printable bytes to printable characters, so any sampled
+    sequence streams as text."""
+
+    eos_token_id = 0
+    pad_token_id = 0
+    eos_token = pad_token = ""
+    vocab_size = 257
+
+    def encode(self, text: str, add_special_tokens: bool = True, **kwargs) -> List[int]:
+        return [byte + 1 for byte in text.encode("utf-8")]
+
+    def decode(self, ids, skip_special_tokens: bool = True, **kwargs) -> str:
+        if hasattr(ids, "tolist"):
+            ids = ids.tolist()
+        chars = []
+        for token in ids:
+            if token <= 0 or token > 256:
+                continue
+            byte = token - 1
+            chars.append(chr(byte) if 32 <= byte < 127 or byte == 10 else chr(32 + byte % 95))
+        return "".join(chars)
+
+def load_stub_llm(model_name: str = None, backend: str = None, seed: int = 0, **kwargs):
+    """Stand-in for llm_backend.load_causal_lm: a tiny random GPT-2"""
+    import torch
+    from transformers import GPT2Config, GPT2LMHeadModel
+    torch.manual_seed(seed)
+    config = GPT2Config(n_layer=2, n_embd=64, n_head=4, n_positions=2048, vocab_size=ByteTokenizer.vocab_size,
+                        bos_token_id=0, eos_token_id=0)
+    model = GPT2LMHeadModel(config)
+    model.eval()
+    return model, ByteTokenizer()
+
+def synthetic_corpus() -> List[Dict]:
+    chunks = []
+    for topic_number, (topic, form, fee) in enumerate(SYNTHETIC_TOPICS):
+        for n, template in enumerate(SYNTHETIC_TEMPLATES):
+            months = 3 + (topic_number * 7 + n) % 18
+            chunks.append({
+                "text": template.format(topic=topic, form=form, fee=fee, months=months, months2=months + 6),
+                "source_url": f"https://www.uscis.gov/synthetic/{form.lower()}",
+                "chunk_id": f"synthetic_{topic_number}_{n}",
+                "source_type": "synthetic",
+            })
+    return chunks
+
+def install_stand_ins(module_name: str, chunks: List[Dict], real_embeddings: bool):
+    """Point the modules at the stand-ins before the API module is imported; returns the Qdrant stand-in"""
+    if not real_embeddings:
+        sys.modules["sentence_transformers"] = types.SimpleNamespace(SentenceTransformer=HashingEmbedder)
+    if module_name not in QDRANT_MODULES:
+        return None
+
+    from qdrant_client import QdrantClient
+    import embeddings
+    import retrieval
+    from knowledge_base import build_manifest, write_manifest
+
+    client = QdrantClient(":memory:")
+    # Modules that import get_qdrant_client later pick up the replacement
+    embeddings.get_qdrant_client = lambda url=None: client
+    retrieval._async_qdrant = AsyncClientFacade(client)
+    embeddings.index_documents(chunks, COLLECTION_NAME)
+    write_manifest(build_manifest(chunks, None))
+    return client
+
+# --- ASGI driver -----------------------------------------------------------
+
+async def asgi_request(app, method: str, path: str, body: Optional[Dict] = None, query: str = "") -> Dict:
+    """One request through the app's ASGI interface: status, time to first body byte, total time, bytes"""
+    payload = json.dumps(body).encode("utf-8") if body is not None else b""
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": method, "scheme": "http",
+        "path": path, "raw_path": path.encode(), "query_string": query.encode(), "root_path": "",
+        "headers": [(b"host", b"benchmark"), (b"content-type", b"application/json"),
+                    (b"content-length", str(len(payload)).encode())],
+        "client": ("127.0.0.1", 50000), "server": ("benchmark", 80),
+    }
+    request_sent = False
+    response_done = asyncio.Event()
+    result = {"status": None, "ttfb": None, "bytes": 0}
+
+    async def receive():
+        nonlocal request_sent
+        if not request_sent:
+            request_sent = True
+            return {"type": "http.request", "body": payload, "more_body": False}
+        await response_done.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            result["status"] = message["status"]
+        elif message["type"] == "http.response.body":
+            chunk = message.get("body", b"")
+            if chunk and result["ttfb"] is None:
+                result["ttfb"] = time.perf_counter() - start
+            result["bytes"] += len(chunk)
+            if not message.get("more_body", False):
+                response_done.set()
+
+    start = time.perf_counter()
+    await app(scope, receive, send)
+    result["total"] = time.perf_counter() - start
+    response_done.set()
+    return result
+
+class Lifespan:
+    """Runs the app's startup and shutdown handlers, as a server would"""
+
+    def __init__(self, app):
+        self.app = app
+        self._messages: asyncio.Queue = asyncio.Queue()
+        self._replies: asyncio.Queue = asyncio.Queue()
+        self._task: Optional[asyncio.Task] = None
+
+    async def _event(self, event: str):
+        await self._messages.put({"type": f"lifespan.{event}"})
+        reply = await self._replies.get()
+        if reply["type"].endswith(".failed"):
+            raise RuntimeError(f"{event} failed: {reply.get('message')}")
+
+    async def startup(self):
+        scope = {"type": "lifespan", "asgi": {"version": "3.0"}, "state": {}}
+        self._task = asyncio.ensure_future(self.app(scope, self._messages.get, self._replies.put))
+        await self._event("startup")
+
+    async def shutdown(self):
+        await self._event("shutdown")
+        await self._task
+
+# --- scenarios -------------------------------------------------------------
+
+def scenarios(module_name: str) -> Dict[str, Dict]:
+    """Requests to drive per module: method, path, body(i) or query(i), and whether the answer is streamed"""
+    question = lambda i: {"question": SAMPLE_QUESTIONS[i % len(SAMPLE_QUESTIONS)]}
+    profile = lambda i: PROFILES[i % len(PROFILES)]
+    lead = lambda i: {"email": f"bench{i}@example.com", "current_country": "India", "goal": "work"}
+    if module_name == "api":
+        return {
+            "ask": {"method": "POST", "path": "/ask", "body": question, "stream": True},
+            "lead": {"method": "POST", "path": "/lead",
+                     "body": lambda i: {"email": f"bench{i}@example.com", "country": "India", "intent": "work"}},
+        }
+    if module_name == "api_production":
+        return {
+            "ask": {"method": "POST", "path": "/ask", "body": question, "stream": True},
+            "get_guidance": {"method": "POST", "path": "/get-guidance", "body": profile},
+            "lead": {"method": "POST", "path": "/lead", "body": lead},
+            "knowledge_base_status": {"method": "GET", "path": "/knowledge-base-status"},
+        }
+    if module_name == "api_simple":
+        return {
+            "ask": {"method": "POST", "path": "/ask", "body": question, "stream": True},
+            "get_guidance": {"method": "POST", "path": "/get-guidance", "body": profile},
+            "get_guidance_cached": {"method": "GET", "path": "/get-guidance",
+                                    "query": lambda i: "&".join(f"{k}={v}" for k, v in profile(i).items())},
+            "lead": {"method": "POST", "path": "/lead", "body": lead},
+        }
+    return {
+        "ask": {"method": "POST", "path": "/ask", "body": question},
+        "get_guidance": {"method": "POST", "path": "/get-guidance", "body": profile},
+        "submit_lead": {"method": "POST", "path": "/submit-lead",
+                        "body": lambda i: {"email": f"bench{i}@example.com", "country": "India", "goal": "work"}},
+    }
+
+def percentiles(values: List[float]) -> Optional[Dict[str, float]]:
+    """Nearest-rank p50/p95/p99, mean and max, in milliseconds"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = lambda p: ordered[min(len(ordered) - 1, max(0, int(round(p / 100 * len(ordered) + 0.5)) - 1))]
+    return {
+        "p50": round(rank(50) * 1000, 2),
+        "p95": round(rank(95) * 1000, 2),
+        "p99": round(rank(99) * 1000, 2),
+        "mean": round(sum(ordered) / len(ordered) * 1000, 2),
+        "max": round(ordered[-1] * 1000, 2),
+    }
+
+async def run_scenario(app, scenario: Dict, requests: int, concurrency: int, offset: int = 0) -> Dict:
+    results = []
+    next_index = offset
+
+    async def worker():
+        nonlocal next_index
+        while next_index < offset + requests:
+            i = next_index
+            next_index += 1
+            try:
+                results.append(await asgi_request(
+                    app, scenario["method"], scenario["path"],
+                    body=scenario["body"](i) if "body" in scenario else None,
+                    query=scenario["query"](i) if "query" in scenario else ""
+                ))
+            except Exception as e:
+                results.append({"status": type(e).__name__, "ttfb": None, "total": None, "bytes": 0})
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    statuses: Dict[str, int] = {}
+    for result in results:
+        statuses[str(result["status"])] = statuses.get(str(result["status"]), 0) + 1
+    ok = [r for r in results if isinstance(r["status"], int) and r["status"] < 400]
+    report = {
+        "requests": len(results),
+        "concurrency": concurrency,
+        "errors": len(results) - len(ok),
+        "statuses": dict(sorted(statuses.items())),
+        "throughput_rps": round(len(results) / elapsed, 1),
+        "latency_ms": percentiles([r["total"] for r in ok]),
+        "mean_response_bytes": round(sum(r["bytes"] for r in ok) / len(ok)) if ok else None,
+    }
+    if scenario.get("stream"):
+        report["ttfb_ms"] = percentiles([r["ttfb"] for r in ok if r["ttfb"] is not None])
+    return report
+
+async def wait_until_warm(module, timeout: float = 300):
+    """Wait for the module's background warm-up (model loads) so it is not timed"""
+    warmup = getattr(module, "warmup", None)
+    deadline = time.monotonic() + timeout
+    while warmup is not None and warmup.status in ("pending", "running") and time.monotonic() < deadline:
+        await asyncio.sleep(0.1)
+    if warmup is not None and warmup.status != "ready":
+        print(f"Warning: warm-up is {warmup.status} ({warmup.to_dict().get('error')})")
+
+async def benchmark_module(module_name: str, qdrant, args) -> Dict:
+    import importlib
+    module = importlib.import_module(module_name)
+    if module_name == "api":
+        module.qdrant = qdrant
+        module.load_causal_lm = lambda *a, **kw: load_stub_llm(seed=args.seed)
+        module.ANSWER_MAX_TOKENS = args.max_new_tokens
+    app = module.app
+
+    lifespan = Lifespan(app)
+    await lifespan.startup()
+    await wait_until_warm(module)
+    report = {}
+    for name, scenario in scenarios(module_name).items():
+        if args.scenarios and name not in args.scenarios:
+            continue
+        if args.warmup_requests:
+            await run_scenario(app, scenario, args.warmup_requests, min(args.concurrency, args.warmup_requests))
+        report[name] = await run_scenario(app, scenario, args.requests, args.concurrency, args.warmup_requests)
+        result = report[name]
+        latency = result["latency_ms"] or {}
+        ttfb = f", ttfb p95 {result['ttfb_ms']['p95']} ms" if result.get("ttfb_ms") else ""
+        print(f"  {name:>22}: {result['throughput_rps']:>8} req/s, p50 {latency.get('p50')} ms, "
+              f"p95 {latency.get('p95')} ms, p99 {latency.get('p99')} ms{ttfb}, errors {result['errors']}",
+              file=sys.stderr)
+    await lifespan.shutdown()
+    return report
+
+def run_child(args):
+    """Benchmark one module in this process (started by main with --child)"""
+    sys.path.insert(0, BACKEND_DIR)
+    corpus_path = os.path.abspath(args.corpus)
+    chunks = []
+    if os.path.exists(corpus_path):
+        with open(corpus_path, "r", encoding="utf-8") as f:
+            chunks = json.load(f)
+    corpus = "scraped" if chunks else "synthetic"
+    chunks = chunks or synthetic_corpus()
+
+    with tempfile.TemporaryDirectory(prefix="api_benchmark_") as workdir:
+        os.chdir(workdir)
+        os.environ["LEXICAL_INDEX_PATH"] = os.path.join(workdir, "lexical_index.pkl")
+        os.environ["SNAPSHOT_DIR"] = os.path.join(workdir, "snapshots")
+        os.environ["KB_MANIFEST_PATH"] = os.path.join(workdir, "kb_manifest.json")
+        qdrant = install_stand_ins(args.child, chunks, args.real_embeddings)
+        report = asyncio.run(benchmark_module(args.child, qdrant, args))
+    with open(args.child_output, "w", encoding="utf-8") as f:
+        json.dump({"corpus": corpus, "chunks": len(chunks), "scenarios": report}, f)
+
+def compare(results: Dict, baseline_path: str):
+    """Print throughput and p95 changes against an earlier results file"""
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    print(f"\nChanges against {baseline_path}:")
+    for module_name, module in results["modules"].items():
+        old_module = baseline.get("modules", {}).get(module_name, {}).get("scenarios", {})
+        for name, result in module["scenarios"].items():
+            old = old_module.get(name)
+            if not old or not old.get("latency_ms") or not result.get("latency_ms"):
+                continue
+            throughput = (result["throughput_rps"] / old["throughput_rps"] - 1) if old["throughput_rps"] else 0
+            p95 = (result["latency_ms"]["p95"] / old["latency_ms"]["p95"] - 1) if old["latency_ms"]["p95"] else 0
+            print(f"  {module_name}.{name}: throughput {throughput:+.1%}, p95 latency {p95:+.1%}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the API modules offline and save the results as JSON")
+    parser.add_argument("--modules", nargs="+", default=API_MODULES, choices=API_MODULES)
+    parser.add_argument("--scenarios", nargs="+", help="only these scenarios (e.g. ask get_guidance)")
+    parser.add_argument("--requests", type=int, default=200, help="timed requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--warmup-requests", type=int, default=10, help="untimed requests per scenario first")
+    parser.add_argument("--max-new-tokens", type=int, default=64, help="stub LLM answer length (api.py)")
+    parser.add_argument("--word-delay", type=float, default=0.0,
+                        help="SSE_WORD_DELAY for canned answers (0 measures the server, not the typing effect)")
+    parser.add_argument("--corpus", default=os.path.join(BACKEND_DIR, "scraped_content.json"))
+    parser.add_argument("--real-embeddings", action="store_true", help="use the sentence-transformers model")
+    parser.add_argument("--semantic-cache", action="store_true",
+                        help="keep the /ask answer cache on (off by default, so every question is answered)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--baseline", help="earlier results file to compare against")
+    parser.add_argument("--output", default="api_benchmark.json")
+    parser.add_argument("--child", choices=API_MODULES, help=argparse.SUPPRESS)
+    parser.add_argument("--child-output", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args)
+        return
+
+    env = dict(os.environ, SSE_WORD_DELAY=str(args.word_delay), PYTHONHASHSEED=str(args.seed),
+               SEMANTIC_CACHE="true" if args.semantic_cache else "false")
+    env.pop("LLM_DRAFT_MODEL_NAME", None)
+    results = {
+        "settings": {
+            "requests": args.requests, "concurrency": args.concurrency, "warmup_requests": args.warmup_requests,
+            "max_new_tokens": args.max_new_tokens, "word_delay": args.word_delay,
+            "real_embeddings": args.real_embeddings, "semantic_cache": args.semantic_cache, "seed": args.seed,
+        },
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "modules": {},
+    }
+    for module_name in args.modules:
+        # One process per module: a clean metrics registry, models and event loop for each.
+        # The modules' own logging is dropped; progress and tracebacks come through stderr.
+        print(f"Benchmarking {module_name}...", flush=True)
+        with tempfile.NamedTemporaryFile(suffix=".json") as child_output:
+            child = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), *sys.argv[1:], "--child", module_name,
+                 "--child-output", child_output.name],
+                env=env, stdout=subprocess.DEVNULL
+            )
+            if child.returncode != 0:
+                print(f"  {module_name} failed (exit code {child.returncode})")
+                results["modules"][module_name] = {"error": f"exit code {child.returncode}"}
+                continue
+            with open(child_output.name, "r", encoding="utf-8") as f:
+                results["modules"][module_name] = json.load(f)
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"\nSaved results to {args.output}")
+    if args.baseline:
+        compare(results, args.baseline)
+
+if __name__ == "__main__":
+    main()
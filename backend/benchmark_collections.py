@@ -0,0 +1,167 @@
+# benchmark_collections.py - Compare Qdrant collection profiles on the real corpus
+import argparse
+import json
+import random
+import time
+from typing import List, Dict
+from qdrant_client.http.models import PointStruct, SearchParams
+from embeddings import (
+    embed_model, get_qdrant_client, ensure_collection, get_collection_profile, COLLECTION_PROFILES
+)
+from scraper import load_scraped_content
+
+SAMPLE_QUESTIONS = [
+    "How do I apply for naturalization?",
+    "What are the requirements for an H-1B visa?",
+    "How long does it take to get a green card through marriage?",
+    "Can I travel abroad while my green card application is pending?",
+    "How do I bring my spouse to the United States?",
+    "What is Form I-130?",
+    "What is the visa bulletin and how do priority dates work?",
+    "What are the employment-based immigrant visa categories?",
+    "Do I need to pass an English test to become a citizen?",
+    "How long can a permanent resident stay outside the United States?",
+]
+
+def build_queries(chunks: List[Dict], count: int, seed: int = 42) -> List[str]:
+    """Sample questions plus the opening sentence of random chunks"""
+    rng = random.Random(seed)
+    queries = list(SAMPLE_QUESTIONS)
+    sampled = rng.sample(chunks, min(len(chunks), max(0, count - len(queries))))
+    for chunk in sampled:
+        sentence = chunk["text"].split(".")[0].strip()
+        if len(sentence) > 20:
+            queries.append(sentence[:300])
+    return queries[:count]
+
+def percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[index]
+
+def estimate_ram_bytes(profile: str, points: int, dim: int, payload_bytes: int) -> int:
+    """Rough resident size of vectors and payload (HNSW graph not included)"""
+    config = get_collection_profile(profile)
+    quantization = config["quantization_config"]
+    if quantization is None:
+        vector_bytes = points * dim * 4
+    elif hasattr(quantization, "binary"):
+        vector_bytes = points * ((dim + 7) // 8)
+    else:
+        vector_bytes = points * dim
+    if not config["vectors_on_disk"] and quantization is not None:
+        vector_bytes += points * dim * 4
+    return vector_bytes + (0 if config["on_disk_payload"] else payload_bytes)
+
+def wait_for_green(qdrant, collection_name: str, timeout: float = 300.0):
+    """Wait until the optimizer has finished building the index"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if str(qdrant.get_collection(collection_name).status).lower().endswith("green"):
+            return
+        time.sleep(0.5)
+    print(f"  -> {collection_name} still optimizing after {timeout}s, measuring anyway")
+
+def benchmark_profile(qdrant, profile: str, collection_name: str, points: List[PointStruct],
+                      query_vectors: List[List[float]], truth: List[List[int]], k: int, repeat: int) -> Dict:
+    """Index the points with a profile and measure recall@k and search latency"""
+    qdrant.delete_collection(collection_name)
+    ensure_collection(collection_name, len(query_vectors[0]), profile=profile)
+    for i in range(0, len(points), 256):
+        qdrant.upsert(collection_name=collection_name, points=points[i:i + 256], wait=True)
+    wait_for_green(qdrant, collection_name)
+
+    search_params = get_collection_profile(profile)["search_params"]
+    latencies = []
+    recalls = []
+    for _ in range(repeat):
+        for query_vector, expected in zip(query_vectors, truth):
+            start = time.perf_counter()
+            results = qdrant.search(
+                collection_name=collection_name,
+                query_vector=query_vector,
+                limit=k,
+                search_params=search_params
+            )
+            latencies.append((time.perf_counter() - start) * 1000)
+            found = {result.id for result in results}
+            recalls.append(len(found & set(expected)) / max(1, len(expected)))
+
+    payload_bytes = sum(len(json.dumps(point.payload)) for point in points)
+    return {
+        "profile": profile,
+        "description": COLLECTION_PROFILES[profile]["description"],
+        f"recall@{k}": round(sum(recalls) / len(recalls), 4),
+        "p50_ms": round(percentile(latencies, 50), 3),
+        "p99_ms": round(percentile(latencies, 99), 3),
+        "estimated_ram_mb": round(estimate_ram_bytes(profile, len(points), len(query_vectors[0]), payload_bytes) / 2**20, 2),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure recall@k and latency for each Qdrant collection profile")
+    parser.add_argument("--profiles", nargs="+", default=list(COLLECTION_PROFILES), choices=list(COLLECTION_PROFILES))
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--queries", type=int, default=100, help="number of benchmark queries")
+    parser.add_argument("--repeat", type=int, default=5, help="timed passes over the query set")
+    parser.add_argument("--prefix", default="immigration_docs_bench", help="prefix for the scratch collections")
+    parser.add_argument("--output", default="collection_benchmark.json")
+    parser.add_argument("--keep", action="store_true", help="keep the scratch collections afterwards")
+    args = parser.parse_args()
+
+    chunks = load_scraped_content()
+    if not chunks:
+        print("No scraped content found. Run scraper.py first.")
+        return
+
+    print(f"Embedding {len(chunks)} chunks...")
+    vectors = embed_model.encode([chunk["text"] for chunk in chunks], show_progress_bar=True)
+    points = [
+        PointStruct(id=i, vector=vector.tolist(), payload={
+            "text": chunk["text"],
+            "source_url": chunk.get("source_url", ""),
+            "chunk_id": chunk.get("chunk_id", f"chunk_{i}"),
+            "source_type": chunk.get("source_type", "unknown")
+        })
+        for i, (chunk, vector) in enumerate(zip(chunks, vectors))
+    ]
+
+    queries = build_queries(chunks, args.queries)
+    query_vectors = [vector.tolist() for vector in embed_model.encode(queries)]
+
+    qdrant = get_qdrant_client()
+
+    # Ground truth from exact (brute-force) search over the float32 vectors
+    truth_collection = f"{args.prefix}_exact"
+    qdrant.delete_collection(truth_collection)
+    ensure_collection(truth_collection, len(query_vectors[0]), profile="baseline")
+    for i in range(0, len(points), 256):
+        qdrant.upsert(collection_name=truth_collection, points=points[i:i + 256], wait=True)
+    truth = [
+        [result.id for result in qdrant.search(
+            collection_name=truth_collection,
+            query_vector=query_vector,
+            limit=args.k,
+            search_params=SearchParams(exact=True)
+        )]
+        for query_vector in query_vectors
+    ]
+
+    report = []
+    for profile in args.profiles:
+        print(f"\nBenchmarking profile '{profile}'...")
+        result = benchmark_profile(qdrant, profile, f"{args.prefix}_{profile}", points,
+                                   query_vectors, truth, args.k, args.repeat)
+        print(f"  -> recall@{args.k}={result[f'recall@{args.k}']}, p50={result['p50_ms']}ms, "
+              f"p99={result['p99_ms']}ms, ~{result['estimated_ram_mb']}MB RAM")
+        report.append(result)
+
+    if not args.keep:
+        for name in [truth_collection] + [f"{args.prefix}_{profile}" for profile in args.profiles]:
+            qdrant.delete_collection(name)
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump({"points": len(points), "queries": len(queries), "k": args.k, "profiles": report}, f, indent=2)
+    print(f"\nSaved results to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+# benchmark_intents.py - Per-question routing cost as the intent rule set grows
+import argparse
+import json
+import random
+import string
+import time
+from typing import Callable, Dict, List
+from intents import IntentRouter, load_intent_rules
+
+SAMPLE_QUESTIONS = [
+    "How much does an H-1B petition cost in total?",
+    "How long does it take to get a green card through my employer?",
+    "What documents are required for a student visa interview?",
+    "Can my spouse work while I am on an L-1 visa?",
+    "Sometimes I travel abroad for work, will that affect my naturalization application?",
+    "What should I bring to my appointment at the embassy?",
+    "Is there a backlog for family-based petitions from India?",
+    "I want to move to the United States with my family next year, where do I start?",
+]
+
+def synthetic_rules(base: List[Dict], total: int, seed: int) -> List[Dict]:
+    """The real rules followed by made-up intents with 5-10 keywords each (a third are two-word phrases)"""
+    rng = random.Random(seed)
+
+    def word():
+        return "".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(4, 9)))
+
+    rules = list(base)
+    while len(rules) < total:
+        keywords = []
+        for _ in range(rng.randint(5, 10)):
+            keywords.append(f"{word()} {word()}" if rng.random() < 0.33 else word())
+        rules.append({"intent": f"synthetic_{len(rules)}", "keywords": keywords})
+    return rules
+
+def substring_chain(rules: List[Dict]) -> Callable[[str], str]:
+    """The if/elif chain of `any(word in question ...)` checks the API modules used before"""
+    def match(question: str):
+        question = question.lower()
+        for rule in rules:
+            if any(keyword in question for keyword in rule["keywords"]):
+                return rule["intent"]
+        return None
+    return match
+
+def time_per_question(match: Callable[[str], str], questions: List[str], repeats: int) -> float:
+    """Median over repeats of the mean microseconds per question"""
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for question in questions:
+            match(question)
+        samples.append((time.perf_counter() - start) / len(questions) * 1e6)
+    samples.sort()
+    return samples[len(samples) // 2]
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark intent routing against the number of rules")
+    parser.add_argument("--sizes", nargs="+", type=int, default=[6, 50, 100, 250, 500, 1000])
+    parser.add_argument("--repeats", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="intent_benchmark.json")
+    args = parser.parse_args()
+
+    base = load_intent_rules()
+    report = []
+    for size in args.sizes:
+        rules = synthetic_rules(base, size, args.seed)
+        start = time.perf_counter()
+        router = IntentRouter(rules)
+        build_ms = (time.perf_counter() - start) * 1000
+        chain = substring_chain(rules)
+
+        # Synthetic rules never fire on real questions, so both must agree with the base rules alone
+        mismatches = sum(router.match(q) != IntentRouter(base).match(q) for q in SAMPLE_QUESTIONS)
+        result = {
+            "intents": len(rules),
+            "keywords": sum(len(rule["keywords"]) for rule in rules),
+            "build_ms": round(build_ms, 2),
+            "router_us_per_question": round(time_per_question(router.match, SAMPLE_QUESTIONS, args.repeats), 2),
+            "substring_chain_us_per_question": round(time_per_question(chain, SAMPLE_QUESTIONS, args.repeats), 2),
+            "mismatches": mismatches,
+        }
+        print(f"{result['intents']:>5} intents: router {result['router_us_per_question']:.2f} us/question, "
+              f"substring chain {result['substring_chain_us_per_question']:.2f} us/question")
+        report.append(result)
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump({"questions": len(SAMPLE_QUESTIONS), "results": report}, f, indent=2)
+    print(f"\nSaved results to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+# benchmark_llm.py - Compare LLM inference backends: quality, tokens/sec and memory
+import argparse
+import json
+import math
+import multiprocessing
+import os
+import random
+import resource
+import sys
+import time
+from typing import List, Dict
+import torch
+from llm_backend import load_causal_lm, LLM_MODEL_NAME, LLM_BACKENDS
+from scraper import load_scraped_content
+
+SYSTEM_PROMPT_PREFIX = "You are an AI immigration consultant. You have access to the following official information:\n"
+
+SAMPLE_QUESTIONS = [
+    "How do I apply for naturalization?",
+    "What are the requirements for an H-1B visa?",
+    "How long does it take to get a green card through marriage?",
+    "Can I travel abroad while my green card application is pending?",
+    "How do I bring my spouse to the United States?",
+    "What is Form I-130?",
+    "What is the visa bulletin and how do priority dates work?",
+    "Do I need to pass an English test to become a citizen?",
+]
+
+def build_prompts(chunks: List[Dict], count: int, seed: int = 42) -> List[str]:
+    """RAG-shaped prompts like api.py builds, with random chunks as context"""
+    rng = random.Random(seed)
+    prompts = []
+    for i in range(count):
+        question = SAMPLE_QUESTIONS[i % len(SAMPLE_QUESTIONS)]
+        context = "".join(f"{chunk['text'][:400]}\n" for chunk in rng.sample(chunks, min(2, len(chunks))))
+        prompts.append(
+            f"{SYSTEM_PROMPT_PREFIX}{context}\n"
+            "Using this information, answer the user's question about immigration. "
+            "Be accurate, concise, and helpful. If the information is insufficient, say you don't know.\n\n"
+            f"User question: {question}\n"
+            "Answer:"
+        )
+    return prompts
+
+def rss_mb() -> float:
+    """Current resident set size (peak RSS where /proc is unavailable)"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2**20 if sys.platform == "darwin" else peak / 1024
+
+def perplexity(model, tokenizer, texts: List[str], max_tokens: int = 256) -> float:
+    """Token-level perplexity over reference texts"""
+    total_nll = 0.0
+    total_tokens = 0
+    with torch.inference_mode():
+        for text in texts:
+            input_ids = tokenizer(text, return_tensors="pt").input_ids[:, :max_tokens]
+            if input_ids.shape[1] < 2:
+                continue
+            loss = model(input_ids=input_ids, labels=input_ids).loss
+            total_nll += loss.item() * (input_ids.shape[1] - 1)
+            total_tokens += input_ids.shape[1] - 1
+    return math.exp(total_nll / total_tokens) if total_tokens else float("nan")
+
+def run_backend(model_name: str, backend: str, prompts: List[str], references: List[str],
+                max_new_tokens: int, threads: int) -> Dict:
+    """Load one backend in this process and measure it (runs in a child process)"""
+    if threads:
+        torch.set_num_threads(threads)
+    baseline_rss = rss_mb()
+    start = time.perf_counter()
+    model, tokenizer = load_causal_lm(model_name, backend, token=os.getenv("HF_TOKEN"))
+    load_seconds = time.perf_counter() - start
+    loaded_rss = rss_mb()
+
+    outputs = []
+    generated_tokens = 0
+    decode_seconds = 0.0
+    with torch.inference_mode():
+        # Warm-up so one-time kernel setup is not timed
+        warm = tokenizer(prompts[0], return_tensors="pt")
+        model.generate(**warm, max_new_tokens=4, do_sample=False, pad_token_id=tokenizer.pad_token_id)
+        for prompt in prompts:
+            inputs = tokenizer(prompt, return_tensors="pt")
+            start = time.perf_counter()
+            output = model.generate(**inputs, max_new_tokens=max_new_tokens, do_sample=False,
+                                    pad_token_id=tokenizer.pad_token_id)
+            decode_seconds += time.perf_counter() - start
+            new_tokens = output[0, inputs.input_ids.shape[1]:].tolist()
+            generated_tokens += len(new_tokens)
+            outputs.append(new_tokens)
+
+    return {
+        "backend": backend,
+        "load_seconds": round(load_seconds, 2),
+        "rss_mb": round(loaded_rss, 1),
+        "model_rss_mb": round(loaded_rss - baseline_rss, 1),
+        "peak_rss_mb": round(max(rss_mb(), loaded_rss), 1),
+        "tokens_per_second": round(generated_tokens / decode_seconds, 2) if decode_seconds else None,
+        "perplexity": round(perplexity(model, tokenizer, references), 3),
+        "outputs": outputs,
+    }
+
+def _child(queue, *args):
+    try:
+        queue.put(run_backend(*args))
+    except Exception as e:
+        queue.put({"error": str(e)})
+
+def measure_in_subprocess(*args) -> Dict:
+    """Each backend gets a fresh process so RSS numbers do not include the others"""
+    context = multiprocessing.get_context("spawn")
+    queue = context.Queue()
+    process = context.Process(target=_child, args=(queue,) + args)
+    process.start()
+    result = queue.get()
+    process.join()
+    if "error" in result:
+        raise RuntimeError(result["error"])
+    return result
+
+def agreement(reference: List[List[int]], candidate: List[List[int]]) -> Dict:
+    """How closely greedy outputs follow the reference backend"""
+    exact = 0
+    prefix_ratios = []
+    for expected, actual in zip(reference, candidate):
+        exact += expected == actual
+        matched = 0
+        for a, b in zip(expected, actual):
+            if a != b:
+                break
+            matched += 1
+        prefix_ratios.append(matched / max(1, len(expected)))
+    return {
+        "exact_match": round(exact / max(1, len(reference)), 3),
+        "mean_prefix_match": round(sum(prefix_ratios) / max(1, len(prefix_ratios)), 3),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark LLM inference backends against the float baseline")
+    parser.add_argument("--model", default=LLM_MODEL_NAME)
+    parser.add_argument("--backends", nargs="+", default=list(LLM_BACKENDS), choices=list(LLM_BACKENDS),
+                        help="the first backend is the quality reference")
+    parser.add_argument("--prompts", type=int, default=16, help="number of generation prompts")
+    parser.add_argument("--max-new-tokens", type=int, default=48)
+    parser.add_argument("--threads", type=int, default=0, help="torch CPU threads (0 = torch default)")
+    parser.add_argument("--max-ppl-increase", type=float, default=0.05,
+                        help="fail when a backend's perplexity exceeds the reference by more than this fraction")
+    parser.add_argument("--output", default="llm_benchmark.json")
+    args = parser.parse_args()
+
+    chunks = load_scraped_content()
+    if not chunks:
+        chunks = [{"text": question} for question in SAMPLE_QUESTIONS]
+        print("No scraped content found; using the sample questions as context")
+    prompts = build_prompts(chunks, args.prompts)
+    references = [chunk["text"] for chunk in random.Random(7).sample(chunks, min(32, len(chunks)))]
+
+    results = []
+    for backend in args.backends:
+        print(f"\nBenchmarking backend '{backend}'...")
+        result = measure_in_subprocess(args.model, backend, prompts, references, args.max_new_tokens, args.threads)
+        print(f"  -> {result['tokens_per_second']} tokens/s, model RSS {result['model_rss_mb']}MB, "
+              f"perplexity {result['perplexity']}")
+        results.append(result)
+
+    reference = results[0]
+    failed = []
+    for result in results:
+        result.update(agreement(reference["outputs"], result["outputs"]))
+        result["perplexity_increase"] = round(result["perplexity"] / reference["perplexity"] - 1, 4)
+        if reference["tokens_per_second"] and result["tokens_per_second"]:
+            result["speedup"] = round(result["tokens_per_second"] / reference["tokens_per_second"], 2)
+        if result["perplexity_increase"] > args.max_ppl_increase:
+            failed.append(result["backend"])
+        del result["outputs"]
+        print(f"{result['backend']:>6}: speedup {result.get('speedup')}x, exact match {result['exact_match']}, "
+              f"prefix match {result['mean_prefix_match']}, perplexity +{result['perplexity_increase']:.2%}")
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump({
+            "model": args.model,
+            "prompts": len(prompts),
+            "max_new_tokens": args.max_new_tokens,
+            "reference": reference["backend"],
+            "backends": results,
+        }, f, indent=2)
+    print(f"\nSaved results to {args.output}")
+
+    if failed:
+        print(f"Quality check failed for: {', '.join(failed)} (perplexity increase > {args.max_ppl_increase:.0%})")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+# benchmark_retrieval.py - Retrieval quality vs. latency for each search configuration
+#
+# Builds a labeled question -> relevant-chunk set from scraped_content.json:
+# a tagged sentence (requirement, fee, processing time, form) is sampled from
+# a chunk, a third of its words are dropped to make the query, and every chunk
+# containing the sentence counts as relevant (chunks overlap). The labels are
+# saved, so later runs (and hand-edited labels) score against the same set.
+#
+# Each configuration is a collection profile, an hnsw_ef override and vector
+# or hybrid (vector + BM25) search, run through embeddings.search_similar.
+# Reports recall@k, MRR@k and search latency (queries are embedded once up
+# front, so latency is the search itself), and marks the configurations on
+# the latency/quality Pareto frontier.
+import argparse
+import json
+import os
+import random
+import re
+import time
+from typing import Dict, List, Optional
+from qdrant_client.http.models import PointStruct, SearchParams
+from embeddings import (
+    embed_model, get_qdrant_client, ensure_collection, get_collection_profile, search_similar, COLLECTION_PROFILES
+)
+from annotation import annotate_text
+from lexical_index import LexicalIndex
+from retrieval import fuse_results, LEXICAL_BUDGET_MS
+from scraper import load_scraped_content
+from benchmark_collections import percentile, wait_for_green
+
+def normalize(text: str) -> str:
+    return " ".join(text.lower().split())
+
+def build_labels(chunks: List[Dict], count: int, seed: int = 42, drop: float = 0.33) -> List[Dict]:
+    """Queries made from tagged sentences, each with the chunk ids containing its sentence"""
+    rng = random.Random(seed)
+    normalized = [normalize(chunk["text"]) for chunk in chunks]
+    labels = []
+    seen = set()
+    for index in rng.sample(range(len(chunks)), len(chunks)):
+        if len(labels) >= count:
+            break
+        text = chunks[index]["text"]
+        spans = [(start, end) for start, end, _ in annotate_text(text)["sentences"]
+                 if 8 <= len(text[start:end].split()) <= 40]
+        if not spans:
+            continue
+        start, end = rng.choice(spans)
+        sentence = normalize(text[start:end])
+        if sentence in seen:
+            continue
+        seen.add(sentence)
+        words = sentence.split()
+        kept = [word for word in words if rng.random() >= drop]
+        if len(kept) < 4:
+            kept = words[:max(4, len(words) // 2)]
+        labels.append({
+            "question": re.sub(r"[.!?]+$", "", " ".join(kept)),
+            "sentence": sentence,
+            "relevant": [chunks[i].get("chunk_id", f"chunk_{i}") for i, chunk_text in enumerate(normalized)
+                         if sentence in chunk_text],
+        })
+    return labels
+
+def load_labels(path: str, chunks: List[Dict], count: int, seed: int) -> List[Dict]:
+    """Labels from `path`, or generated and saved there on the first run"""
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            labels = json.load(f)
+        print(f"Loaded {len(labels)} labeled queries from {path}")
+        return labels
+    labels = build_labels(chunks, count, seed)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(labels, f, indent=2, ensure_ascii=False)
+    print(f"Generated {len(labels)} labeled queries and saved them to {path}")
+    return labels
+
+def score(ranked_ids: List[str], relevant: List[str], k: int) -> Dict[str, float]:
+    top = ranked_ids[:k]
+    relevant = set(relevant)
+    reciprocal_rank = next((1.0 / (rank + 1) for rank, chunk_id in enumerate(top) if chunk_id in relevant), 0.0)
+    return {"recall": len(relevant.intersection(top)) / len(relevant), "mrr": reciprocal_rank}
+
+def run_config(collection_name: str, search_params: Optional[SearchParams], mode: str, labels: List[Dict],
+               query_vectors: List[List[float]], lexical: LexicalIndex, k: int, repeat: int) -> Dict:
+    """Search every labeled query `repeat` times with one configuration"""
+    latencies = []
+    recalls = []
+    reciprocal_ranks = []
+    for _ in range(repeat):
+        for label, query_vector in zip(labels, query_vectors):
+            start = time.perf_counter()
+            if mode == "hybrid":
+                # Same fusion as retrieval.hybrid_search_async, run synchronously
+                vector_results = search_similar(label["question"], collection_name, k * 2,
+                                                query_vector=query_vector, search_params=search_params)
+                lexical_hits = lexical.search(label["question"], limit=k * 2, budget_ms=LEXICAL_BUDGET_MS)
+                results = fuse_results(vector_results, lexical_hits, lexical.docs, k)
+            else:
+                results = search_similar(label["question"], collection_name, k,
+                                         query_vector=query_vector, search_params=search_params)
+            latencies.append((time.perf_counter() - start) * 1000)
+            scores = score([result["chunk_id"] for result in results], label["relevant"], k)
+            recalls.append(scores["recall"])
+            reciprocal_ranks.append(scores["mrr"])
+    return {
+        f"recall@{k}": round(sum(recalls) / len(recalls), 4),
+        f"mrr@{k}": round(sum(reciprocal_ranks) / len(reciprocal_ranks), 4),
+        "p50_ms": round(percentile(latencies, 50), 3),
+        "p95_ms": round(percentile(latencies, 95), 3),
+    }
+
+def pareto_frontier(results: List[Dict], quality: str, latency: str = "p95_ms") -> List[Dict]:
+    """Configurations no other one beats on both latency and quality, fastest first"""
+    frontier = [
+        result for result in results
+        if not any(
+            other[latency] <= result[latency] and other[quality] >= result[quality]
+            and (other[latency] < result[latency] or other[quality] > result[quality])
+            for other in results
+        )
+    ]
+    return sorted(frontier, key=lambda result: result[latency])
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure recall@k, MRR and latency for each retrieval configuration")
+    parser.add_argument("--profiles", nargs="+", default=list(COLLECTION_PROFILES), choices=list(COLLECTION_PROFILES))
+    parser.add_argument("--hnsw-ef", nargs="+", type=int, default=[],
+                        help="hnsw_ef values to try besides each profile's default")
+    parser.add_argument("--modes", nargs="+", default=["vector", "hybrid"], choices=["vector", "hybrid"])
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--queries", type=int, default=200, help="labeled queries to generate")
+    parser.add_argument("--labels", default="retrieval_labels.json", help="labeled query set (created if missing)")
+    parser.add_argument("--quality", choices=["recall", "mrr"], default="recall", help="quality axis of the frontier")
+    parser.add_argument("--repeat", type=int, default=3, help="timed passes over the query set")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--prefix", default="immigration_docs_eval", help="prefix for the scratch collections")
+    parser.add_argument("--output", default="retrieval_benchmark.json")
+    parser.add_argument("--keep", action="store_true", help="keep the scratch collections afterwards")
+    args = parser.parse_args()
+
+    chunks = load_scraped_content()
+    if not chunks:
+        print("No scraped content found. Run scraper.py first.")
+        return
+    labels = load_labels(args.labels, chunks, args.queries, args.seed)
+    if not labels:
+        print("No labeled queries to evaluate.")
+        return
+
+    print(f"Embedding {len(chunks)} chunks and {len(labels)} queries...")
+    vectors = embed_model.encode([chunk["text"] for chunk in chunks], show_progress_bar=True)
+    points = [
+        PointStruct(id=i, vector=vector.tolist(), payload={
+            "text": chunk["text"],
+            "source_url": chunk.get("source_url", ""),
+            "chunk_id": chunk.get("chunk_id", f"chunk_{i}"),
+            "source_type": chunk.get("source_type", "unknown")
+        })
+        for i, (chunk, vector) in enumerate(zip(chunks, vectors))
+    ]
+    query_vectors = [vector.tolist() for vector in embed_model.encode([label["question"] for label in labels])]
+    lexical = LexicalIndex.build(chunks)
+
+    qdrant = get_qdrant_client()
+    quality = f"{args.quality}@{args.k}"
+    report = []
+    for profile in args.profiles:
+        collection_name = f"{args.prefix}_{profile}"
+        print(f"\nIndexing profile '{profile}'...")
+        qdrant.delete_collection(collection_name)
+        ensure_collection(collection_name, len(query_vectors[0]), profile=profile)
+        for i in range(0, len(points), 256):
+            qdrant.upsert(collection_name=collection_name, points=points[i:i + 256], wait=True)
+        wait_for_green(qdrant, collection_name)
+
+        default_params = get_collection_profile(profile)["search_params"]
+        default_ef = default_params.hnsw_ef if default_params else None
+        for hnsw_ef in [None] + [ef for ef in args.hnsw_ef if ef != default_ef]:
+            search_params = default_params
+            if hnsw_ef is not None:
+                search_params = SearchParams(hnsw_ef=hnsw_ef,
+                                             quantization=default_params.quantization if default_params else None)
+            for mode in args.modes:
+                result = {"profile": profile, "hnsw_ef": hnsw_ef or default_ef, "mode": mode}
+                result.update(run_config(collection_name, search_params, mode, labels, query_vectors, lexical,
+                                         args.k, args.repeat))
+                print(f"  -> {mode:>6}, hnsw_ef={result['hnsw_ef']}: recall@{args.k}={result[f'recall@{args.k}']}, "
+                      f"MRR={result[f'mrr@{args.k}']}, p50={result['p50_ms']}ms, p95={result['p95_ms']}ms")
+                report.append(result)
+
+        if not args.keep:
+            qdrant.delete_collection(collection_name)
+
+    frontier = pareto_frontier(report, quality)
+    for result in report:
+        result["pareto"] = result in frontier
+    print(f"\nPareto frontier (p95 latency vs {quality}):")
+    for result in frontier:
+        print(f"  {result['profile']}/{result['mode']} hnsw_ef={result['hnsw_ef']}: "
+              f"{quality}={result[quality]}, p95={result['p95_ms']}ms")
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump({
+            "chunks": len(chunks),
+            "queries": len(labels),
+            "labels": args.labels,
+            "k": args.k,
+            "frontier_quality": quality,
+            "configurations": report,
+        }, f, indent=2)
+    print(f"\nSaved results to {args.output}")
+
+if __name__ == "__main__":
+    main()
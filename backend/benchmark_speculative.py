@@ -0,0 +1,120 @@
+# benchmark_speculative.py - Speculative decoding vs plain decoding through the generation scheduler
+import argparse
+import asyncio
+import json
+import os
+import time
+from typing import List, Dict
+import torch
+from generation import GenerationScheduler
+from llm_backend import load_causal_lm, LLM_MODEL_NAME, LLM_DRAFT_MODEL_NAME, LLM_BACKEND, LLM_BACKENDS
+from benchmark_llm import build_prompts, SAMPLE_QUESTIONS
+from scraper import load_scraped_content
+
+async def _generate_all(scheduler: GenerationScheduler, prompts: List[str], max_new_tokens: int,
+                        temperature: float) -> List[Dict]:
+    """One request at a time, like a single user streaming an answer"""
+    loop = asyncio.get_running_loop()
+    results = []
+    for prompt in prompts:
+        start = time.perf_counter()
+        first_token = None
+        request = scheduler.submit(prompt, loop, max_new_tokens=max_new_tokens, temperature=temperature)
+        async for _ in request.stream():
+            if first_token is None:
+                first_token = time.perf_counter() - start
+        results.append({
+            "tokens": request.generated,
+            "seconds": time.perf_counter() - start,
+            "ttft": first_token if first_token is not None else time.perf_counter() - start,
+        })
+    return results
+
+def run_mode(model, tokenizer, draft_model, prompts: List[str], max_new_tokens: int,
+             temperature: float, draft_tokens: int, seed: int) -> Dict:
+    scheduler = GenerationScheduler(model, tokenizer, max_batch_size=1, draft_model=draft_model,
+                                    num_draft_tokens=draft_tokens)
+    scheduler.start()
+    try:
+        scheduler.warm_up(prompts[0], max_new_tokens=4)
+        warm_stats = scheduler.stats()["speculative"] or {}
+        torch.manual_seed(seed)
+        results = asyncio.run(_generate_all(scheduler, prompts, max_new_tokens, temperature))
+        stats = scheduler.stats()
+    finally:
+        scheduler.stop()
+
+    tokens = sum(len(r["tokens"]) for r in results)
+    seconds = sum(r["seconds"] for r in results)
+    report = {
+        "mode": "speculative" if draft_model is not None else "plain",
+        "temperature": temperature,
+        "tokens": tokens,
+        "tokens_per_second": round(tokens / seconds, 2) if seconds else None,
+        "avg_ttft_ms": round(1000 * sum(r["ttft"] for r in results) / len(results), 1),
+        "forward_passes": stats["steps"],
+        "outputs": [r["tokens"] for r in results],
+    }
+    if draft_model is not None:
+        speculative = stats["speculative"]
+        drafted = speculative["draft_tokens"] - warm_stats.get("draft_tokens", 0)
+        accepted = speculative["accepted"] - warm_stats.get("accepted", 0)
+        report["draft_tokens"] = drafted
+        report["acceptance_rate"] = round(accepted / drafted, 3) if drafted else None
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure speculative decoding acceptance rate and tokens/sec")
+    parser.add_argument("--model", default=LLM_MODEL_NAME)
+    parser.add_argument("--draft-model", default=LLM_DRAFT_MODEL_NAME or "microsoft/DialoGPT-small")
+    parser.add_argument("--backend", default=LLM_BACKEND, choices=list(LLM_BACKENDS))
+    parser.add_argument("--draft-tokens", nargs="+", type=int, default=[2, 4, 6],
+                        help="draft lengths to try")
+    parser.add_argument("--temperatures", nargs="+", type=float, default=[0.0, 0.7])
+    parser.add_argument("--prompts", type=int, default=8)
+    parser.add_argument("--max-new-tokens", type=int, default=64)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="speculative_benchmark.json")
+    args = parser.parse_args()
+
+    chunks = load_scraped_content() or [{"text": question} for question in SAMPLE_QUESTIONS]
+    prompts = build_prompts(chunks, args.prompts)
+
+    token = os.getenv("HF_TOKEN")
+    model, tokenizer = load_causal_lm(args.model, args.backend, token=token)
+    draft_model, _ = load_causal_lm(args.draft_model, args.backend, token=token)
+
+    report = []
+    for temperature in args.temperatures:
+        print(f"\nTemperature {temperature}: plain decoding...")
+        plain = run_mode(model, tokenizer, None, prompts, args.max_new_tokens, temperature, 0, args.seed)
+        print(f"  -> {plain['tokens_per_second']} tokens/s")
+        for draft_tokens in args.draft_tokens:
+            print(f"Temperature {temperature}: speculative decoding with {draft_tokens} draft tokens...")
+            result = run_mode(model, tokenizer, draft_model, prompts, args.max_new_tokens, temperature,
+                              draft_tokens, args.seed)
+            result["draft_tokens_per_step"] = draft_tokens
+            result["speedup"] = round(result["tokens_per_second"] / plain["tokens_per_second"], 2)
+            if temperature <= 0:
+                # Greedy speculative decoding must reproduce plain greedy output exactly
+                result["matches_plain_output"] = result["outputs"] == plain["outputs"]
+            del result["outputs"]
+            print(f"  -> {result['tokens_per_second']} tokens/s ({result['speedup']}x), "
+                  f"acceptance rate {result['acceptance_rate']}")
+            report.append(result)
+        del plain["outputs"]
+        report.append(plain)
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump({
+            "model": args.model,
+            "draft_model": args.draft_model,
+            "backend": args.backend,
+            "prompts": len(prompts),
+            "max_new_tokens": args.max_new_tokens,
+            "results": report,
+        }, f, indent=2)
+    print(f"\nSaved results to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+# context_packer.py - Fit retrieved chunks into a token budget for the RAG prompt
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Tuple
+
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "384"))  # tokens of retrieved context per prompt
+MIN_CHUNK_TOKENS = 24  # don't add trimmed pieces shorter than this
+
+# Cut before the whitespace that follows a sentence end, so every sentence
+# after the first starts with its separator. Byte-level BPE (GPT-2 family)
+# splits on that whitespace anyway, so per-sentence token counts add up to
+# the count of the joined text.
+SENTENCE_END_RE = re.compile(r"(?<=[.!?])\s+")
+
+def split_sentences(text: str) -> List[str]:
+    pieces = []
+    start = 0
+    for match in SENTENCE_END_RE.finditer(text):
+        pieces.append(text[start:match.start()])
+        start = match.start()
+    pieces.append(text[start:])
+    return [piece for piece in pieces if piece.strip()]
+
+class ContextPacker:
+    """Packs chunks, best first, into a token budget measured with the LLM tokenizer.
+
+    Each chunk is split into sentences and tokenized once; the per-sentence
+    token counts are kept in an LRU cache keyed by chunk text, so packing a
+    frequently retrieved chunk costs no tokenizer calls.
+    """
+
+    def __init__(self, tokenizer, budget: int = CONTEXT_TOKEN_BUDGET, cache_size: int = 2048):
+        self.tokenizer = tokenizer
+        self.budget = budget
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[str, Tuple[List[str], List[int]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._newline_tokens = self.count_tokens("\n")
+        self.hits = 0
+        self.misses = 0
+
+    def count_tokens(self, text: str) -> int:
+        return len(self.tokenizer.encode(text, add_special_tokens=False))
+
+    def _sentences(self, text: str) -> Tuple[List[str], List[int]]:
+        with self._lock:
+            entry = self._cache.get(text)
+            if entry is not None:
+                self._cache.move_to_end(text)
+                self.hits += 1
+                return entry
+            self.misses += 1
+        sentences = split_sentences(text)
+        entry = (sentences, [self.count_tokens(sentence) for sentence in sentences])
+        with self._lock:
+            self._cache[text] = entry
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return entry
+
+    def _truncate(self, text: str, max_tokens: int) -> str:
+        """Hard cut at a token boundary, for a first chunk whose first sentence is too long"""
+        ids = self.tokenizer.encode(text, add_special_tokens=False)[:max_tokens]
+        return self.tokenizer.decode(ids, skip_special_tokens=True).strip()
+
+    def pack(self, texts: List[str], budget: int = None) -> List[str]:
+        """Chunks (in score order) trimmed to fit `budget` tokens, each as a "text\\n" segment"""
+        remaining = self.budget if budget is None else budget
+        packed = []
+        for text in texts:
+            # Every segment ends with a newline, which costs tokens too
+            available = remaining - self._newline_tokens
+            if available < MIN_CHUNK_TOKENS:
+                break
+            sentences, counts = self._sentences(text)
+            total = sum(counts)
+            if total <= available:
+                packed.append(f"{''.join(sentences).strip()}\n")
+                remaining -= total + self._newline_tokens
+                continue
+
+            # Keep whole leading sentences that fit
+            used = 0
+            kept = 0
+            for count in counts:
+                if used + count > available:
+                    break
+                used += count
+                kept += 1
+            if kept and used >= MIN_CHUNK_TOKENS:
+                packed.append(f"{''.join(sentences[:kept]).strip()}\n")
+                remaining -= used + self._newline_tokens
+            elif not packed:
+                piece = self._truncate(text, available)
+                if piece:
+                    packed.append(f"{piece}\n")
+                    remaining -= self.count_tokens(piece) + self._newline_tokens
+        return packed
+
+    def stats(self) -> Dict:
+        return {"budget": self.budget, "cached_chunks": len(self._cache), "hits": self.hits, "misses": self.misses}
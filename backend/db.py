@@ -2,6 +2,7 @@
 import sqlite3
 import threading
 from datetime import datetime
+from instrumentation import timed
 
 DB_PATH = "conversation_logs.db"
 
@@ -47,6 +48,7 @@ def init_db():
         finally:
             conn.close()
 
+@timed("db_write")
 def log_conversation(user_question: str, assistant_answer: str):
     """Log a completed QA pair to the database"""
     with db_lock:
@@ -63,6 +65,7 @@ def log_conversation(user_question: str, assistant_answer: str):
         finally:
             conn.close()
 
+@timed("db_write")
 def create_lead(email: str, country: str, intent: str):
     """Store lead information in the database"""
     with db_lock:
@@ -80,6 +83,7 @@ def create_lead(email: str, country: str, intent: str):
         finally:
             conn.close()
 
+@timed("db_write")
 def save_lead(email: str, phone: str = None, country: str = None, goal: str = None, timeline: str = None, additional_info: str = None):
     """Store comprehensive lead information in the database"""
     with db_lock:
@@ -144,4 +148,27 @@ def get_leads(limit: int = 100):
             print(f"Error retrieving leads: {e}")
             return []
         finally:
-            conn.close() 
\ No newline at end of file
+            conn.close()
+
+def get_top_countries(limit: int = 20):
+    """Most common countries in guidance requests and leads, lowercased"""
+    with db_lock:
+        conn = get_connection()
+        try:
+            # Guidance requests are logged as "Country: <country>, Status: ..., Goal: ..."
+            cursor = conn.execute(
+                """SELECT country, COUNT(*) AS requests FROM (
+                       SELECT lower(trim(substr(user_question, 10, instr(user_question, ',') - 10))) AS country
+                       FROM conversations WHERE user_question LIKE 'Country: %,%'
+                       UNION ALL
+                       SELECT lower(trim(country)) AS country FROM leads WHERE country IS NOT NULL
+                   )
+                   WHERE country != '' GROUP BY country ORDER BY requests DESC LIMIT ?""",
+                (limit,)
+            )
+            return [row["country"] for row in cursor.fetchall()]
+        except Exception as e:
+            print(f"Error retrieving top countries: {e}")
+            return []
+        finally:
+            conn.close()
@@ -1,13 +1,86 @@
 # embeddings.py
 from sentence_transformers import SentenceTransformer
 from qdrant_client import QdrantClient
-from qdrant_client.http.models import Distance, VectorParams, PointStruct
-from typing import List, Dict
+from qdrant_client.http.models import (
+    CreateAlias, CreateAliasOperation, DeleteAlias, DeleteAliasOperation, Distance, VectorParams, PointStruct, HnswConfigDiff, SearchParams, QuantizationSearchParams,
+    ScalarQuantization, ScalarQuantizationConfig, ScalarType, BinaryQuantization, BinaryQuantizationConfig
+)
+from typing import Callable, List, Dict, Optional
 import os
 from scraper import load_scraped_content, scrape_immigration_content, save_scraped_content
+from lexical_index import build_lexical_index
+from annotation import annotation_payload
+from instrumentation import stage
 
 # Initialize embedding model and Qdrant client
-embed_model = SentenceTransformer("sentence-transformers/all-MiniLM-L6-v2")
+EMBED_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+embed_model = SentenceTransformer(EMBED_MODEL_NAME)
+
+# Collection profiles trade memory for latency/recall. Quantized profiles keep
+# the compressed vectors in RAM, the float32 originals on disk, and rescore the
+# oversampled candidates against the originals. Use benchmark_collections.py
+# to measure recall@k and latency for each profile on the real corpus.
+COLLECTION_PROFILES = {
+    "baseline": {
+        "description": "float32 vectors and payload in RAM (original layout)",
+        "vectors_on_disk": False,
+        "on_disk_payload": False,
+        "hnsw_config": None,
+        "quantization_config": None,
+        "search_params": None,
+    },
+    "scalar": {
+        "description": "int8 vectors in RAM (4x smaller), originals and payload on disk, rescored",
+        "vectors_on_disk": True,
+        "on_disk_payload": True,
+        "hnsw_config": HnswConfigDiff(m=16, ef_construct=100),
+        "quantization_config": ScalarQuantization(
+            scalar=ScalarQuantizationConfig(type=ScalarType.INT8, quantile=0.99, always_ram=True)
+        ),
+        "search_params": SearchParams(
+            hnsw_ef=64,
+            quantization=QuantizationSearchParams(rescore=True, oversampling=2.0)
+        ),
+    },
+    "scalar_compact": {
+        "description": "int8 vectors, sparser HNSW graph on disk; smallest RAM with int8 accuracy",
+        "vectors_on_disk": True,
+        "on_disk_payload": True,
+        "hnsw_config": HnswConfigDiff(m=8, ef_construct=64, on_disk=True),
+        "quantization_config": ScalarQuantization(
+            scalar=ScalarQuantizationConfig(type=ScalarType.INT8, quantile=0.99, always_ram=True)
+        ),
+        "search_params": SearchParams(
+            hnsw_ef=96,
+            quantization=QuantizationSearchParams(rescore=True, oversampling=2.0)
+        ),
+    },
+    "binary": {
+        # 1 bit per dimension is lossy at 384 dims, hence the heavier oversampling
+        "description": "1-bit vectors in RAM (32x smaller), originals and payload on disk, rescored",
+        "vectors_on_disk": True,
+        "on_disk_payload": True,
+        "hnsw_config": HnswConfigDiff(m=16, ef_construct=100),
+        "quantization_config": BinaryQuantization(binary=BinaryQuantizationConfig(always_ram=True)),
+        "search_params": SearchParams(
+            hnsw_ef=128,
+            quantization=QuantizationSearchParams(rescore=True, oversampling=4.0)
+        ),
+    },
+}
+
+QDRANT_PROFILE = os.getenv("QDRANT_PROFILE", "baseline")
+
+def get_collection_profile(profile: str = None) -> Dict:
+    """Look up a collection profile by name (defaults to QDRANT_PROFILE)"""
+    profile = profile or QDRANT_PROFILE
+    if profile not in COLLECTION_PROFILES:
+        raise ValueError(f"Unknown collection profile '{profile}'. Choose from: {', '.join(COLLECTION_PROFILES)}")
+    return COLLECTION_PROFILES[profile]
+
+def get_search_params(profile: str = None) -> Optional[SearchParams]:
+    """Search parameters matching the collection profile (rescoring, hnsw_ef)"""
+    return get_collection_profile(profile)["search_params"]
 
 def get_qdrant_client(url: str = None) -> QdrantClient:
     """Get Qdrant client with environment-based URL"""
@@ -15,9 +88,10 @@ def get_qdrant_client(url: str = None) -> QdrantClient:
         url = os.getenv("QDRANT_URL", "http://localhost:6333")
     return QdrantClient(url=url)
 
-def ensure_collection(collection_name: str = "immigration_docs", vector_dim: int = 384):
-    """Ensure the collection exists, creating it if necessary"""
+def ensure_collection(collection_name: str = "immigration_docs", vector_dim: int = 384, profile: str = None):
+    """Ensure the collection exists, creating it with the given profile if necessary"""
     qdrant = get_qdrant_client()
+    config = get_collection_profile(profile)
     
     try:
         # Try to get collection info
@@ -25,15 +99,105 @@ def ensure_collection(collection_name: str = "immigration_docs", vector_dim: int
         print(f"Collection '{collection_name}' exists with {collection_info.points_count} points")
     except Exception:
         # Collection doesn't exist, create it
-        print(f"Creating collection '{collection_name}'...")
+        print(f"Creating collection '{collection_name}' ({profile or QDRANT_PROFILE} profile)...")
         qdrant.create_collection(
             collection_name=collection_name,
-            vectors_config=VectorParams(size=vector_dim, distance=Distance.COSINE)
+            vectors_config=VectorParams(size=vector_dim, distance=Distance.COSINE, on_disk=config["vectors_on_disk"]),
+            on_disk_payload=config["on_disk_payload"],
+            hnsw_config=config["hnsw_config"],
+            quantization_config=config["quantization_config"]
         )
         print(f"Collection '{collection_name}' created successfully")
 
-def index_documents(chunks: List[Dict[str, str]], collection_name: str = "immigration_docs", batch_size: int = 100):
-    """Embed a list of text chunks and upsert into Qdrant."""
+def versioned_collection_name(alias: str, index_version: str) -> str:
+    """Name of the physical collection holding one index version behind an alias"""
+    return f"{alias}_v{index_version}"
+
+# Version of the index currently served behind the collection alias, and
+# callbacks (caches keyed on index contents) to run when it changes
+_index_version: Optional[str] = None
+_index_listeners: List[Callable[[Optional[str]], None]] = []
+
+def get_index_version() -> Optional[str]:
+    """Index version currently being served (None if unknown/unversioned)"""
+    return _index_version
+
+def add_index_listener(callback: Callable[[Optional[str]], None]):
+    """Register a callback to run with the new version after each index swap"""
+    _index_listeners.append(callback)
+
+def publish_index_version(index_version: Optional[str]):
+    """Record the served index version and notify listeners"""
+    global _index_version
+    if index_version == _index_version:
+        return
+    _index_version = index_version
+    for callback in list(_index_listeners):
+        try:
+            callback(index_version)
+        except Exception as e:
+            print(f"Error in index listener: {e}")
+
+def resolve_index_version(alias: str = "immigration_docs") -> Optional[str]:
+    """Look up which index version the alias points at and publish it"""
+    qdrant = get_qdrant_client()
+    prefix = f"{alias}_v"
+    try:
+        for collection_alias in qdrant.get_aliases().aliases:
+            if collection_alias.alias_name == alias and collection_alias.collection_name.startswith(prefix):
+                publish_index_version(collection_alias.collection_name[len(prefix):])
+                break
+    except Exception as e:
+        print(f"Error resolving index version: {e}")
+    return _index_version
+
+def swap_collection_alias(alias: str, collection_name: str, index_version: str):
+    """Atomically point the alias at a freshly built collection and drop the old one.
+
+    Readers search through the alias, so they keep hitting the previous
+    version until this single alias update lands.
+    """
+    qdrant = get_qdrant_client()
+    previous = None
+    for collection_alias in qdrant.get_aliases().aliases:
+        if collection_alias.alias_name == alias:
+            previous = collection_alias.collection_name
+
+    if previous is None:
+        try:
+            qdrant.get_collection(alias)
+            unaliased = True
+        except Exception:
+            unaliased = False
+        if unaliased:
+            # One-time migration from an unaliased collection: it has to go
+            # before an alias can take its name
+            print(f"Replacing unaliased collection '{alias}' with an alias")
+            qdrant.delete_collection(alias)
+
+    operations = []
+    if previous is not None:
+        operations.append(DeleteAliasOperation(delete_alias=DeleteAlias(alias_name=alias)))
+    operations.append(CreateAliasOperation(create_alias=CreateAlias(collection_name=collection_name, alias_name=alias)))
+    qdrant.update_collection_aliases(change_aliases_operations=operations)
+    print(f"Alias '{alias}' now points at '{collection_name}'")
+
+    if previous is not None and previous != collection_name:
+        try:
+            qdrant.delete_collection(previous)
+        except Exception as e:
+            print(f"Error deleting previous collection '{previous}': {e}")
+
+    publish_index_version(index_version)
+
+def index_documents(chunks: List[Dict[str, str]], collection_name: str = "immigration_docs", batch_size: int = 100,
+                    progress: Callable[[str, int, int], None] = None, build_lexical: bool = True):
+    """Embed a list of text chunks and upsert into Qdrant.
+
+    `progress(stage, done, total)` is called after each batch is embedded
+    ("embed") and upserted ("upsert"). Pass build_lexical=False when the
+    caller swaps in the BM25 index itself.
+    """
     if not chunks:
         print("No chunks to index")
         return
@@ -54,10 +218,13 @@ def index_documents(chunks: List[Dict[str, str]], collection_name: str = "immigr
         
         # Generate embeddings for the batch
         try:
-            vectors = embed_model.encode(batch_texts, show_progress_bar=True)
+            with stage("index_embed"):
+                vectors = embed_model.encode(batch_texts, show_progress_bar=progress is None)
         except Exception as e:
             print(f"Error generating embeddings for batch: {e}")
             continue
+        if progress:
+            progress("embed", min(i + batch_size, len(chunks)), len(chunks))
         
         # Prepare points for Qdrant
         points = []
@@ -67,7 +234,8 @@ def index_documents(chunks: List[Dict[str, str]], collection_name: str = "immigr
                 "text": chunk["text"],
                 "source_url": chunk.get("source_url", ""),
                 "chunk_id": chunk.get("chunk_id", f"chunk_{point_id}"),
-                "source_type": chunk.get("source_type", "unknown")
+                "source_type": chunk.get("source_type", "unknown"),
+                **annotation_payload(chunk)
             }
             
             points.append(PointStruct(
@@ -78,11 +246,21 @@ def index_documents(chunks: List[Dict[str, str]], collection_name: str = "immigr
         
         # Upsert points in Qdrant
         try:
-            qdrant.upsert(collection_name=collection_name, points=points)
+            with stage("index_upsert"):
+                qdrant.upsert(collection_name=collection_name, points=points)
             print(f"  -> Indexed {len(points)} points")
         except Exception as e:
             print(f"Error upserting batch to Qdrant: {e}")
             continue
+        if progress:
+            progress("upsert", min(i + batch_size, len(chunks)), len(chunks))
+    
+    # Build the BM25 index over the same chunks (document numbers match point ids)
+    if build_lexical:
+        try:
+            build_lexical_index(chunks)
+        except Exception as e:
+            print(f"Error building lexical index: {e}")
     
     # Get final collection stats
     try:
@@ -91,33 +269,45 @@ def index_documents(chunks: List[Dict[str, str]], collection_name: str = "immigr
     except Exception as e:
         print(f"Error getting collection info: {e}")
 
-def search_similar(query: str, collection_name: str = "immigration_docs", limit: int = 5) -> List[Dict]:
-    """Search for similar documents given a query"""
+def format_search_result(result) -> Dict:
+    """Flatten a Qdrant scored point into the dict shape used by the API modules"""
+    return {
+        "text": result.payload.get("text", ""),
+        "score": result.score,
+        "source_url": result.payload.get("source_url", ""),
+        "chunk_id": result.payload.get("chunk_id", ""),
+        "source_type": result.payload.get("source_type", ""),
+        "sentences": result.payload.get("sentences"),
+        "forms": result.payload.get("forms"),
+        "annotation_version": result.payload.get("annotation_version")
+    }
+
+def search_similar(query: str, collection_name: str = "immigration_docs", limit: int = 5,
+                   query_vector: List[float] = None, search_params: SearchParams = None) -> List[Dict]:
+    """Search for similar documents given a query.
+
+    Pass `query_vector` when the query has already been embedded, and
+    `search_params` to override the QDRANT_PROFILE defaults (evaluation runs).
+    """
     qdrant = get_qdrant_client()
     
     try:
         # Embed the query
-        query_vector = embed_model.encode(query).tolist()
+        if query_vector is None:
+            with stage("embed"):
+                query_vector = embed_model.encode(query).tolist()
         
         # Search in Qdrant
-        results = qdrant.search(
-            collection_name=collection_name,
-            query_vector=query_vector,
-            limit=limit
-        )
+        with stage("vector_search"):
+            results = qdrant.search(
+                collection_name=collection_name,
+                query_vector=query_vector,
+                limit=limit,
+                search_params=search_params or get_search_params()
+            )
         
         # Format results
-        formatted_results = []
-        for result in results:
-            formatted_results.append({
-                "text": result.payload.get("text", ""),
-                "score": result.score,
-                "source_url": result.payload.get("source_url", ""),
-                "chunk_id": result.payload.get("chunk_id", ""),
-                "source_type": result.payload.get("source_type", "")
-            })
-        
-        return formatted_results
+        return [format_search_result(result) for result in results]
         
     except Exception as e:
         print(f"Error searching: {e}")
@@ -191,6 +381,13 @@ def main():
     # Index the content
     index_documents(content)
     
+    # Snapshot the fresh index so new instances can restore instead of rebuilding
+    from snapshot import create_snapshot
+    try:
+        create_snapshot()
+    except Exception as e:
+        print(f"Error creating snapshot: {e}")
+    
     # Test search
     print("\nTesting search functionality...")
     test_query = "How to apply for naturalization?"
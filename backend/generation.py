@@ -0,0 +1,616 @@
+# generation.py - Continuous-batching LLM generation scheduler
+#
+# One worker thread owns the model. Concurrent requests share a single
+# decode batch: new sequences are prefilled and merged into the batch at a
+# token boundary, finished ones are dropped at the next boundary, and every
+# step is one forward pass for all active sequences. Tokens go back to each
+# SSE handler through a per-request asyncio queue.
+#
+# Prompts can be submitted as segments (e.g. fixed instructions, retrieved
+# chunks, question). The KV cache at segment boundaries is kept in a prefix
+# cache, so a shared prefix is only ever run through the model once.
+#
+# With a draft model, a sequence that is decoding alone uses speculative
+# decoding: the draft proposes a few tokens and one forward pass of the main
+# model verifies them all, so several tokens can come out of each pass.
+import asyncio
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import AsyncIterator, List, Optional, Sequence, Tuple, Union
+import torch
+from transformers import DynamicCache
+from metrics import histogram, gauge
+
+generation_prefill_seconds = histogram("generation_prefill_seconds", "Prompt prefill time per request")
+generation_step_seconds = histogram(
+    "generation_step_seconds", "Decode step time (one forward pass for the whole batch)", ("kind",)
+)
+generation_ttft_seconds = histogram(
+    "generation_time_to_first_token_seconds", "From submission (including queueing) to the first token"
+)
+generation_tokens_per_second = histogram(
+    "generation_tokens_per_second", "Decode rate of each finished request after its first token",
+    buckets=(1, 2, 5, 10, 20, 35, 50, 75, 100, 150, 250, 500)
+)
+generation_requests = gauge("generation_requests", "Sequences in the decode batch or waiting for it", ("state",))
+
+class GenerationRequest:
+    """One sequence in the scheduler, and the stream its text comes back on"""
+
+    def __init__(self, input_ids: List[int], max_new_tokens: int, temperature: float, top_p: float,
+                 loop: asyncio.AbstractEventLoop, boundaries: Sequence[int] = ()):
+        self.id = uuid.uuid4().hex[:12]
+        self.input_ids = input_ids
+        self.boundaries = boundaries  # token offsets where prompt segments end (cacheable prefixes)
+        self.cached_prefix_tokens = 0
+        self.max_new_tokens = max_new_tokens
+        self.temperature = temperature
+        self.top_p = top_p
+        self.generated: List[int] = []
+        self.next_token: Optional[int] = None  # sampled but not yet fed through the model
+        self.finished = False
+        self.cancelled = False
+        self.draft_cache = None  # draft model KV cache (speculative decoding), may lag behind
+        self.draft_length = 0
+        self.submitted_at = time.time()
+        self.first_token_at: Optional[float] = None
+        self._loop = loop
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._emitted_chars = 0
+
+    def _put(self, item):
+        self._loop.call_soon_threadsafe(self._queue.put_nowait, item)
+
+    def _emit_text(self, tokenizer, final: bool = False):
+        """Send newly completed words (or everything, at the end) to the client"""
+        text = tokenizer.decode(self.generated, skip_special_tokens=True)
+        if final:
+            end = len(text)
+        elif text.endswith("\n"):
+            end = len(text)
+        else:
+            # Like TextStreamer: hold back the partial last word (and any
+            # half-decoded multi-byte character)
+            end = text.rfind(" ") + 1
+        if end > self._emitted_chars:
+            self._put(text[self._emitted_chars:end])
+            self._emitted_chars = end
+
+    def cancel(self):
+        """Stop generating at the next token boundary (safe to call from any thread)"""
+        self.cancelled = True
+
+    def _finish(self, error: Optional[Exception] = None):
+        self.finished = True
+        if error is None and self.first_token_at is not None and len(self.generated) > 1:
+            elapsed = time.time() - self.first_token_at
+            if elapsed > 0:
+                generation_tokens_per_second.observe((len(self.generated) - 1) / elapsed)
+        self._put(error)  # None marks a normal end of stream
+
+    async def stream(self) -> AsyncIterator[str]:
+        """Yield text pieces as the scheduler produces them"""
+        while True:
+            item = await self._queue.get()
+            if item is None:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+
+def _to_legacy(past_key_values):
+    return past_key_values.to_legacy_cache() if hasattr(past_key_values, "to_legacy_cache") else past_key_values
+
+def _left_pad(cache, mask: torch.Tensor, length: int):
+    """Left-pad a legacy KV cache and its attention mask to `length` positions"""
+    pad = length - mask.shape[1]
+    if pad <= 0:
+        return cache, mask
+    padded = tuple(
+        tuple(torch.nn.functional.pad(t, (0, 0, pad, 0)) for t in layer)
+        for layer in cache
+    )
+    return padded, torch.nn.functional.pad(mask, (pad, 0))
+
+def _crop_cache(cache, length: int):
+    """View of the first `length` positions of a legacy cache"""
+    return tuple(tuple(t[:, :, :length, :] for t in layer) for layer in cache)
+
+def _slice_cache(cache, length: int):
+    """Copy of the first `length` positions of a single-sequence legacy cache"""
+    return tuple(tuple(t[:, :, :length, :].clone() for t in layer) for layer in cache)
+
+class PrefixCache:
+    """KV caches for prompt prefixes, keyed by their exact token ids.
+
+    Pinned prefixes (the fixed system prompt) are never evicted. Other
+    prefixes (prompt + frequently retrieved chunks) are cached on their
+    second sighting and evicted LRU once `max_tokens` cached positions are
+    in use; max_tokens=0 caches pinned prefixes only.
+    """
+
+    def __init__(self, max_tokens: int = 0, max_tracked: int = 1024):
+        self.max_tokens = max_tokens
+        self.max_tracked = max_tracked
+        self._entries: "OrderedDict[Tuple[int, ...], tuple]" = OrderedDict()
+        self._pinned = set()
+        self._seen: "OrderedDict[Tuple[int, ...], int]" = OrderedDict()
+        self.tokens = 0
+        self.hits = 0
+        self.misses = 0
+
+    def pin(self, key: Tuple[int, ...]):
+        self._pinned.add(key)
+
+    def lookup(self, input_ids: List[int], boundaries: Sequence[int]):
+        """Longest cached prefix at a segment boundary: (length, cache) or (0, None)"""
+        for boundary in sorted(boundaries, reverse=True):
+            if 0 < boundary < len(input_ids):
+                key = tuple(input_ids[:boundary])
+                entry = self._entries.get(key)
+                if entry is not None:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return boundary, entry
+        self.misses += 1
+        return 0, None
+
+    def wants(self, key: Tuple[int, ...]) -> bool:
+        """Whether a freshly computed prefix is worth keeping"""
+        if key in self._entries:
+            return False
+        if key in self._pinned:
+            return True
+        if self.max_tokens <= 0 or len(key) > self.max_tokens:
+            return False
+        count = self._seen.pop(key, 0) + 1
+        self._seen[key] = count
+        while len(self._seen) > self.max_tracked:
+            self._seen.popitem(last=False)
+        return count >= 2
+
+    def store(self, key: Tuple[int, ...], cache):
+        self._entries[key] = cache
+        if key not in self._pinned:
+            self.tokens += len(key)
+        while self.tokens > self.max_tokens:
+            victim = next((k for k in self._entries if k not in self._pinned), None)
+            if victim is None:
+                break
+            del self._entries[victim]
+            self.tokens -= len(victim)
+
+    def stats(self) -> dict:
+        return {"entries": len(self._entries), "tokens": self.tokens, "hits": self.hits, "misses": self.misses}
+
+class GenerationScheduler:
+    """Runs all generation for one model on a single worker thread"""
+
+    def __init__(self, model, tokenizer, max_batch_size: int = 8, prefix_cache_tokens: int = 0,
+                 draft_model=None, num_draft_tokens: int = 4):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.max_batch_size = max_batch_size
+        self.prefix_cache = PrefixCache(max_tokens=prefix_cache_tokens)
+        if draft_model is not None and draft_model.config.vocab_size != model.config.vocab_size:
+            raise ValueError("The draft model must share the main model's tokenizer and vocabulary")
+        self.draft_model = draft_model
+        self.num_draft_tokens = num_draft_tokens
+        self.eos_token_id = tokenizer.eos_token_id
+        self.device = next(model.parameters()).device
+        # Context window; prompt plus generated tokens must stay within it
+        self.max_context = getattr(model.config, "max_position_embeddings", None)
+
+        self._pending: "queue.Queue[GenerationRequest]" = queue.Queue()
+        self._active: List[GenerationRequest] = []
+        self._cache = None           # legacy ((k, v), ...) with batch dim == len(self._active)
+        self._mask: Optional[torch.Tensor] = None  # [batch, cache_len], 0 marks left padding
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = False
+
+        self.tokens_generated = 0
+        self.steps = 0
+        self.cancelled = 0
+        self.speculative_steps = 0
+        self.draft_tokens = 0
+        self.draft_tokens_accepted = 0
+        self._ttft_total = 0.0
+        self._ttft_count = 0
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="generation-scheduler", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Stop the worker thread; requests still queued or generating fail with RuntimeError"""
+        self._stopping = True
+        self._pending.put(None)
+
+    def _encode_segments(self, segments: Sequence[str]) -> Tuple[List[int], List[int]]:
+        """Tokenize segments separately so each boundary is a stable token offset"""
+        input_ids: List[int] = []
+        boundaries: List[int] = []
+        for n, segment in enumerate(segments):
+            input_ids.extend(self.tokenizer.encode(segment, add_special_tokens=(n == 0)))
+            boundaries.append(len(input_ids))
+        return input_ids, boundaries[:-1]
+
+    def register_prefix(self, prefix: str):
+        """Pin a static prompt prefix; its KV cache is computed on first use and kept.
+
+        Prompts only benefit when submitted as segments starting with this exact text.
+        """
+        self.prefix_cache.pin(tuple(self.tokenizer.encode(prefix)))
+
+    def submit(self, prompt: Union[str, Sequence[str]], loop: asyncio.AbstractEventLoop, max_new_tokens: int = 512,
+               temperature: float = 0.7, top_p: float = 0.9) -> GenerationRequest:
+        """Tokenize a prompt (a string, or a list of segments) and queue it; safe to call from any thread"""
+        segments = [prompt] if isinstance(prompt, str) else list(prompt)
+        input_ids, boundaries = self._encode_segments(segments)
+        if self.max_context:
+            if len(input_ids) >= self.max_context:
+                # Keep the end of the prompt (the question); cached prefixes no longer line up
+                print(f"Prompt of {len(input_ids)} tokens exceeds the {self.max_context}-token context; truncating")
+                input_ids = input_ids[-(self.max_context // 2):]
+                boundaries = []
+            max_new_tokens = min(max_new_tokens, self.max_context - len(input_ids))
+        request = GenerationRequest(input_ids, max_new_tokens, temperature, top_p, loop, boundaries)
+        if self._stopping:
+            request._finish(RuntimeError("Generation scheduler stopped"))
+            return request
+        self._pending.put(request)
+        return request
+
+    def warm_up(self, prompt: Union[str, Sequence[str]], max_new_tokens: int = 8):
+        """Run one short greedy generation and wait for it (blocking; call from a worker thread).
+
+        Exercises prefill and batched decode once and fills the cache for any
+        registered prefix the prompt starts with.
+        """
+        async def run():
+            request = self.submit(prompt, asyncio.get_running_loop(), max_new_tokens=max_new_tokens, temperature=0.0)
+            async for _ in request.stream():
+                pass
+        asyncio.run(run())
+
+    def stats(self) -> dict:
+        return {
+            "active": len(self._active),
+            "pending": self._pending.qsize(),
+            "tokens_generated": self.tokens_generated,
+            "steps": self.steps,
+            "cancelled": self.cancelled,
+            "avg_ttft_ms": round(1000 * self._ttft_total / self._ttft_count, 1) if self._ttft_count else None,
+            "prefix_cache": self.prefix_cache.stats(),
+            "speculative": {
+                "steps": self.speculative_steps,
+                "draft_tokens": self.draft_tokens,
+                "accepted": self.draft_tokens_accepted,
+                "acceptance_rate": round(self.draft_tokens_accepted / self.draft_tokens, 3) if self.draft_tokens else None,
+            } if self.draft_model is not None else None,
+        }
+
+    # Worker thread
+
+    def _run(self):
+        try:
+            self._loop_until_stopped()
+        finally:
+            self._fail_remaining(RuntimeError("Generation scheduler stopped"))
+
+    def _fail_remaining(self, error: Exception):
+        """End every active and queued request's stream, so no consumer waits forever"""
+        self._stopping = True
+        remaining = list(self._active)
+        self._active, self._cache, self._mask = [], None, None
+        while True:
+            try:
+                request = self._pending.get_nowait()
+            except queue.Empty:
+                break
+            if request is not None:
+                remaining.append(request)
+        for request in remaining:
+            try:
+                request._finish(error)
+            except RuntimeError:
+                pass  # the request's event loop is already closed
+        generation_requests.set(0, state="active")
+        generation_requests.set(0, state="pending")
+
+    def _loop_until_stopped(self):
+        with torch.inference_mode():
+            while not self._stopping:
+                # Sleep until there is work, then admit as much as fits
+                if not self._active:
+                    generation_requests.set(0, state="active")
+                    generation_requests.set(self._pending.qsize(), state="pending")
+                    request = self._pending.get()
+                    if request is None:
+                        break
+                    self._admit(request)
+                while len(self._active) < self.max_batch_size:
+                    try:
+                        request = self._pending.get_nowait()
+                    except queue.Empty:
+                        break
+                    if request is None:
+                        self._stopping = True
+                        break
+                    self._admit(request)
+                self._drop_cancelled()
+                generation_requests.set(len(self._active), state="active")
+                generation_requests.set(self._pending.qsize(), state="pending")
+                if self._active:
+                    self._step()
+
+    def _sample(self, logits: torch.Tensor, requests: List[GenerationRequest]) -> List[int]:
+        """Temperature + nucleus sampling with per-request settings (0 temperature = greedy)"""
+        logits = logits.float()
+        temperatures = torch.tensor([r.temperature for r in requests], device=logits.device).unsqueeze(1)
+        top_p = torch.tensor([r.top_p for r in requests], device=logits.device).unsqueeze(1)
+
+        probs = torch.softmax(logits / temperatures.clamp(min=1e-5), dim=-1)
+        sorted_probs, sorted_ids = probs.sort(dim=-1, descending=True)
+        outside_nucleus = (sorted_probs.cumsum(dim=-1) - sorted_probs) > top_p
+        sorted_probs = sorted_probs.masked_fill(outside_nucleus, 0.0)
+        sampled = sorted_ids.gather(-1, torch.multinomial(sorted_probs, 1)).squeeze(1)
+
+        greedy = logits.argmax(dim=-1)
+        tokens = torch.where(temperatures.squeeze(1) > 0, sampled, greedy)
+        return tokens.tolist()
+
+    def _accept(self, request: GenerationRequest, token: int) -> bool:
+        """Record a sampled token; returns True if the sequence is finished"""
+        if token == self.eos_token_id:
+            return True
+        if request.first_token_at is None:
+            request.first_token_at = time.time()
+            self._ttft_total += request.first_token_at - request.submitted_at
+            self._ttft_count += 1
+            generation_ttft_seconds.observe(request.first_token_at - request.submitted_at)
+        request.generated.append(token)
+        request.next_token = token
+        self.tokens_generated += 1
+        request._emit_text(self.tokenizer)
+        return len(request.generated) >= request.max_new_tokens
+
+    def _prefill(self, request: GenerationRequest):
+        """Run the prompt through the model, reusing the longest cached prefix"""
+        cached_length, prefix = self.prefix_cache.lookup(request.input_ids, request.boundaries)
+        request.cached_prefix_tokens = cached_length
+        input_ids = torch.tensor([request.input_ids[cached_length:]], device=self.device)
+        if prefix is None:
+            out = self.model(input_ids=input_ids, use_cache=True)
+        else:
+            out = self.model(
+                input_ids=input_ids,
+                past_key_values=DynamicCache.from_legacy_cache(prefix),
+                use_cache=True
+            )
+        cache = _to_legacy(out.past_key_values)
+
+        for boundary in request.boundaries:
+            if boundary > cached_length:
+                key = tuple(request.input_ids[:boundary])
+                if self.prefix_cache.wants(key):
+                    self.prefix_cache.store(key, _slice_cache(cache, boundary))
+        return out.logits[:, -1, :], cache
+
+    def _admit(self, request: GenerationRequest):
+        """Prefill a new sequence on its own and merge it into the running batch"""
+        if request.cancelled:
+            self.cancelled += 1
+            request._finish()
+            return
+        try:
+            start = time.perf_counter()
+            logits, cache = self._prefill(request)
+            generation_prefill_seconds.observe(time.perf_counter() - start)
+            mask = torch.ones((1, len(request.input_ids)), dtype=torch.long, device=self.device)
+            token = self._sample(logits, [request])[0]
+        except Exception as e:
+            print(f"Error in prefill for request {request.id}: {e}")
+            request._finish(e)
+            return
+
+        if self._accept(request, token):
+            request._emit_text(self.tokenizer, final=True)
+            request._finish()
+            return
+
+        if not self._active:
+            self._cache, self._mask = cache, mask
+        else:
+            length = max(self._mask.shape[1], mask.shape[1])
+            batch_cache, batch_mask = _left_pad(self._cache, self._mask, length)
+            cache, mask = _left_pad(cache, mask, length)
+            self._cache = tuple(
+                tuple(torch.cat([a, b], dim=0) for a, b in zip(batch_layer, new_layer))
+                for batch_layer, new_layer in zip(batch_cache, cache)
+            )
+            self._mask = torch.cat([batch_mask, mask], dim=0)
+        self._active.append(request)
+
+    def _step(self):
+        """One decode step for every active sequence"""
+        if self.draft_model is not None and len(self._active) == 1 and self._pending.empty():
+            if self._speculative_step():
+                return
+        start = time.perf_counter()
+        try:
+            input_ids = torch.tensor([[r.next_token] for r in self._active], device=self.device)
+            mask = torch.cat([self._mask, self._mask.new_ones((len(self._active), 1))], dim=1)
+            position_ids = (mask.sum(dim=1, keepdim=True) - 1).clamp(min=0)
+            out = self.model(
+                input_ids=input_ids,
+                past_key_values=DynamicCache.from_legacy_cache(self._cache),
+                attention_mask=mask,
+                position_ids=position_ids,
+                use_cache=True
+            )
+            self._cache = _to_legacy(out.past_key_values)
+            self._mask = mask
+            tokens = self._sample(out.logits[:, -1, :], self._active)
+        except Exception as e:
+            print(f"Error in decode step, failing {len(self._active)} requests: {e}")
+            for request in self._active:
+                request._finish(e)
+            self._active, self._cache, self._mask = [], None, None
+            return
+
+        generation_step_seconds.observe(time.perf_counter() - start, kind="batch")
+        self.steps += 1
+        keep = []
+        for row, (request, token) in enumerate(zip(self._active, tokens)):
+            if self._accept(request, token):
+                request._emit_text(self.tokenizer, final=True)
+                request._finish()
+            else:
+                keep.append(row)
+        if len(keep) < len(self._active):
+            self._evict(keep)
+
+    @staticmethod
+    def _distribution(logits: torch.Tensor, request: GenerationRequest) -> torch.Tensor:
+        """Next-token distribution after temperature and nucleus filtering (one position)"""
+        probs = torch.softmax(logits.float() / max(request.temperature, 1e-5), dim=-1)
+        sorted_probs, sorted_ids = probs.sort(descending=True)
+        outside_nucleus = (sorted_probs.cumsum(dim=-1) - sorted_probs) > request.top_p
+        sorted_probs = sorted_probs.masked_fill(outside_nucleus, 0.0)
+        filtered = torch.zeros_like(probs).scatter_(-1, sorted_ids, sorted_probs)
+        return filtered / filtered.sum()
+
+    def _draft(self, request: GenerationRequest, sequence: List[int], count: int):
+        """Propose `count` tokens with the draft model, catching its cache up first"""
+        past = DynamicCache.from_legacy_cache(request.draft_cache) if request.draft_cache is not None else DynamicCache()
+        new_ids = sequence[request.draft_length:]
+        tokens, probs = [], []
+        for _ in range(count):
+            out = self.draft_model(input_ids=torch.tensor([new_ids], device=self.device),
+                                   past_key_values=past, use_cache=True)
+            past = out.past_key_values
+            logits = out.logits[0, -1]
+            if request.temperature > 0:
+                q = self._distribution(logits, request)
+                token = int(torch.multinomial(q, 1))
+                probs.append(q)
+            else:
+                token = int(logits.argmax())
+            tokens.append(token)
+            new_ids = [token]
+        # The last proposal was never fed through the draft model
+        request.draft_cache = _to_legacy(past)
+        request.draft_length = len(sequence) + count - 1
+        return tokens, probs
+
+    def _verify(self, request: GenerationRequest, logits: torch.Tensor, drafted: List[int],
+                draft_probs: List[torch.Tensor]) -> Tuple[List[int], int]:
+        """Accepted draft tokens plus one token from the main model.
+
+        Greedy requests accept drafts that match the main model's argmax, so
+        the output is identical to plain greedy decoding. Sampled requests use
+        speculative sampling (accept with probability min(1, p/q), otherwise
+        resample from the residual max(0, p - q)), which preserves the main
+        model's distribution.
+        """
+        accepted = []
+        if request.temperature <= 0:
+            targets = logits.argmax(dim=-1).tolist()
+            for i, token in enumerate(drafted):
+                if targets[i] != token:
+                    return accepted, targets[i]
+                accepted.append(token)
+            return accepted, targets[len(drafted)]
+
+        for i, token in enumerate(drafted):
+            p = self._distribution(logits[i], request)
+            q = draft_probs[i]
+            if float(torch.rand(())) * float(q[token]) <= float(p[token]):
+                accepted.append(token)
+                continue
+            residual = (p - q).clamp(min=0.0)
+            total = residual.sum()
+            return accepted, int(torch.multinomial(residual / total if total > 0 else p, 1))
+        return accepted, int(torch.multinomial(self._distribution(logits[len(drafted)], request), 1))
+
+    def _speculative_step(self) -> bool:
+        """Draft-and-verify step for a lone sequence; False if there is no room to speculate"""
+        request = self._active[0]
+        sequence = request.input_ids + request.generated
+        count = min(self.num_draft_tokens, request.max_new_tokens - len(request.generated))
+        if self.max_context:
+            count = min(count, self.max_context - len(sequence) - 1)
+        if count < 1:
+            return False
+
+        start = time.perf_counter()
+        try:
+            drafted, draft_probs = self._draft(request, sequence, count)
+            # The cache holds sequence[:-1]; feed the pending token plus the drafts in one pass
+            input_ids = torch.tensor([[request.next_token] + drafted], device=self.device)
+            out = self.model(
+                input_ids=input_ids,
+                past_key_values=DynamicCache.from_legacy_cache(self._cache),
+                use_cache=True
+            )
+            accepted, token = self._verify(request, out.logits[0], drafted, draft_probs)
+        except Exception as e:
+            print(f"Error in speculative step for request {request.id}: {e}")
+            request._finish(e)
+            self._active, self._cache, self._mask = [], None, None
+            return True
+
+        generation_step_seconds.observe(time.perf_counter() - start, kind="speculative")
+        self.steps += 1
+        self.speculative_steps += 1
+        self.draft_tokens += len(drafted)
+        self.draft_tokens_accepted += len(accepted)
+
+        # Keep positions for the sequence and the accepted drafts; `token` is fed next step
+        length = len(sequence) + len(accepted)
+        self._cache = _crop_cache(_to_legacy(out.past_key_values), length)
+        self._mask = self._mask.new_ones((1, length))
+        if request.draft_length > length:
+            request.draft_cache = _crop_cache(request.draft_cache, length)
+            request.draft_length = length
+
+        for accepted_token in accepted + [token]:
+            if self._accept(request, accepted_token):
+                request._emit_text(self.tokenizer, final=True)
+                request._finish()
+                self._evict([])
+                break
+        return True
+
+    def _drop_cancelled(self):
+        """Free the batch slots of requests whose client went away"""
+        keep = []
+        for row, request in enumerate(self._active):
+            if request.cancelled:
+                self.cancelled += 1
+                request._finish()
+            else:
+                keep.append(row)
+        if len(keep) < len(self._active):
+            self._evict(keep)
+
+    def _evict(self, keep: List[int]):
+        """Drop finished rows and any left padding no remaining row needs"""
+        self._active = [self._active[row] for row in keep]
+        if not keep:
+            self._cache, self._mask = None, None
+            return
+        index = torch.tensor(keep, device=self.device)
+        mask = self._mask.index_select(0, index)
+        used = mask.any(dim=0).nonzero()
+        start = int(used[0]) if len(used) else 0
+        self._mask = mask[:, start:]
+        self._cache = tuple(
+            tuple(t.index_select(0, index)[:, :, start:, :] for t in layer)
+            for layer in self._cache
+        )
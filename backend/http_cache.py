@@ -0,0 +1,90 @@
+# http_cache.py - Pre-serialized, precompressed JSON responses with HTTP caching headers
+#
+# For endpoints whose answers are a pure function of a small input space: the
+# JSON body is serialized and compressed once, and each request only picks an
+# encoding and compares ETags. Strong ETags and Cache-Control let browsers and
+# CDNs serve repeat requests without reaching the API.
+import gzip
+import hashlib
+import json
+import os
+from typing import Any, Dict, Optional
+from fastapi import Request, Response
+
+try:
+    import brotli
+except ImportError:  # optional: gzip only
+    brotli = None
+
+HTTP_CACHE_MAX_AGE = int(os.getenv("HTTP_CACHE_MAX_AGE", "3600"))  # seconds browsers/CDNs may reuse a response
+
+def _accepted_encodings(header: str) -> Dict[str, float]:
+    """Accept-Encoding as {coding: q}"""
+    accepted = {}
+    for part in header.split(","):
+        coding, _, params = part.strip().partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[coding] = q
+    return accepted
+
+class PrecomputedResponse:
+    """A JSON body serialized (and compressed) once, served with ETag / Cache-Control"""
+
+    def __init__(self, content: Any, max_age: int = HTTP_CACHE_MAX_AGE, compress: bool = True):
+        # Same serialization as FastAPI's JSONResponse
+        self.body = json.dumps(content, ensure_ascii=False, allow_nan=False, indent=None,
+                               separators=(",", ":")).encode("utf-8")
+        self.cache_control = f"public, max-age={max_age}"
+        digest = hashlib.sha256(self.body).hexdigest()[:32]
+
+        # Each encoding is a different representation, so it gets its own strong ETag
+        self.variants: Dict[str, tuple] = {"identity": (self.body, f'"{digest}"')}
+        if compress:
+            gzipped = gzip.compress(self.body, compresslevel=9, mtime=0)
+            if len(gzipped) < len(self.body):
+                self.variants["gzip"] = (gzipped, f'"{digest}-gzip"')
+            if brotli is not None:
+                compressed = brotli.compress(self.body, quality=11)
+                if len(compressed) < len(self.body):
+                    self.variants["br"] = (compressed, f'"{digest}-br"')
+        self.etags = {etag for _, etag in self.variants.values()}
+
+    def _choose_encoding(self, accept_encoding: Optional[str]) -> str:
+        if not accept_encoding:
+            return "identity"
+        accepted = _accepted_encodings(accept_encoding)
+        for coding in ("br", "gzip"):
+            if coding in self.variants and accepted.get(coding, accepted.get("*", 0.0)) > 0:
+                return coding
+        return "identity"
+
+    def _not_modified(self, if_none_match: Optional[str]) -> bool:
+        if not if_none_match:
+            return False
+        if if_none_match.strip() == "*":
+            return True
+        # A client may hold any of our representations; W/ prefixes compare weakly, as RFC 9110 allows here
+        tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        return not tags.isdisjoint(self.etags)
+
+    def respond(self, request: Request) -> Response:
+        encoding = self._choose_encoding(request.headers.get("accept-encoding"))
+        body, etag = self.variants[encoding]
+        headers = {"ETag": etag, "Cache-Control": self.cache_control, "Vary": "Accept-Encoding"}
+        if self._not_modified(request.headers.get("if-none-match")):
+            return Response(status_code=304, headers=headers)
+        if encoding != "identity":
+            headers["Content-Encoding"] = encoding
+        return Response(content=body, media_type="application/json", headers=headers)
+
+    def size(self) -> Dict[str, int]:
+        return {encoding: len(body) for encoding, (body, _) in self.variants.items()}
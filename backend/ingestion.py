@@ -0,0 +1,282 @@
+# ingestion.py - Background ingestion jobs: scrape -> chunk -> annotate -> embed -> upsert -> swap
+#
+# Jobs run on a worker thread (Playwright's sync API and embedding are both
+# blocking), write into a fresh versioned collection, and only then swap the
+# collection alias, so the API keeps serving the previous index version until
+# the new one is complete.
+import os
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+from scraper import IMMIGRATION_URLS, fetch_uscis_page, chunk_page, load_scraped_content, save_scraped_content
+from embeddings import (
+    index_documents, ensure_collection, get_qdrant_client, versioned_collection_name, swap_collection_alias,
+    resolve_index_version
+)
+from lexical_index import LEXICAL_INDEX_PATH, LexicalIndex, set_lexical_index
+from snapshot import create_snapshot, latest_snapshot, restore_snapshot
+from annotation import annotate_chunks
+from knowledge_base import corpus_hash, build_manifest, write_manifest
+
+# Rough share of total job time per stage, used for overall progress and ETA
+STAGE_WEIGHTS = {
+    "scrape": 0.45,
+    "chunk": 0.02,
+    "annotate": 0.01,
+    "embed": 0.35,
+    "upsert": 0.12,
+    "swap": 0.05,
+}
+MAX_JOB_HISTORY = 20
+SCRAPE_DELAY = 2  # seconds between page fetches, to be respectful to servers
+
+class IngestionJob:
+    """Progress record for one ingestion run, updated by the worker thread"""
+
+    def __init__(self, kind: str, rescrape: bool = False):
+        self.id = uuid.uuid4().hex[:12]
+        self.kind = kind  # "bootstrap", "full" or "restore"
+        self.rescrape = rescrape
+        self.status = "queued"
+        self.stage: Optional[str] = None
+        # stage -> (done, total); a stage counts as complete once done reaches total
+        self.stages: Dict[str, Tuple[int, int]] = {}
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.index_version: Optional[str] = None
+        self.message: Optional[str] = None
+        self.error: Optional[str] = None
+        self._lock = threading.Lock()
+
+    def set_stage(self, stage: str, total: int = 0):
+        with self._lock:
+            self.stage = stage
+            self.stages[stage] = (0, total)
+        print(f"[ingestion {self.id}] stage: {stage}")
+
+    def skip_stages(self, *stages: str):
+        with self._lock:
+            for stage in stages:
+                self.stages[stage] = (1, 1)
+
+    def update(self, stage: str, done: int, total: int):
+        """Progress callback, matches embeddings.index_documents(progress=...).
+
+        Stages may interleave (index_documents alternates "embed" and
+        "upsert" per batch); switching stages does not complete either one.
+        """
+        if stage not in self.stages:
+            self.set_stage(stage, total)
+        with self._lock:
+            self.stage = stage
+            self.stages[stage] = (done, total)
+
+    def progress(self) -> float:
+        with self._lock:
+            if self.status == "succeeded":
+                return 1.0
+            done = sum(STAGE_WEIGHTS.get(stage, 0.0) * min(stage_done / stage_total, 1.0)
+                       for stage, (stage_done, stage_total) in self.stages.items() if stage_total)
+            return min(done, 0.99)
+
+    def eta_seconds(self) -> Optional[float]:
+        if self.status != "running" or self.started_at is None:
+            return None
+        progress = self.progress()
+        if progress <= 0.0:
+            return None
+        elapsed = time.time() - self.started_at
+        return round(elapsed * (1 - progress) / progress, 1)
+
+    def to_dict(self) -> Dict:
+        def iso(ts):
+            return datetime.fromtimestamp(ts, timezone.utc).isoformat() if ts else None
+
+        with self._lock:
+            stage_done, stage_total = self.stages.get(self.stage, (0, 0))
+
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "stage": self.stage,
+            "stage_progress": {"done": stage_done, "total": stage_total},
+            "progress": round(self.progress(), 3),
+            "eta_seconds": self.eta_seconds(),
+            "index_version": self.index_version,
+            "message": self.message,
+            "error": self.error,
+            "created_at": iso(self.created_at),
+            "started_at": iso(self.started_at),
+            "finished_at": iso(self.finished_at),
+        }
+
+_jobs: Dict[str, IngestionJob] = {}
+_jobs_lock = threading.Lock()
+_active_job: Optional[IngestionJob] = None
+
+def new_index_version(chunks: List[Dict[str, str]]) -> str:
+    """Index version for a chunk set: build time plus a content hash"""
+    return f"{datetime.now(timezone.utc):%Y%m%d%H%M%S}-{corpus_hash(chunks)[:8]}"
+
+def _served_points(collection_name: str) -> int:
+    try:
+        return get_qdrant_client().get_collection(collection_name).points_count or 0
+    except Exception:
+        return 0
+
+def _scrape(job: IngestionJob) -> List[Dict[str, str]]:
+    job.set_stage("scrape", total=len(IMMIGRATION_URLS))
+    pages = []
+    for n, url in enumerate(IMMIGRATION_URLS, 1):
+        print(f"Scraping: {url}")
+        content = fetch_uscis_page(url)
+        if content:
+            pages.append((url, content))
+        else:
+            print("  -> No content extracted")
+        job.update("scrape", n, len(IMMIGRATION_URLS))
+        if n < len(IMMIGRATION_URLS):
+            time.sleep(SCRAPE_DELAY)
+
+    job.set_stage("chunk", total=len(pages))
+    chunks = []
+    for n, (url, content) in enumerate(pages, 1):
+        chunks.extend(chunk_page(url, content))
+        job.update("chunk", n, len(pages))
+    return chunks
+
+def _ingest(job: IngestionJob, collection_name: str):
+    chunks = [] if job.rescrape else load_scraped_content()
+    if chunks:
+        job.skip_stages("scrape", "chunk")
+    else:
+        chunks = _scrape(job)
+        if not chunks:
+            raise RuntimeError("Scraping produced no content")
+        save_scraped_content(chunks)
+
+    # Tag requirement / processing-time / fee / form sentences once, into the payloads
+    job.set_stage("annotate", total=len(chunks))
+    annotate_chunks(chunks, progress=job.update)
+
+    index_version = new_index_version(chunks)
+    job.index_version = index_version
+    target = versioned_collection_name(collection_name, index_version)
+    ensure_collection(target)
+
+    job.set_stage("embed", total=len(chunks))
+    index_documents(chunks, collection_name=target, progress=job.update, build_lexical=False)
+    # index_documents skips batches that fail to embed or upsert; never serve a partial index
+    indexed = _served_points(target)
+    if indexed != len(chunks):
+        get_qdrant_client().delete_collection(target)
+        raise RuntimeError(f"Indexed {indexed} of {len(chunks)} chunks; keeping the current index")
+
+    job.set_stage("swap", total=1)
+    # Stage the BM25 index beside the live one and publish it, with the
+    # manifest, only once the alias points at the new collection; a failed
+    # swap leaves the files describing the collection still being served
+    lexical_index = LexicalIndex.build(chunks)
+    staged_path = f"{LEXICAL_INDEX_PATH}.{index_version}"
+    lexical_index.save(staged_path)
+    try:
+        swap_collection_alias(collection_name, target, index_version)
+    except Exception:
+        os.remove(staged_path)
+        get_qdrant_client().delete_collection(target)
+        raise
+    os.replace(staged_path, LEXICAL_INDEX_PATH)
+    write_manifest(build_manifest(chunks, index_version))
+    set_lexical_index(lexical_index)
+    job.update("swap", 1, 1)
+
+    try:
+        create_snapshot(collection_name, index_version=index_version)
+    except Exception as e:
+        print(f"Error creating snapshot: {e}")
+    job.message = f"Indexed {len(chunks)} chunks as version {index_version}"
+
+def _restore(job: IngestionJob, collection_name: str) -> bool:
+    job.skip_stages("scrape", "chunk", "annotate", "embed")
+    job.set_stage("upsert", total=1)
+    manifest = restore_snapshot(collection_name=collection_name)
+    if not manifest:
+        return False
+    job.skip_stages("upsert")
+    job.index_version = manifest["index_version"]
+    if manifest.get("already_served"):
+        job.message = f"Snapshot {manifest['index_version']} is already being served"
+    else:
+        job.message = f"Restored snapshot {manifest['index_version']} ({manifest['points']} points)"
+    return True
+
+def _bootstrap(job: IngestionJob, collection_name: str):
+    points = _served_points(collection_name)
+    if points > 0:
+        job.index_version = resolve_index_version(collection_name)
+        job.message = f"Serving existing index with {points} points"
+        return
+    if latest_snapshot() is not None:
+        try:
+            if _restore(job, collection_name):
+                return
+        except Exception as e:
+            print(f"Error restoring snapshot, rebuilding index: {e}")
+    _ingest(job, collection_name)
+
+def _run_job(job: IngestionJob, collection_name: str):
+    job.status = "running"
+    job.started_at = time.time()
+    try:
+        if job.kind == "bootstrap":
+            _bootstrap(job, collection_name)
+        elif job.kind == "restore":
+            if not _restore(job, collection_name):
+                raise RuntimeError("No valid snapshot to restore")
+        else:
+            _ingest(job, collection_name)
+        job.status = "succeeded"
+        print(f"[ingestion {job.id}] succeeded: {job.message}")
+    except Exception as e:
+        job.status = "failed"
+        job.error = str(e)
+        print(f"[ingestion {job.id}] failed: {e}")
+    finally:
+        job.finished_at = time.time()
+
+def start_ingestion_job(kind: str = "full", rescrape: bool = False,
+                        collection_name: str = "immigration_docs") -> IngestionJob:
+    """Start an ingestion job in the background.
+
+    Only one job runs at a time; if one is already queued or running it is
+    returned instead of starting another.
+    """
+    global _active_job
+    with _jobs_lock:
+        if _active_job is not None and _active_job.status in ("queued", "running"):
+            return _active_job
+        job = IngestionJob(kind, rescrape)
+        _jobs[job.id] = job
+        while len(_jobs) > MAX_JOB_HISTORY:
+            _jobs.pop(next(iter(_jobs)))
+        _active_job = job
+
+    threading.Thread(
+        target=_run_job, args=(job, collection_name), name=f"ingestion-{job.id}", daemon=True
+    ).start()
+    return job
+
+def get_job(job_id: str) -> Optional[IngestionJob]:
+    return _jobs.get(job_id)
+
+def list_jobs() -> List[IngestionJob]:
+    """Known jobs, newest first"""
+    return list(reversed(list(_jobs.values())))
+
+def get_active_job() -> Optional[IngestionJob]:
+    """The running job, or the most recent one"""
+    return _active_job
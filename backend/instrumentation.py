@@ -0,0 +1,105 @@
+# instrumentation.py - Per-stage request timing: Prometheus histograms and Server-Timing headers
+#
+# Code marks its expensive steps with `with stage("embed"):` (or the @timed
+# decorator). Each stage is observed in the stage_duration_seconds histogram,
+# and when it runs inside an HTTP request handled by ServerTimingMiddleware it
+# is also reported in that response's Server-Timing header, so a slow request
+# can be broken down from the browser's network panel. A stage costs two
+# perf_counter() calls and one histogram update.
+import asyncio
+import functools
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, List, Optional, Tuple
+from starlette.datastructures import MutableHeaders
+from metrics import histogram
+
+stage_seconds = histogram("stage_duration_seconds", "Time spent in each request stage", ("stage",))
+http_request_seconds = histogram(
+    "http_request_duration_seconds", "Time until the response starts, by route", ("method", "route", "status")
+)
+
+# (stage, seconds) pairs for the request being handled in this context, if any
+_request_timings: ContextVar[Optional[List[Tuple[str, float]]]] = ContextVar("request_timings", default=None)
+
+def current_timings() -> Optional[List[Tuple[str, float]]]:
+    """(stage, seconds) pairs recorded so far for the current request, if any"""
+    return _request_timings.get()
+
+def record_stage(name: str, seconds: float):
+    stage_seconds.observe(seconds, stage=name)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings.append((name, seconds))
+
+@contextmanager
+def stage(name: str):
+    """Time the enclosed block as stage `name`"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - start)
+
+def timed(name: str) -> Callable:
+    """Decorator timing every call of a function (sync or async) as stage `name`"""
+    def decorator(fn):
+        if asyncio.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with stage(name):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def server_timing(timings: List[Tuple[str, float]], total: float) -> str:
+    """Server-Timing header value; repeated stages are summed"""
+    durations = {}
+    for name, seconds in timings:
+        durations[name] = durations.get(name, 0.0) + seconds
+    entries = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in durations.items()]
+    entries.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(entries)
+
+class ServerTimingMiddleware:
+    """ASGI middleware collecting the stages of each request into a Server-Timing header.
+
+    Headers go out when the response starts, so a streamed answer reports the
+    stages before its first byte (retrieval, prompt building); generation
+    time is in the generation_* metrics instead.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timings: List[Tuple[str, float]] = []
+        token = _request_timings.set(timings)
+        start = time.perf_counter()
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                elapsed = time.perf_counter() - start
+                MutableHeaders(scope=message).append("Server-Timing", server_timing(timings, elapsed))
+                # The route template, not the raw path, keeps label cardinality bounded
+                route = scope.get("route")
+                http_request_seconds.observe(elapsed, method=scope["method"],
+                                             route=route.path if route is not None else "unmatched",
+                                             status=str(message["status"]))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _request_timings.reset(token)
@@ -0,0 +1,78 @@
+# intents.py - Table-driven keyword intent routing for the canned /ask answers
+#
+# Rules live in intent_rules.json: an ordered list of intents, each with the
+# keywords and phrases that select it (earlier intents win when several
+# match). Keywords are tokenized with the same regex as questions and loaded
+# into a word-level trie, so routing a question is one tokenizing pass plus a
+# dictionary walk per word - the cost does not grow with the number of rules,
+# and a keyword only ever matches whole words ("time" no longer fires on
+# "sometimes").
+import json
+import os
+import re
+from typing import Dict, Iterable, List, Optional
+
+INTENT_RULES_PATH = os.getenv("INTENT_RULES_PATH",
+                              os.path.join(os.path.dirname(os.path.abspath(__file__)), "intent_rules.json"))
+
+# Words, keeping inner hyphens and apostrophes ("h-1b", "i-485", "don't")
+TOKEN_RE = re.compile(r"[a-z0-9]+(?:['-][a-z0-9]+)*")
+
+_INTENT = "\0intent"  # trie node key holding the priority of the intent ending there
+
+def tokenize(text: str) -> List[str]:
+    return TOKEN_RE.findall(text.lower())
+
+class IntentRouter:
+    """Matches questions against keyword rules in one pass over the question"""
+
+    def __init__(self, rules: List[Dict]):
+        self.intents: List[str] = []
+        self._trie: Dict = {}
+        for rule in rules:
+            priority = len(self.intents)
+            self.intents.append(rule["intent"])
+            for keyword in rule["keywords"]:
+                words = tokenize(keyword)
+                if not words:
+                    raise ValueError(f"Intent '{rule['intent']}' has a keyword with no words: {keyword!r}")
+                node = self._trie
+                for word in words:
+                    node = node.setdefault(word, {})
+                # A phrase listed under two intents belongs to the earlier one
+                node.setdefault(_INTENT, priority)
+
+    def match(self, question: str) -> Optional[str]:
+        """Name of the highest-priority intent whose keyword appears in the question, or None"""
+        words = tokenize(question)
+        best = None
+        for start in range(len(words)):
+            node = self._trie
+            for word in words[start:]:
+                node = node.get(word)
+                if node is None:
+                    break
+                priority = node.get(_INTENT)
+                if priority is not None and (best is None or priority < best):
+                    if priority == 0:
+                        return self.intents[0]
+                    best = priority
+        return self.intents[best] if best is not None else None
+
+    def __len__(self) -> int:
+        return len(self.intents)
+
+def load_intent_rules(path: str = INTENT_RULES_PATH) -> List[Dict]:
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)["intents"]
+
+def load_intent_router(path: str = INTENT_RULES_PATH, only: Iterable[str] = None) -> IntentRouter:
+    """Router over the rules in `path`, optionally restricted to the intents a module can answer"""
+    rules = load_intent_rules(path)
+    if only is not None:
+        only = set(only)
+        unknown = only - {rule["intent"] for rule in rules}
+        if unknown:
+            raise ValueError(f"No rules for intents: {', '.join(sorted(unknown))}")
+        rules = [rule for rule in rules if rule["intent"] in only]
+    return IntentRouter(rules)
@@ -0,0 +1,140 @@
+# knowledge_base.py - Knowledge-base manifest and cached collection stats for status endpoints
+#
+# Ingestion writes a small manifest (chunk count, corpus hash, index version,
+# ingest time, per-source counts) next to the lexical index; the API keeps it
+# in memory and reloads it when the served index version changes. Collection
+# stats come from Qdrant at most once per KB_STATS_TTL seconds, so status
+# endpoints polled by monitoring never touch the corpus or open clients.
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+from scraper import load_scraped_content
+from embeddings import get_index_version
+from retrieval import get_async_qdrant_client
+
+KB_MANIFEST_PATH = os.getenv("KB_MANIFEST_PATH",
+                             os.path.join(os.path.dirname(os.path.abspath(__file__)), "kb_manifest.json"))
+KB_STATS_TTL = float(os.getenv("KB_STATS_TTL", "10"))  # seconds collection stats are reused
+
+def corpus_hash(chunks: List[Dict]) -> str:
+    """Content hash of a chunk set (chunk ids and texts, in order)"""
+    digest = hashlib.sha256()
+    for chunk in chunks:
+        digest.update(chunk.get("chunk_id", "").encode("utf-8"))
+        digest.update(chunk["text"].encode("utf-8"))
+    return digest.hexdigest()
+
+def build_manifest(chunks: List[Dict], index_version: Optional[str], ingested_at: str = None) -> Dict:
+    sources = Counter(chunk.get("source_url", "") for chunk in chunks)
+    return {
+        "chunk_count": len(chunks),
+        "corpus_sha256": corpus_hash(chunks),
+        "index_version": index_version,
+        "ingested_at": ingested_at or datetime.now(timezone.utc).isoformat(),
+        "sources": dict(sources.most_common()),
+    }
+
+_manifest: Optional[Dict] = None
+_manifest_loaded = False
+_manifest_lock = threading.Lock()
+_reload_task: Optional[asyncio.Task] = None
+
+def write_manifest(manifest: Dict, path: str = KB_MANIFEST_PATH):
+    """Save the manifest atomically and serve it from memory"""
+    global _manifest, _manifest_loaded
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, path)
+    _manifest, _manifest_loaded = manifest, True
+
+def load_manifest(path: str = KB_MANIFEST_PATH) -> Optional[Dict]:
+    """Read the manifest from disk; without one (an index built before manifests
+    existed), derive it once from the scraped corpus"""
+    global _manifest, _manifest_loaded
+    manifest = None
+    if os.path.exists(path):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+        except Exception as e:
+            print(f"Error loading knowledge base manifest: {e}")
+    if manifest is None:
+        chunks = load_scraped_content()
+        if chunks:
+            # When the corpus was indexed is unknown
+            manifest = dict(build_manifest(chunks, get_index_version()), ingested_at=None)
+    _manifest, _manifest_loaded = manifest, True
+    return manifest
+
+def get_manifest() -> Optional[Dict]:
+    """The in-memory manifest (loaded on first use; blocking, may hash the corpus)"""
+    if not _manifest_loaded:
+        with _manifest_lock:
+            if not _manifest_loaded:
+                return load_manifest()
+    return _manifest
+
+async def get_manifest_async() -> Optional[Dict]:
+    """get_manifest() for the event loop: a first load runs on a worker thread"""
+    if _manifest_loaded:
+        return _manifest
+    return await asyncio.to_thread(get_manifest)
+
+def reload_manifest(index_version: Optional[str] = None):
+    """Index listener: another process may have ingested a new corpus.
+
+    Listeners can run on the event loop; the reload then goes to a worker thread.
+    """
+    global _reload_task
+    if _manifest is not None and _manifest.get("index_version") == index_version:
+        return
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        load_manifest()
+        return
+    _reload_task = loop.create_task(asyncio.to_thread(load_manifest))
+
+class CollectionStats:
+    """Qdrant collection stats, fetched at most once per `ttl` seconds.
+
+    After the first fetch, expired stats are still returned while one
+    background refresh runs, so callers never wait on Qdrant.
+    """
+
+    def __init__(self, collection_name: str, ttl: float = KB_STATS_TTL):
+        self.collection_name = collection_name
+        self.ttl = ttl
+        self._stats: Optional[Dict] = None
+        self._fetched_at = 0.0
+        self._refresh: Optional[asyncio.Task] = None
+
+    async def _fetch(self) -> Dict:
+        try:
+            info = await get_async_qdrant_client().get_collection(self.collection_name)
+            stats = {"points": info.points_count or 0, "status": info.status.value}
+        except Exception as e:
+            stats = {"points": 0, "status": "unavailable", "error": str(e)}
+        self._stats = stats
+        self._fetched_at = time.monotonic()
+        return stats
+
+    def invalidate(self, *_):
+        self._fetched_at = 0.0
+
+    async def get(self) -> Dict:
+        if self._stats is None:
+            return await self._fetch()
+        if time.monotonic() - self._fetched_at > self.ttl and (self._refresh is None or self._refresh.done()):
+            self._refresh = asyncio.ensure_future(self._fetch())
+        return self._stats
+
+    def age(self) -> Optional[float]:
+        return round(time.monotonic() - self._fetched_at, 1) if self._stats is not None else None
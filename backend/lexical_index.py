@@ -0,0 +1,206 @@
+# lexical_index.py - In-process BM25 inverted index over the chunk store
+import heapq
+import math
+import os
+import pickle
+import re
+import threading
+import time
+from array import array
+from collections import Counter
+from operator import itemgetter
+from typing import List, Dict, Optional, Tuple
+from annotation import annotation_payload
+
+# Next to this module by default, so ingestion, snapshot restore and the API
+# share one file whatever directory they were started from
+LEXICAL_INDEX_PATH = os.getenv("LEXICAL_INDEX_PATH",
+                               os.path.join(os.path.dirname(os.path.abspath(__file__)), "lexical_index.pkl"))
+
+# Standard BM25 parameters
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Words and hyphenated identifiers such as i-130, n-400, eb-2, h-1b
+TOKEN_RE = re.compile(r"[a-z0-9]+(?:-[a-z0-9]+)*")
+
+STOPWORDS = frozenset("""
+a an and are as at be by can do does for from has have how i if in is it its me my
+of on or our should so that the their there this to was what when where which who
+will with you your
+""".split())
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase and split text into index terms.
+
+    Hyphens are dropped from identifiers so "H-1B" and "H1B" (or "I-130"
+    and "I130") map to the same term.
+    """
+    tokens = []
+    for token in TOKEN_RE.findall(text.lower()):
+        if "-" in token:
+            tokens.append(token.replace("-", ""))
+        elif token not in STOPWORDS:
+            tokens.append(token)
+    return tokens
+
+class LexicalIndex:
+    """Compact BM25 index with CSR-style, array-backed postings.
+
+    Document numbers are positions in the chunk list passed to build(), which
+    are also the Qdrant point ids assigned by embeddings.index_documents.
+    """
+
+    def __init__(self, vocab: Dict[str, int], idf: array, offsets: array, doc_ids: array,
+                 term_freqs: array, doc_norms: array, docs: List[Dict]):
+        self.vocab = vocab            # term -> term id
+        self.idf = idf                # 'f', per term id
+        self.offsets = offsets        # 'I', postings of term t are [offsets[t], offsets[t + 1])
+        self.doc_ids = doc_ids        # 'I', flat postings: document numbers
+        self.term_freqs = term_freqs  # 'H', flat postings: term frequency in that document
+        self.doc_norms = doc_norms    # 'f', precomputed k1 * (1 - b + b * len / avg_len)
+        self.docs = docs              # chunk payloads, indexed by document number
+
+    @classmethod
+    def build(cls, chunks: List[Dict[str, str]]) -> "LexicalIndex":
+        """Build the index from scraped chunks (same order as indexed into Qdrant)"""
+        postings: Dict[str, List[Tuple[int, int]]] = {}
+        doc_lengths = []
+        for doc_id, chunk in enumerate(chunks):
+            terms = tokenize(chunk["text"])
+            doc_lengths.append(len(terms))
+            for term, tf in Counter(terms).items():
+                postings.setdefault(term, []).append((doc_id, min(tf, 65535)))
+
+        doc_count = len(chunks)
+        avg_length = (sum(doc_lengths) / doc_count) if doc_count else 0.0
+
+        vocab = {}
+        idf = array("f")
+        offsets = array("I", [0])
+        doc_ids = array("I")
+        term_freqs = array("H")
+        for term_id, term in enumerate(sorted(postings)):
+            term_postings = postings[term]
+            vocab[term] = term_id
+            df = len(term_postings)
+            idf.append(math.log(1 + (doc_count - df + 0.5) / (df + 0.5)))
+            for doc_id, tf in term_postings:
+                doc_ids.append(doc_id)
+                term_freqs.append(tf)
+            offsets.append(len(doc_ids))
+
+        doc_norms = array("f", (
+            BM25_K1 * (1 - BM25_B + BM25_B * (length / avg_length if avg_length else 0.0))
+            for length in doc_lengths
+        ))
+
+        docs = [{
+            "text": chunk["text"],
+            "source_url": chunk.get("source_url", ""),
+            "chunk_id": chunk.get("chunk_id", f"chunk_{doc_id}"),
+            "source_type": chunk.get("source_type", "unknown"),
+            **annotation_payload(chunk)
+        } for doc_id, chunk in enumerate(chunks)]
+
+        return cls(vocab, idf, offsets, doc_ids, term_freqs, doc_norms, docs)
+
+    def __len__(self) -> int:
+        return len(self.docs)
+
+    def search(self, query: str, limit: int = 5, budget_ms: Optional[float] = None) -> List[Tuple[int, float]]:
+        """Return up to `limit` (document number, BM25 score) pairs, best first.
+
+        Query terms are scored rarest first; when `budget_ms` is set, scoring
+        stops at the first term boundary past the budget, so the most
+        selective terms (form numbers, visa classes) are always counted.
+        """
+        deadline = time.perf_counter() + budget_ms / 1000.0 if budget_ms is not None else None
+
+        term_ids = {self.vocab[term] for term in tokenize(query) if term in self.vocab}
+        if not term_ids:
+            return []
+
+        idf, offsets, doc_ids, term_freqs, doc_norms = (
+            self.idf, self.offsets, self.doc_ids, self.term_freqs, self.doc_norms
+        )
+        scores: Dict[int, float] = {}
+        for n, term_id in enumerate(sorted(term_ids, key=idf.__getitem__, reverse=True)):
+            if deadline is not None and n and time.perf_counter() > deadline:
+                break
+            term_idf = idf[term_id] * (BM25_K1 + 1)
+            for p in range(offsets[term_id], offsets[term_id + 1]):
+                doc_id = doc_ids[p]
+                tf = term_freqs[p]
+                scores[doc_id] = scores.get(doc_id, 0.0) + term_idf * tf / (tf + doc_norms[doc_id])
+
+        return heapq.nlargest(limit, scores.items(), key=itemgetter(1))
+
+    def save(self, path: str = LEXICAL_INDEX_PATH):
+        """Write the index atomically so readers never see a partial file"""
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump({
+                "vocab": self.vocab,
+                "idf": self.idf,
+                "offsets": self.offsets,
+                "doc_ids": self.doc_ids,
+                "term_freqs": self.term_freqs,
+                "doc_norms": self.doc_norms,
+                "docs": self.docs,
+            }, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str = LEXICAL_INDEX_PATH) -> Optional["LexicalIndex"]:
+        """Load a saved index, or return None if there is none"""
+        if not os.path.exists(path):
+            return None
+        with open(path, "rb") as f:
+            data = pickle.load(f)
+        return cls(**data)
+
+_index: Optional[LexicalIndex] = None
+_index_loaded = False
+_index_lock = threading.Lock()
+
+def lexical_index_loaded() -> bool:
+    """Whether get_lexical_index() returns without reading the disk"""
+    return _index_loaded
+
+def get_lexical_index() -> Optional[LexicalIndex]:
+    """Get the process-wide lexical index, loading it from disk on first use (blocking)"""
+    global _index, _index_loaded
+    if not _index_loaded:
+        with _index_lock:
+            if not _index_loaded:
+                try:
+                    _index = LexicalIndex.load()
+                    if _index is not None:
+                        print(f"Loaded lexical index with {len(_index)} chunks from {LEXICAL_INDEX_PATH}")
+                except Exception as e:
+                    print(f"Error loading lexical index: {e}")
+                    _index = None
+                _index_loaded = True
+    return _index
+
+def set_lexical_index(index: Optional[LexicalIndex]):
+    """Swap in a new lexical index (a single reference assignment)"""
+    global _index, _index_loaded
+    _index = index
+    _index_loaded = True
+
+def build_lexical_index(chunks: List[Dict[str, str]], path: str = LEXICAL_INDEX_PATH) -> LexicalIndex:
+    """Build the lexical index for an ingestion run, save it and make it current"""
+    index = LexicalIndex.build(chunks)
+    index.save(path)
+    set_lexical_index(index)
+    print(f"Lexical index built: {len(index)} chunks, {len(index.vocab)} terms")
+    return index
+
+def reload_lexical_index():
+    """Re-read the index from disk (after another process swapped the index)"""
+    try:
+        set_lexical_index(LexicalIndex.load())
+    except Exception as e:
+        print(f"Error reloading lexical index: {e}")
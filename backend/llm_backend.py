@@ -0,0 +1,93 @@
+# llm_backend.py - Load the generation model for the selected inference backend
+import os
+from typing import Tuple
+import torch
+from torch import nn
+from transformers import AutoTokenizer, AutoModelForCausalLM
+from transformers.pytorch_utils import Conv1D
+
+LLM_MODEL_NAME = os.getenv("LLM_MODEL_NAME", "microsoft/DialoGPT-medium")  # Using a smaller model for Apple Silicon
+# For production, you could use: "meta-llama/Llama-2-7b-chat-hf"
+
+# Small model sharing the tokenizer (e.g. microsoft/DialoGPT-small) for
+# speculative decoding; empty disables it
+LLM_DRAFT_MODEL_NAME = os.getenv("LLM_DRAFT_MODEL_NAME", "")
+SPECULATIVE_TOKENS = int(os.getenv("SPECULATIVE_TOKENS", "4"))  # draft tokens verified per forward pass
+
+# "float" keeps the full-precision weights (float16 on CUDA, float32 on CPU);
+# "int8" quantizes the linear layers for CPU inference
+LLM_BACKEND = os.getenv("LLM_BACKEND", "float")
+LLM_BACKENDS = ("float", "int8")
+
+def _conv1d_to_linear(module: nn.Module) -> int:
+    """Replace GPT-2 style Conv1D layers (x @ W + b) with equivalent nn.Linear layers.
+
+    Dynamic quantization only rewrites nn.Linear, and GPT-2 family models
+    (DialoGPT included) implement their projections as Conv1D.
+    """
+    replaced = 0
+    for name, child in module.named_children():
+        if isinstance(child, Conv1D):
+            in_features, out_features = child.weight.shape
+            linear = nn.Linear(in_features, out_features)
+            linear.weight = nn.Parameter(child.weight.detach().t().contiguous())
+            linear.bias = nn.Parameter(child.bias.detach())
+            setattr(module, name, linear)
+            replaced += 1
+        else:
+            replaced += _conv1d_to_linear(child)
+    return replaced
+
+def _select_quantized_engine():
+    # fbgemm/x86 on Intel and AMD hosts, qnnpack on ARM (Graviton, Apple Silicon)
+    engines = torch.backends.quantized.supported_engines
+    for engine in ("x86", "fbgemm", "qnnpack"):
+        if engine in engines:
+            torch.backends.quantized.engine = engine
+            return engine
+    raise RuntimeError("This torch build has no quantized CPU engine")
+
+def quantize_int8(model: nn.Module) -> nn.Module:
+    """Dynamic int8 quantization of the transformer's linear layers.
+
+    Weights are stored as int8 and activations are quantized per batch at
+    run time, so no calibration data is needed. The output projection stays
+    in float: it is tied to the token embeddings (quantizing it would add a
+    copy rather than save memory) and it decides every sampled token.
+    """
+    _conv1d_to_linear(model)
+    engine = _select_quantized_engine()
+    qconfig_spec = {
+        name: torch.ao.quantization.default_dynamic_qconfig
+        for name, module in model.named_modules()
+        if isinstance(module, nn.Linear) and name != "lm_head"
+    }
+    model = torch.ao.quantization.quantize_dynamic(model, qconfig_spec, dtype=torch.qint8)
+    print(f"Quantized {len(qconfig_spec)} linear layers to int8 ({engine} engine)")
+    return model
+
+def load_causal_lm(model_name: str = LLM_MODEL_NAME, backend: str = LLM_BACKEND,
+                   token: str = None) -> Tuple[nn.Module, AutoTokenizer]:
+    """Load the tokenizer and an eval-mode model for the given backend"""
+    if backend not in LLM_BACKENDS:
+        raise ValueError(f"Unknown LLM_BACKEND '{backend}', expected one of {', '.join(LLM_BACKENDS)}")
+
+    tokenizer = AutoTokenizer.from_pretrained(model_name, token=token)
+    if tokenizer.pad_token is None:
+        tokenizer.pad_token = tokenizer.eos_token
+
+    if backend == "int8":
+        if torch.cuda.is_available():
+            print("LLM_BACKEND=int8 runs on CPU; ignoring the available GPU")
+        model = AutoModelForCausalLM.from_pretrained(model_name, token=token, torch_dtype=torch.float32)
+        model.eval()
+        model = quantize_int8(model)
+    else:
+        model = AutoModelForCausalLM.from_pretrained(
+            model_name,
+            token=token,
+            torch_dtype=torch.float16 if torch.cuda.is_available() else torch.float32,
+            device_map="auto" if torch.cuda.is_available() else None
+        )
+        model.eval()
+    return model, tokenizer
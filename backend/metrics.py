@@ -0,0 +1,183 @@
+# metrics.py - Minimal in-process metrics with Prometheus text exposition
+import threading
+from bisect import bisect_left
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in items]
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+class Counter(_Metric):
+    """Monotonically increasing count"""
+    kind = "counter"
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+class Gauge(_Metric):
+    """Value that can go up and down, or be read from a callback at scrape time"""
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                 callback: Optional[Callable[[], float]] = None):
+        super().__init__(name, documentation, labelnames)
+        self.callback = callback
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels):
+        self.inc(-amount, **labels)
+
+    def samples(self) -> List[str]:
+        if self.callback is not None:
+            try:
+                return [f"{self.name} {_format_value(self.callback())}"]
+            except Exception:
+                return []
+        return super().samples()
+
+class Summary(_Metric):
+    """Count and sum of observations (e.g. seconds waited), without quantiles"""
+    kind = "summary"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._counts: Dict[Tuple[str, ...], float] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + value
+            self._counts[key] = self._counts.get(key, 0.0) + 1
+
+    def count(self, **labels) -> float:
+        return self._counts.get(self._key(labels), 0.0)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = sorted((key, value, self._counts[key]) for key, value in self._values.items())
+        lines = []
+        for key, total, count in items:
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {_format_value(count)}")
+        return lines
+
+# Seconds, from a cache hit to a slow LLM answer
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+class Histogram(_Metric):
+    """Observations counted into cumulative buckets, plus their sum and count"""
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._buckets: Dict[Tuple[str, ...], List[int]] = {}  # per-bucket (non-cumulative) counts, last is +Inf
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._buckets.get(key)
+            if counts is None:
+                counts = self._buckets[key] = [0] * (len(self.buckets) + 1)
+            counts[index] += 1
+            self._values[key] = self._values.get(key, 0.0) + value
+
+    def count(self, **labels) -> float:
+        return float(sum(self._buckets.get(self._key(labels), ())))
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = sorted((key, total, list(self._buckets[key])) for key, total in self._values.items())
+        lines = []
+        for key, total, counts in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else _format_value(bound)
+                bucket_labels = _format_labels(self.labelnames, key, 'le="' + le + '"')
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+_registry: Dict[str, _Metric] = {}
+_registry_lock = threading.Lock()
+
+def _register(metric: _Metric) -> _Metric:
+    # Modules may be imported by several API modules; reuse existing metrics
+    with _registry_lock:
+        existing = _registry.get(metric.name)
+        if existing is not None:
+            return existing
+        _registry[metric.name] = metric
+        return metric
+
+def counter(name: str, documentation: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+    return _register(Counter(name, documentation, labelnames))
+
+def gauge(name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+          callback: Optional[Callable[[], float]] = None) -> Gauge:
+    return _register(Gauge(name, documentation, labelnames, callback))
+
+def summary(name: str, documentation: str, labelnames: Tuple[str, ...] = ()) -> Summary:
+    return _register(Summary(name, documentation, labelnames))
+
+def histogram(name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+              buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+    return _register(Histogram(name, documentation, labelnames, buckets))
+
+def render_metrics() -> str:
+    """All registered metrics in Prometheus text exposition format"""
+    with _registry_lock:
+        metrics = list(_registry.values())
+    return "\n".join(metric.render() for metric in metrics) + "\n"
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
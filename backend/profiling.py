@@ -0,0 +1,183 @@
+# profiling.py - On-demand sampling profiler and slow-request capture
+#
+# profile() samples the Python stack of every thread in the process at a
+# fixed interval (sys._current_frames, no tracing hooks) and returns the
+# samples in the folded "frame;frame;frame count" format read by
+# flamegraph.pl, speedscope and inferno. It runs on its own thread, so the
+# event loop keeps serving while it records.
+#
+# SlowRequestMiddleware watches selected routes; a request that has not sent
+# its first body byte after SLOW_REQUEST_SECONDS gets its coroutine stack and
+# the busy threads' stacks sampled by a watchdog thread (which works even when
+# the event loop itself is blocked), and on completion its stage timings are
+# kept in a bounded ring buffer. Streamed answers are paced on purpose, so
+# their total duration does not count, only the wait before they start.
+import asyncio
+import os
+import sys
+import threading
+import time
+from collections import Counter, deque
+from datetime import datetime, timezone
+from typing import Deque, Dict, List, Optional
+from instrumentation import current_timings
+from metrics import counter
+
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "10"))  # default sampling interval
+PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", "60"))  # longest profile an admin can request
+SLOW_REQUEST_SECONDS = float(os.getenv("SLOW_REQUEST_SECONDS", "2"))  # time-to-first-byte threshold; 0 disables
+SLOW_REQUEST_BUFFER = int(os.getenv("SLOW_REQUEST_BUFFER", "50"))  # slow requests kept
+SLOW_REQUEST_PATHS = os.getenv("SLOW_REQUEST_PATHS", "/ask,/get-guidance")
+
+slow_requests_total = counter(
+    "slow_requests_total", "Requests whose first byte took longer than SLOW_REQUEST_SECONDS", ("path",)
+)
+
+# Leaf frames of threads parked waiting for work (executor pools, queues, the
+# event loop's selector); left out of profiles unless idle samples are asked for
+IDLE_FRAMES = {
+    ("threading.py", "wait"),
+    ("queue.py", "get"),
+    ("thread.py", "_worker"),
+    ("selectors.py", "select"),
+    ("profiling.py", "_watch"),
+}
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+def _stack(frame) -> List[str]:
+    """Frame labels from the outermost call to `frame`"""
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    labels.reverse()
+    return labels
+
+def _is_idle(frame) -> bool:
+    return (os.path.basename(frame.f_code.co_filename), frame.f_code.co_name) in IDLE_FRAMES
+
+def thread_stacks(include_idle: bool = False) -> Dict[str, List[str]]:
+    """Current stack of every other thread, by thread name"""
+    names = {thread.ident: thread.name for thread in threading.enumerate()}
+    own = threading.get_ident()
+    return {
+        names.get(ident, str(ident)): _stack(frame)
+        for ident, frame in sys._current_frames().items()
+        if ident != own and (include_idle or not _is_idle(frame))
+    }
+
+_profile_lock = threading.Lock()
+
+def profile(seconds: float, interval_ms: float = PROFILE_INTERVAL_MS, include_idle: bool = False) -> str:
+    """Sample all threads for `seconds`; folded stacks rooted at the thread name.
+
+    Only one profile runs at a time; RuntimeError if another is in progress.
+    """
+    if not _profile_lock.acquire(blocking=False):
+        raise RuntimeError("A profile is already being recorded")
+    try:
+        interval = interval_ms / 1000.0
+        samples: Counter = Counter()
+        deadline = time.perf_counter() + seconds
+        while time.perf_counter() < deadline:
+            for name, stack in thread_stacks(include_idle).items():
+                samples[";".join([name] + stack)] += 1
+            time.sleep(interval)
+    finally:
+        _profile_lock.release()
+    return "".join(f"{stack} {count}\n" for stack, count in samples.most_common())
+
+slow_requests: Deque[Dict] = deque(maxlen=SLOW_REQUEST_BUFFER)
+
+def recent_slow_requests() -> List[Dict]:
+    """Captured slow requests, newest first"""
+    return list(reversed(slow_requests))
+
+class _InFlight:
+    __slots__ = ("task", "started", "first_byte", "stack")
+
+    def __init__(self, task: Optional[asyncio.Task]):
+        self.task = task
+        self.started = time.perf_counter()
+        self.first_byte: Optional[float] = None
+        self.stack: Optional[Dict] = None
+
+    def sample(self):
+        request = []
+        if self.task is not None:
+            try:
+                request = [_frame_label(frame) for frame in self.task.get_stack()]
+            except Exception:
+                pass  # the coroutine moved on while its frames were being read
+        self.stack = {"request": request, "threads": thread_stacks()}
+
+class SlowRequestMiddleware:
+    """ASGI middleware keeping stage timings and a stack sample of slow requests.
+
+    A request is slow when its first body chunk comes later than the
+    threshold, so a streamed answer that starts promptly is not, however
+    long it is paced. The full duration is still recorded. Add it before
+    ServerTimingMiddleware so it runs inside it and sees the stages.
+    """
+
+    def __init__(self, app, threshold: float = SLOW_REQUEST_SECONDS, paths: str = SLOW_REQUEST_PATHS):
+        self.app = app
+        self.threshold = threshold
+        self.paths = {path.strip() for path in paths.split(",") if path.strip()}
+        self._in_flight: Dict[int, _InFlight] = {}
+        self._watchdog: Optional[threading.Thread] = None
+
+    def _watch(self):
+        interval = min(0.25, self.threshold / 4)
+        while True:
+            time.sleep(interval)
+            now = time.perf_counter()
+            for request in list(self._in_flight.values()):
+                if request.stack is None and request.first_byte is None and now - request.started >= self.threshold:
+                    request.sample()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or self.threshold <= 0 or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+
+        if self._watchdog is None:
+            self._watchdog = threading.Thread(target=self._watch, name="slow-request-watchdog", daemon=True)
+            self._watchdog.start()
+        request = _InFlight(asyncio.current_task())
+        self._in_flight[id(request)] = request
+        status = None
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body" and request.first_byte is None and message.get("body"):
+                request.first_byte = time.perf_counter()
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            del self._in_flight[id(request)]
+            finished = time.perf_counter()
+            elapsed = finished - request.started
+            first_byte = (request.first_byte or finished) - request.started
+            if first_byte >= self.threshold:
+                stages = {}
+                for name, seconds in current_timings() or []:
+                    stages[name] = stages.get(name, 0.0) + seconds
+                slow_requests.append({
+                    "method": scope["method"],
+                    "path": scope["path"],
+                    "status": status,
+                    "first_byte_ms": round(first_byte * 1000, 1),
+                    "duration_ms": round(elapsed * 1000, 1),
+                    "finished_at": datetime.now(timezone.utc).isoformat(),
+                    "stages_ms": {name: round(seconds * 1000, 1) for name, seconds in stages.items()},
+                    "stack": request.stack,
+                })
+                slow_requests_total.inc(path=scope["path"])
@@ -0,0 +1,166 @@
+# retrieval.py - Async vector retrieval for the RAG endpoints
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Optional
+from qdrant_client import AsyncQdrantClient
+from embeddings import embed_model, format_search_result, get_search_params, add_index_listener, resolve_index_version
+from lexical_index import get_lexical_index, lexical_index_loaded, reload_lexical_index
+from instrumentation import stage
+from metrics import gauge
+
+# Retrieval configuration
+SEARCH_TIMEOUT = float(os.getenv("SEARCH_TIMEOUT", "2.0"))  # seconds, embedding + search
+EMBED_WORKERS = int(os.getenv("EMBED_WORKERS", "2"))
+HYBRID_SEARCH = os.getenv("HYBRID_SEARCH", "true").lower() == "true"
+LEXICAL_BUDGET_MS = float(os.getenv("LEXICAL_BUDGET_MS", "5"))  # BM25 scoring budget per query
+LEXICAL_MIN_SCORE = float(os.getenv("LEXICAL_MIN_SCORE", "2.0"))  # BM25 score that counts as relevant
+RRF_K = 60  # reciprocal-rank fusion constant
+INDEX_POLL_SECONDS = float(os.getenv("INDEX_POLL_SECONDS", "60"))  # how often to check for a swapped index
+
+# Embedding is CPU-bound, so it runs on a small dedicated pool instead of
+# the event loop (and instead of Starlette's threadpool used by sync routes)
+_embed_executor = ThreadPoolExecutor(max_workers=EMBED_WORKERS, thread_name_prefix="embed")
+gauge("embed_queue_depth", "Query embeddings waiting for the embedding pool",
+      callback=lambda: _embed_executor._work_queue.qsize())
+
+_async_qdrant: Optional[AsyncQdrantClient] = None
+
+def get_async_qdrant_client(url: str = None) -> AsyncQdrantClient:
+    """Get the shared async Qdrant client, creating it on first use"""
+    global _async_qdrant
+    if _async_qdrant is None:
+        if url is None:
+            url = os.getenv("QDRANT_URL", "http://localhost:6333")
+        _async_qdrant = AsyncQdrantClient(url=url)
+    return _async_qdrant
+
+async def close_async_qdrant_client():
+    """Close the shared async Qdrant client (call on app shutdown)"""
+    global _async_qdrant
+    if _async_qdrant is not None:
+        await _async_qdrant.close()
+        _async_qdrant = None
+
+async def embed_query(query: str) -> List[float]:
+    """Embed a query on the embedding pool without blocking the event loop"""
+    loop = asyncio.get_running_loop()
+    with stage("embed"):
+        vector = await loop.run_in_executor(_embed_executor, embed_model.encode, query)
+    return vector.tolist()
+
+async def _search(query: str, collection_name: str, limit: int, query_vector: List[float] = None) -> List[Dict]:
+    if query_vector is None:
+        query_vector = await embed_query(query)
+    with stage("vector_search"):
+        results = await get_async_qdrant_client().search(
+            collection_name=collection_name,
+            query_vector=query_vector,
+            limit=limit,
+            search_params=get_search_params()
+        )
+    return [format_search_result(result) for result in results]
+
+async def search_similar_async(query: str, collection_name: str = "immigration_docs", limit: int = 5,
+                               timeout: float = SEARCH_TIMEOUT, query_vector: List[float] = None) -> List[Dict]:
+    """Async counterpart of embeddings.search_similar.
+
+    Pass `query_vector` when the query has already been embedded. Returns an
+    empty list on timeout or search errors, like search_similar.
+    Cancellation (e.g. the client went away) propagates to the caller.
+    """
+    try:
+        return await asyncio.wait_for(_search(query, collection_name, limit, query_vector), timeout=timeout)
+    except asyncio.TimeoutError:
+        print(f"Search timed out after {timeout}s: {query[:50]}...")
+        return []
+    except Exception as e:
+        print(f"Error searching: {e}")
+        return []
+
+def fuse_results(vector_results: List[Dict], lexical_hits: List[tuple], docs: List[Dict], limit: int) -> List[Dict]:
+    """Merge vector and BM25 rankings with reciprocal-rank fusion.
+
+    Each result keeps its cosine "score" (0.0 if only BM25 found it) and gains
+    "bm25_score" and "fused_score"; results are ordered by fused_score.
+    """
+    fused: Dict[str, Dict] = {}
+    for rank, result in enumerate(vector_results):
+        fused[result["chunk_id"]] = dict(result, bm25_score=0.0, fused_score=1.0 / (RRF_K + rank + 1))
+    for rank, (doc_id, bm25_score) in enumerate(lexical_hits):
+        doc = docs[doc_id]
+        entry = fused.get(doc["chunk_id"])
+        if entry is None:
+            entry = fused[doc["chunk_id"]] = dict(doc, score=0.0, bm25_score=0.0, fused_score=0.0)
+        entry["bm25_score"] = bm25_score
+        entry["fused_score"] += 1.0 / (RRF_K + rank + 1)
+    return sorted(fused.values(), key=lambda r: r["fused_score"], reverse=True)[:limit]
+
+async def hybrid_search_async(query: str, collection_name: str = "immigration_docs", limit: int = 5,
+                              timeout: float = SEARCH_TIMEOUT, query_vector: List[float] = None) -> List[Dict]:
+    """Vector search plus in-process BM25, merged with reciprocal-rank fusion.
+
+    Falls back to plain vector search when hybrid search is disabled or no
+    lexical index has been built yet.
+    """
+    index = None
+    if HYBRID_SEARCH:
+        if lexical_index_loaded():
+            index = get_lexical_index()
+        else:
+            # First use without warm-up: unpickling the index would stall every stream on the loop
+            index = await asyncio.get_running_loop().run_in_executor(_embed_executor, get_lexical_index)
+    if index is None:
+        return await search_similar_async(query, collection_name=collection_name, limit=limit, timeout=timeout,
+                                          query_vector=query_vector)
+
+    candidates = limit * 2
+    vector_task = asyncio.ensure_future(
+        search_similar_async(query, collection_name=collection_name, limit=candidates, timeout=timeout,
+                             query_vector=query_vector)
+    )
+    try:
+        # Yield once so the vector search gets going, then score BM25 on the
+        # loop while it is in flight; scoring is capped by LEXICAL_BUDGET_MS
+        await asyncio.sleep(0)
+        try:
+            with stage("lexical_search"):
+                lexical_hits = index.search(query, limit=candidates, budget_ms=LEXICAL_BUDGET_MS)
+        except Exception as e:
+            print(f"Error in lexical search: {e}")
+            lexical_hits = []
+        vector_results = await vector_task
+    except asyncio.CancelledError:
+        vector_task.cancel()
+        raise
+
+    return fuse_results(vector_results, lexical_hits, index.docs, limit)
+
+async def qdrant_reachable(collection_name: str = "immigration_docs", timeout: float = 1.0) -> bool:
+    """Whether the collection answers within `timeout` seconds (readiness checks)"""
+    try:
+        await asyncio.wait_for(get_async_qdrant_client().get_collection(collection_name), timeout=timeout)
+        return True
+    except Exception:
+        return False
+
+def is_relevant(result: Dict, min_score: float) -> bool:
+    """Relevance check for vector or hybrid results.
+
+    A result passes on cosine similarity, or on a strong BM25 match, which
+    catches exact identifiers (I-130, N-400, EB-2) that embeddings score low.
+    """
+    return result.get("score", 0) > min_score or result.get("bm25_score", 0) >= LEXICAL_MIN_SCORE
+
+# Another process (an ingestion job, or another instance) may swap the index;
+# pick up its BM25 index when the served version changes
+add_index_listener(lambda index_version: reload_lexical_index())
+
+async def watch_index_version(collection_name: str = "immigration_docs", interval: float = INDEX_POLL_SECONDS):
+    """Poll the collection alias and publish index version changes (run as a background task)"""
+    while True:
+        try:
+            await asyncio.to_thread(resolve_index_version, collection_name)
+        except Exception as e:
+            print(f"Error checking index version: {e}")
+        await asyncio.sleep(interval)
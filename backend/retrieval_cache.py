@@ -0,0 +1,142 @@
+# retrieval_cache.py - LRU cache of retrieval results for queries drawn from a small key space
+import asyncio
+import os
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Iterable, List, Optional
+from metrics import counter, gauge
+
+RETRIEVAL_CACHE_SIZE = int(os.getenv("RETRIEVAL_CACHE_SIZE", "512"))  # cached keys
+
+retrieval_cache_requests = counter(
+    "retrieval_cache_requests_total", "Retrieval cache lookups by result", ("cache", "result")
+)
+retrieval_cache_entries = gauge("retrieval_cache_entries", "Keys held in the retrieval cache", ("cache",))
+retrieval_cache_refreshes = counter(
+    "retrieval_cache_refreshes_total", "Background retrieval cache refreshes after an index change", ("cache",)
+)
+
+class RetrievalCache:
+    """Caches `loader(key)` results, evicting the least recently used key when full.
+
+    Concurrent misses for one key share a single load, which runs as its own
+    task so a cancelled caller does not cancel the others. Empty results
+    are not kept, so keys looked up before the knowledge base is loaded are
+    retried. When the index version changes, every cached key is reloaded
+    in the background; the old results keep being served until their
+    replacements arrive, so a swap never sends a burst of requests to Qdrant.
+    If nothing is cached yet (the index was still being built at startup),
+    the warm-up keys are loaded again instead.
+    """
+
+    def __init__(self, name: str, loader: Callable[[Hashable], Awaitable[Any]],
+                 max_entries: int = RETRIEVAL_CACHE_SIZE):
+        self.name = name
+        self.loader = loader
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._loading: Dict[Hashable, asyncio.Task] = {}
+        self._warm_keys: List[Hashable] = []
+        self._generation = 0  # bumped on index change; loads from an older generation are not stored
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._refresh_task: Optional[asyncio.Task] = None
+
+    def _store(self, key: Hashable, value: Any):
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        retrieval_cache_entries.set(len(self._entries), cache=self.name)
+
+    async def _load_and_store(self, key: Hashable) -> Any:
+        generation = self._generation
+        value = await self.loader(key)
+        if value and generation == self._generation:
+            self._store(key, value)
+        return value
+
+    def _load_done(self, key: Hashable, task: asyncio.Task):
+        if self._loading.get(key) is task:
+            del self._loading[key]
+        if not task.cancelled():
+            task.exception()  # mark retrieved so a failure nobody awaited is not logged
+
+    async def _load(self, key: Hashable) -> Any:
+        task = self._loading.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._load_and_store(key))
+            self._loading[key] = task
+            task.add_done_callback(lambda done, key=key: self._load_done(key, done))
+        return await asyncio.shield(task)
+
+    async def get(self, key: Hashable) -> Any:
+        self._loop = asyncio.get_running_loop()
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            retrieval_cache_requests.inc(cache=self.name, result="hit")
+            return self._entries[key]
+        retrieval_cache_requests.inc(cache=self.name, result="miss")
+        return await self._load(key)
+
+    async def warm(self, keys: Iterable[Hashable], concurrency: int = 4):
+        """Load keys ahead of traffic (run as a background task)"""
+        self._loop = asyncio.get_running_loop()
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def load(key):
+            async with semaphore:
+                try:
+                    await self._load(key)
+                except Exception as e:
+                    print(f"Error warming {self.name} cache for {key}: {e}")
+
+        keys = list(keys)
+        self._warm_keys = keys
+        await asyncio.gather(*(load(key) for key in keys))
+        print(f"Warmed {self.name} cache with {len(self._entries)} of {len(keys)} keys")
+
+    async def refresh(self):
+        """Reload every cached key, most recently used first"""
+        generation = self._generation
+        keys = list(reversed(self._entries))
+        for key in keys:
+            if generation != self._generation:
+                return  # a newer refresh took over
+            try:
+                value = await self.loader(key)
+            except Exception as e:
+                print(f"Error refreshing {self.name} cache for {key}: {e}")
+                continue
+            if value and generation == self._generation and key in self._entries:
+                self._entries[key] = value
+        retrieval_cache_refreshes.inc(cache=self.name)
+        print(f"Refreshed {len(keys)} {self.name} cache entries")
+
+    def _start_refresh(self):
+        self._generation += 1
+        if self._refresh_task is not None:
+            self._refresh_task.cancel()
+        if self._entries or not self._warm_keys:
+            self._refresh_task = asyncio.ensure_future(self.refresh())
+        else:
+            # Nothing loaded at startup (no index yet): retry the warm-up keys
+            self._refresh_task = asyncio.ensure_future(self.warm(self._warm_keys))
+
+    def on_index_version(self, index_version: Optional[str]):
+        """Index listener (may run on any thread): refresh in the background on the event loop"""
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            return  # nothing has been cached yet
+        print(f"Index version is now {index_version}; refreshing {self.name} cache")
+        loop.call_soon_threadsafe(self._start_refresh)
+
+    def stats(self) -> Dict:
+        hits = retrieval_cache_requests.value(cache=self.name, result="hit")
+        misses = retrieval_cache_requests.value(cache=self.name, result="miss")
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": int(hits),
+            "misses": int(misses),
+            "hit_rate": round(hits / (hits + misses), 3) if hits + misses else None,
+            "refreshing": self._refresh_task is not None and not self._refresh_task.done(),
+        }
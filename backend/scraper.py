@@ -83,47 +83,48 @@ def chunk_text(text: str, max_tokens: int = 500, overlap: int = 50) -> List[str]
     
     return chunks
 
+# Key immigration URLs to scrape
+IMMIGRATION_URLS = [
+    # USCIS Policy Manual and key pages
+    "https://www.uscis.gov/policy-manual/volume-7-part-a-chapter-2",  # Naturalization eligibility
+    "https://www.uscis.gov/policy-manual/volume-7-part-a-chapter-3",  # Naturalization requirements  
+    "https://www.uscis.gov/citizenship/learn-about-citizenship/citizenship-and-naturalization/naturalization-process",
+    "https://www.uscis.gov/green-card/green-card-eligibility/green-card-for-immediate-relatives-of-us-citizen",
+    "https://www.uscis.gov/working-in-the-united-states/h-1b-specialty-occupations",
+    "https://www.uscis.gov/family/family-of-us-citizens/bringing-spouses-to-live-in-the-united-states-as-permanent-residents",
+    
+    # State Department visa information
+    "https://travel.state.gov/content/travel/en/us-visas/immigrate/family-immigration.html",
+    "https://travel.state.gov/content/travel/en/us-visas/immigrate/employment-based-immigrant-visas.html",
+    "https://travel.state.gov/content/travel/en/us-visas/visa-information-resources/visa-bulletin.html",
+    
+    # Common USCIS FAQ pages
+    "https://www.uscis.gov/citizenship/learn-about-citizenship/citizenship-and-naturalization/i-am-married-to-a-us-citizen",
+    "https://www.uscis.gov/green-card/after-green-card-granted/international-travel-as-permanent-resident",
+]
+
+def chunk_page(url: str, content: str) -> List[Dict[str, str]]:
+    """Clean and chunk one page's text into content pieces"""
+    chunks = chunk_text(content, max_tokens=400, overlap=50)
+    return [{
+        "text": chunk,
+        "source_url": url,
+        "chunk_id": f"{url}_{i}",
+        "source_type": "official_immigration"
+    } for i, chunk in enumerate(chunks)]
+
 def scrape_immigration_content() -> List[Dict[str, str]]:
     """Scrape content from key immigration websites"""
     
-    # Key immigration URLs to scrape
-    urls = [
-        # USCIS Policy Manual and key pages
-        "https://www.uscis.gov/policy-manual/volume-7-part-a-chapter-2",  # Naturalization eligibility
-        "https://www.uscis.gov/policy-manual/volume-7-part-a-chapter-3",  # Naturalization requirements  
-        "https://www.uscis.gov/citizenship/learn-about-citizenship/citizenship-and-naturalization/naturalization-process",
-        "https://www.uscis.gov/green-card/green-card-eligibility/green-card-for-immediate-relatives-of-us-citizen",
-        "https://www.uscis.gov/working-in-the-united-states/h-1b-specialty-occupations",
-        "https://www.uscis.gov/family/family-of-us-citizens/bringing-spouses-to-live-in-the-united-states-as-permanent-residents",
-        
-        # State Department visa information
-        "https://travel.state.gov/content/travel/en/us-visas/immigrate/family-immigration.html",
-        "https://travel.state.gov/content/travel/en/us-visas/immigrate/employment-based-immigrant-visas.html",
-        "https://travel.state.gov/content/travel/en/us-visas/visa-information-resources/visa-bulletin.html",
-        
-        # Common USCIS FAQ pages
-        "https://www.uscis.gov/citizenship/learn-about-citizenship/citizenship-and-naturalization/i-am-married-to-a-us-citizen",
-        "https://www.uscis.gov/green-card/after-green-card-granted/international-travel-as-permanent-resident",
-    ]
-    
     all_content = []
     
-    for url in urls:
+    for url in IMMIGRATION_URLS:
         print(f"Scraping: {url}")
         try:
             content = fetch_uscis_page(url)
             if content:
-                # Clean and chunk the content
-                chunks = chunk_text(content, max_tokens=400, overlap=50)
-                
-                for i, chunk in enumerate(chunks):
-                    all_content.append({
-                        "text": chunk,
-                        "source_url": url,
-                        "chunk_id": f"{url}_{i}",
-                        "source_type": "official_immigration"
-                    })
-                
+                chunks = chunk_page(url, content)
+                all_content.extend(chunks)
                 print(f"  -> Created {len(chunks)} chunks")
             else:
                 print(f"  -> No content extracted")
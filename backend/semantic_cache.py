@@ -0,0 +1,109 @@
+# semantic_cache.py - Answer cache keyed on question embeddings
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+import numpy as np
+from metrics import counter, gauge
+
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE", "true").lower() == "true"
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.92"))  # cosine similarity for a hit
+SEMANTIC_CACHE_TTL = float(os.getenv("SEMANTIC_CACHE_TTL", "86400"))  # seconds
+SEMANTIC_CACHE_SIZE = int(os.getenv("SEMANTIC_CACHE_SIZE", "2000"))  # answers
+
+cache_requests = counter(
+    "semantic_cache_requests_total", "Semantic answer cache lookups by result", ("cache", "result")
+)
+cache_evictions = counter(
+    "semantic_cache_evictions_total", "Semantic answer cache evictions by reason", ("cache", "reason")
+)
+cache_entries = gauge("semantic_cache_entries", "Answers held in the semantic cache", ("cache",))
+
+class SemanticCache:
+    """Stores answers by question embedding and serves paraphrases.
+
+    A lookup hits when the cosine similarity to a stored question is at
+    least `threshold` and the entry is younger than `ttl` seconds. Size is
+    bounded by LRU eviction. Embeddings live in one preallocated matrix, so
+    a lookup is a single matrix-vector product.
+    """
+
+    def __init__(self, name: str, dim: int = 384, threshold: float = SEMANTIC_CACHE_THRESHOLD,
+                 ttl: float = SEMANTIC_CACHE_TTL, max_entries: int = SEMANTIC_CACHE_SIZE):
+        self.name = name
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._vectors = np.zeros((max_entries, dim), dtype=np.float32)
+        self._entries: "OrderedDict[int, Dict]" = OrderedDict()  # slot -> entry, LRU order
+        self._free_slots = list(range(max_entries - 1, -1, -1))
+
+    @staticmethod
+    def _normalize(vector) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = float(np.linalg.norm(vector))
+        return vector / norm if norm > 0 else vector
+
+    def _release(self, slot: int, reason: str):
+        del self._entries[slot]
+        self._vectors[slot] = 0.0
+        self._free_slots.append(slot)
+        cache_evictions.inc(cache=self.name, reason=reason)
+
+    def lookup(self, vector) -> Optional[str]:
+        """Cached answer for the closest stored question, or None"""
+        query = self._normalize(vector)
+        with self._lock:
+            if not self._entries:
+                cache_requests.inc(cache=self.name, result="miss")
+                return None
+            similarities = self._vectors @ query
+            slot = int(np.argmax(similarities))
+            entry = self._entries.get(slot)
+            if entry is None or similarities[slot] < self.threshold:
+                cache_requests.inc(cache=self.name, result="miss")
+                return None
+            if time.time() - entry["created_at"] > self.ttl:
+                self._release(slot, "ttl")
+                cache_entries.set(len(self._entries), cache=self.name)
+                cache_requests.inc(cache=self.name, result="miss")
+                return None
+            self._entries.move_to_end(slot)
+            entry["hits"] += 1
+            cache_requests.inc(cache=self.name, result="hit")
+            return entry["answer"]
+
+    def store(self, question: str, vector, answer: str):
+        """Remember the answer to a question, evicting the least recently used entry if full"""
+        normalized = self._normalize(vector)
+        with self._lock:
+            if not self._free_slots:
+                self._release(next(iter(self._entries)), "size")
+            slot = self._free_slots.pop()
+            self._vectors[slot] = normalized
+            self._entries[slot] = {"question": question, "answer": answer, "created_at": time.time(), "hits": 0}
+            cache_entries.set(len(self._entries), cache=self.name)
+
+    def clear(self, reason: str = "invalidate"):
+        with self._lock:
+            for slot in list(self._entries):
+                self._release(slot, reason)
+            cache_entries.set(0, cache=self.name)
+
+    def on_index_version(self, index_version: Optional[str]):
+        """Index listener: answers built from the old index are stale"""
+        if self._entries:
+            print(f"Index version is now {index_version}; clearing {self.name} answer cache")
+        self.clear("index_version")
+
+    def stats(self) -> Dict:
+        hits = cache_requests.value(cache=self.name, result="hit")
+        misses = cache_requests.value(cache=self.name, result="miss")
+        return {
+            "entries": len(self._entries),
+            "hits": int(hits),
+            "misses": int(misses),
+            "hit_rate": round(hits / (hits + misses), 3) if hits + misses else None,
+        }
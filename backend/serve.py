@@ -0,0 +1,198 @@
+# serve.py - Pre-fork multi-worker server: models are loaded once and shared copy-on-write
+#
+#   python serve.py api_production:app --workers 4 --port 8000
+#
+# `uvicorn --workers N` starts N fresh interpreters, each loading its own
+# SentenceTransformer (and in api.py the LLM), so memory grows with every
+# worker. Here the parent imports the app module, calls its preload() hook
+# if it has one (api.py loads the LLM there), freezes the garbage collector
+# and only then forks the workers, which share the loaded weights through
+# copy-on-write pages. Worker memory is what the worker itself allocates
+# (requests, caches, KV caches).
+#
+# Rules for the parent, which everything here follows: load weights but run
+# no inference (torch's thread pools must not exist before fork) and start
+# no threads (threads do not survive fork; startup events run in each worker).
+# This only holds on CPU: loading onto a GPU initializes CUDA, which a forked
+# child cannot use, so on a CUDA host serve.py runs a single worker without
+# forking (run one instance per GPU instead).
+import argparse
+import gc
+import importlib
+import importlib.util
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+from typing import Dict
+
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "0"))  # workers; 0 = one per CPU core
+
+def load_app(target: str):
+    """Import "module:attribute" and run the module's preload() hook"""
+    module_name, _, attribute = target.partition(":")
+    module = importlib.import_module(module_name)
+    preload = getattr(module, "preload", None)
+    if preload is not None:
+        preload()
+    return getattr(module, attribute or "app")
+
+def memory_usage(pid: int) -> Dict[str, float]:
+    """RSS, PSS and shared/private memory of a process in MB (Linux)"""
+    usage = {}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                key, _, value = line.partition(":")
+                if key in ("Rss", "Pss", "Shared_Clean", "Shared_Dirty", "Private_Clean", "Private_Dirty"):
+                    usage[key] = int(value.split()[0]) / 1024
+    except OSError:
+        return {}
+    return {
+        "rss": round(usage.get("Rss", 0.0), 1),
+        "pss": round(usage.get("Pss", 0.0), 1),
+        "shared": round(usage.get("Shared_Clean", 0.0) + usage.get("Shared_Dirty", 0.0), 1),
+        "private": round(usage.get("Private_Clean", 0.0) + usage.get("Private_Dirty", 0.0), 1),
+    }
+
+def cuda_available() -> bool:
+    """Whether torch sees a GPU (checked before any model loads; does not initialize CUDA)"""
+    if importlib.util.find_spec("torch") is None:
+        return False
+    import torch
+    return torch.cuda.is_available()
+
+def run_worker(app, sock: socket.socket, index: int, args):
+    """Worker process body: serve the preloaded app on the shared socket"""
+    import uvicorn
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    os.environ["SERVE_WORKER_INDEX"] = str(index)
+    gc.enable()
+    if args.torch_threads and "torch" in sys.modules:
+        sys.modules["torch"].set_num_threads(args.torch_threads)
+
+    config = uvicorn.Config(app, lifespan="on", log_level=args.log_level, proxy_headers=True,
+                            timeout_keep_alive=args.timeout_keep_alive)
+    uvicorn.Server(config).run(sockets=[sock])
+
+class Supervisor:
+    """Forks the workers, restarts any that die, and stops them all on SIGTERM/SIGINT"""
+
+    def __init__(self, app, sock: socket.socket, args):
+        self.app = app
+        self.sock = sock
+        self.args = args
+        self.workers: Dict[int, int] = {}  # pid -> worker index
+        self.stopping = False
+
+    def spawn(self, index: int):
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                run_worker(self.app, self.sock, index, self.args)
+            except BaseException as e:
+                print(f"[serve] worker {index} crashed: {e}")
+                code = 1
+            finally:
+                os._exit(code)
+        self.workers[pid] = index
+        print(f"[serve] started worker {index} (pid {pid})")
+
+    def stop(self, signum, frame):
+        self.stopping = True
+        for pid in list(self.workers):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def report_memory(self):
+        parent = memory_usage(os.getpid())
+        if not parent:
+            return
+        workers = {index: memory_usage(pid) for pid, index in self.workers.items()}
+        total_pss = parent["pss"] + sum(usage.get("pss", 0.0) for usage in workers.values())
+        print(f"[serve] memory MB: parent {parent}; total PSS {total_pss:.1f}")
+        for index, usage in sorted(workers.items()):
+            print(f"[serve]   worker {index}: {usage}")
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        for index in range(self.args.workers):
+            self.spawn(index)
+
+        next_report = time.monotonic() + self.args.memory_report if self.args.memory_report else None
+        while self.workers:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+            if pid == 0:
+                time.sleep(0.5)
+                if next_report is not None and time.monotonic() >= next_report:
+                    self.report_memory()
+                    next_report = time.monotonic() + self.args.memory_report
+                continue
+            index = self.workers.pop(pid, None)
+            if index is None:
+                continue
+            if not self.stopping:
+                print(f"[serve] worker {index} (pid {pid}) exited with status {status}; restarting")
+                time.sleep(1)  # don't spin if the worker dies at startup
+                self.spawn(index)
+        print("[serve] all workers stopped")
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve an API module with pre-forked workers sharing its models")
+    parser.add_argument("app", help='app to serve, as "module:attribute" (e.g. api_production:app)')
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=None,
+                        help="worker processes (default: WEB_CONCURRENCY, else one per CPU core; 1 on CUDA)")
+    parser.add_argument("--torch-threads", type=int, default=0,
+                        help="torch threads per worker (default: CPU cores / workers)")
+    parser.add_argument("--log-level", default="info")
+    parser.add_argument("--timeout-keep-alive", type=int, default=5)
+    parser.add_argument("--memory-report", type=float, default=0,
+                        help="print per-process RSS/PSS every this many seconds (0 disables)")
+    args = parser.parse_args()
+    cuda = cuda_available()
+    if args.workers is None:
+        args.workers = 1 if cuda else WEB_CONCURRENCY or os.cpu_count() or 1
+    if cuda and args.workers > 1:
+        parser.error(f"--workers {args.workers}: CUDA cannot be used in forked workers, so the models cannot "
+                     "be shared on a GPU host; run one serve.py (or uvicorn) instance per GPU with --workers 1")
+    if not args.torch_threads:
+        args.torch_threads = max(1, (os.cpu_count() or 1) // args.workers)
+
+    # Objects created while loading stay out of the collector's young generations,
+    # and freezing them keeps collections in the workers from writing to their pages
+    gc.disable()
+    os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    app = load_app(args.app)
+    gc.collect()
+    gc.freeze()
+
+    extra_threads = [thread.name for thread in threading.enumerate() if thread is not threading.main_thread()]
+    if extra_threads:
+        print(f"[serve] warning: threads running before fork will not exist in the workers: {extra_threads}")
+
+    sock = socket.socket(socket.AF_INET6 if ":" in args.host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((args.host, args.port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    if cuda:
+        # Models are already on the GPU in this process; serve here instead of in a forked child
+        print(f"[serve] {args.app} loaded on CUDA; serving in-process on {args.host}:{args.port}")
+        run_worker(app, sock, 0, args)
+        return
+    print(f"[serve] {args.app} loaded; forking {args.workers} workers on {args.host}:{args.port} "
+          f"({args.torch_threads} torch threads each)")
+    Supervisor(app, sock, args).run()
+
+if __name__ == "__main__":
+    main()
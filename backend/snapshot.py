@@ -0,0 +1,306 @@
+# snapshot.py - Versioned index snapshots for fast cold start
+#
+# A snapshot is a directory holding everything needed to serve without
+# re-scraping or re-embedding:
+#
+#   manifest.json      format/index version, collection info, file checksums
+#   vectors.f32        raw little-endian float32 vectors, one row per point
+#   payloads.jsonl     one {"id": ..., "payload": {...}} line per row
+#   lexical_index.pkl  the BM25 index (when one was built)
+#
+# The bundle is independent of the Qdrant server version and collection
+# profile, so it can be restored into any QDRANT_PROFILE.
+import argparse
+import hashlib
+import json
+import mmap
+import os
+import shutil
+import sys
+import time
+from array import array
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+from embeddings import (
+    EMBED_MODEL_NAME, QDRANT_PROFILE, get_qdrant_client, ensure_collection, versioned_collection_name,
+    swap_collection_alias, resolve_index_version
+)
+from lexical_index import LEXICAL_INDEX_PATH, LexicalIndex, set_lexical_index
+from knowledge_base import build_manifest, write_manifest
+
+SNAPSHOT_DIR = os.getenv("SNAPSHOT_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "snapshots"))
+SNAPSHOT_FORMAT_VERSION = 1
+LATEST_POINTER = "LATEST"
+
+MANIFEST_FILE = "manifest.json"
+VECTORS_FILE = "vectors.f32"
+PAYLOADS_FILE = "payloads.jsonl"
+LEXICAL_FILE = "lexical_index.pkl"
+
+def _file_digest(path: str) -> Dict:
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            sha256.update(block)
+    return {"sha256": sha256.hexdigest(), "bytes": os.path.getsize(path)}
+
+def create_snapshot(collection_name: str = "immigration_docs", snapshot_dir: str = SNAPSHOT_DIR,
+                    lexical_index_path: str = LEXICAL_INDEX_PATH, index_version: str = None) -> Optional[str]:
+    """Export the collection (and lexical index) into a new snapshot directory.
+
+    The snapshot takes the given index version (as assigned by an ingestion
+    job), or a new one derived from the creation time and corpus hash.
+    """
+    qdrant = get_qdrant_client()
+    os.makedirs(snapshot_dir, exist_ok=True)
+
+    created_at = datetime.now(timezone.utc)
+    staging = os.path.join(snapshot_dir, f".staging-{os.getpid()}-{int(time.time())}")
+    os.makedirs(staging)
+
+    try:
+        print(f"Exporting collection '{collection_name}'...")
+        dim = None
+        point_count = 0
+        corpus_hash = hashlib.sha256()
+        with open(os.path.join(staging, VECTORS_FILE), "wb") as vectors_file, \
+                open(os.path.join(staging, PAYLOADS_FILE), "w", encoding="utf-8") as payloads_file:
+            offset = None
+            while True:
+                points, offset = qdrant.scroll(
+                    collection_name=collection_name,
+                    limit=256,
+                    offset=offset,
+                    with_payload=True,
+                    with_vectors=True
+                )
+                for point in points:
+                    vector = array("f", point.vector)
+                    if dim is None:
+                        dim = len(vector)
+                    if sys.byteorder != "little":
+                        vector.byteswap()
+                    vector.tofile(vectors_file)
+                    line = json.dumps({"id": point.id, "payload": point.payload}, ensure_ascii=False)
+                    payloads_file.write(line + "\n")
+                    corpus_hash.update(line.encode("utf-8"))
+                    point_count += 1
+                if offset is None:
+                    break
+
+        if point_count == 0:
+            print("Collection is empty, nothing to snapshot")
+            shutil.rmtree(staging)
+            return None
+
+        if os.path.exists(lexical_index_path):
+            shutil.copyfile(lexical_index_path, os.path.join(staging, LEXICAL_FILE))
+
+        corpus_digest = corpus_hash.hexdigest()
+        index_version = index_version or f"{created_at:%Y%m%d%H%M%S}-{corpus_digest[:8]}"
+        files = {
+            name: _file_digest(os.path.join(staging, name))
+            for name in (VECTORS_FILE, PAYLOADS_FILE, LEXICAL_FILE)
+            if os.path.exists(os.path.join(staging, name))
+        }
+        manifest = {
+            "format_version": SNAPSHOT_FORMAT_VERSION,
+            "index_version": index_version,
+            "created_at": created_at.isoformat(),
+            "collection": collection_name,
+            "points": point_count,
+            "dim": dim,
+            "distance": "cosine",
+            "embedding_model": EMBED_MODEL_NAME,
+            "corpus_sha256": corpus_digest,
+            "files": files,
+        }
+        with open(os.path.join(staging, MANIFEST_FILE), "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2)
+
+        # Publish the directory, then the pointer, so readers never see a partial snapshot
+        final_path = os.path.join(snapshot_dir, index_version)
+        if os.path.exists(final_path):
+            shutil.rmtree(final_path)
+        os.replace(staging, final_path)
+        pointer_tmp = os.path.join(snapshot_dir, f"{LATEST_POINTER}.tmp")
+        with open(pointer_tmp, "w", encoding="utf-8") as f:
+            f.write(index_version)
+        os.replace(pointer_tmp, os.path.join(snapshot_dir, LATEST_POINTER))
+
+        print(f"Snapshot {index_version} created with {point_count} points at {final_path}")
+        return final_path
+    except Exception:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+
+def read_manifest(path: str) -> Dict:
+    with open(os.path.join(path, MANIFEST_FILE), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def verify_snapshot(path: str) -> bool:
+    """Check format version, embedding model, file sizes and checksums"""
+    try:
+        manifest = read_manifest(path)
+    except Exception as e:
+        print(f"Snapshot {path}: unreadable manifest ({e})")
+        return False
+
+    if manifest.get("format_version") != SNAPSHOT_FORMAT_VERSION:
+        print(f"Snapshot {path}: unsupported format version {manifest.get('format_version')}")
+        return False
+    if manifest.get("embedding_model") != EMBED_MODEL_NAME:
+        print(f"Snapshot {path}: built with {manifest.get('embedding_model')}, expected {EMBED_MODEL_NAME}")
+        return False
+    for name in (VECTORS_FILE, PAYLOADS_FILE):
+        if name not in manifest.get("files", {}):
+            print(f"Snapshot {path}: manifest is missing {name}")
+            return False
+    if manifest["files"][VECTORS_FILE]["bytes"] != manifest["points"] * manifest["dim"] * 4:
+        print(f"Snapshot {path}: vector file size does not match {manifest['points']}x{manifest['dim']}")
+        return False
+
+    for name, expected in manifest["files"].items():
+        file_path = os.path.join(path, name)
+        if not os.path.exists(file_path):
+            print(f"Snapshot {path}: {name} is missing")
+            return False
+        if _file_digest(file_path) != expected:
+            print(f"Snapshot {path}: {name} failed its integrity check")
+            return False
+    return True
+
+def list_snapshots(snapshot_dir: str = SNAPSHOT_DIR) -> List[str]:
+    """Snapshot directories, oldest first (index versions sort by creation time)"""
+    if not os.path.isdir(snapshot_dir):
+        return []
+    return sorted(
+        os.path.join(snapshot_dir, name) for name in os.listdir(snapshot_dir)
+        if not name.startswith(".") and os.path.exists(os.path.join(snapshot_dir, name, MANIFEST_FILE))
+    )
+
+def latest_snapshot(snapshot_dir: str = SNAPSHOT_DIR) -> Optional[str]:
+    """Path of the snapshot named by the LATEST pointer (or the newest one)"""
+    pointer = os.path.join(snapshot_dir, LATEST_POINTER)
+    if os.path.exists(pointer):
+        with open(pointer, "r", encoding="utf-8") as f:
+            path = os.path.join(snapshot_dir, f.read().strip())
+        if os.path.exists(os.path.join(path, MANIFEST_FILE)):
+            return path
+    snapshots = list_snapshots(snapshot_dir)
+    return snapshots[-1] if snapshots else None
+
+def restore_snapshot(path: str = None, collection_name: str = "immigration_docs", profile: str = None,
+                     lexical_index_path: str = LEXICAL_INDEX_PATH, batch_size: int = 512) -> Optional[Dict]:
+    """Load a verified snapshot behind the collection alias and install its lexical index.
+
+    Vectors are read straight from the memory-mapped bundle, so no embedding
+    work happens. The points go into a versioned collection and the alias is
+    swapped only once it is complete. Returns the manifest (marked
+    "already_served" when the alias already serves that version, which is
+    left untouched), or None if nothing was restored.
+    """
+    path = path or latest_snapshot()
+    if path is None:
+        print("No snapshot available to restore")
+        return None
+    if not verify_snapshot(path):
+        return None
+
+    manifest = read_manifest(path)
+    dim = manifest["dim"]
+    start = time.time()
+    target = versioned_collection_name(collection_name, manifest["index_version"])
+    qdrant = get_qdrant_client()
+    # Ingestion snapshots the version it just put behind the alias, so the
+    # target may be the collection being served; never drop that one
+    if resolve_index_version(collection_name) == manifest["index_version"]:
+        try:
+            served = qdrant.get_collection(target).points_count or 0
+        except Exception:
+            served = 0
+        if served > 0:
+            print(f"Snapshot {manifest['index_version']} is already being served, nothing to restore")
+            return dict(manifest, already_served=True)
+
+    print(f"Restoring snapshot {manifest['index_version']} into '{target}' "
+          f"({profile or QDRANT_PROFILE} profile)...")
+    # Not being served (checked above): a leftover from an earlier attempt, or an empty collection
+    qdrant.delete_collection(target)
+    ensure_collection(target, dim, profile=profile)
+
+    with open(os.path.join(path, PAYLOADS_FILE), "r", encoding="utf-8") as f:
+        rows = [json.loads(line) for line in f]
+
+    with open(os.path.join(path, VECTORS_FILE), "rb") as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            vectors = memoryview(mapped).cast("f")
+            try:
+                qdrant.upload_collection(
+                    collection_name=target,
+                    vectors=(vectors[i * dim:(i + 1) * dim].tolist() for i in range(len(rows))),
+                    payload=(row["payload"] for row in rows),
+                    ids=(row["id"] for row in rows),
+                    batch_size=batch_size,
+                    wait=True
+                )
+            finally:
+                vectors.release()
+
+    # The BM25 index and manifest are published only after the alias swap, so
+    # a failed swap leaves them describing the collection still being served
+    lexical_path = os.path.join(path, LEXICAL_FILE)
+    staged_path = f"{lexical_index_path}.{manifest['index_version']}"
+    lexical_index = None
+    if os.path.exists(lexical_path):
+        shutil.copyfile(lexical_path, staged_path)
+        lexical_index = LexicalIndex.load(staged_path)
+
+    try:
+        swap_collection_alias(collection_name, target, manifest["index_version"])
+    except Exception:
+        if lexical_index is not None:
+            os.remove(staged_path)
+        raise
+    if lexical_index is not None:
+        os.replace(staged_path, lexical_index_path)
+        set_lexical_index(lexical_index)
+    write_manifest(build_manifest([row["payload"] for row in rows], manifest["index_version"],
+                                  ingested_at=manifest["created_at"]))
+
+    print(f"Restored {len(rows)} points in {time.time() - start:.1f}s")
+    return manifest
+
+def main():
+    parser = argparse.ArgumentParser(description="Create, verify and restore index snapshots")
+    parser.add_argument("--dir", default=SNAPSHOT_DIR, help="snapshot directory")
+    parser.add_argument("--collection", default="immigration_docs")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("create", help="snapshot the current collection and lexical index")
+    subparsers.add_parser("list", help="list snapshots")
+    verify_parser = subparsers.add_parser("verify", help="check a snapshot's integrity")
+    verify_parser.add_argument("path", nargs="?", help="snapshot path (defaults to the latest)")
+    restore_parser = subparsers.add_parser("restore", help="restore a snapshot into Qdrant")
+    restore_parser.add_argument("path", nargs="?", help="snapshot path (defaults to the latest)")
+    restore_parser.add_argument("--profile", default=None, help="collection profile to restore into")
+    args = parser.parse_args()
+
+    if args.command == "create":
+        sys.exit(0 if create_snapshot(args.collection, args.dir) else 1)
+    elif args.command == "list":
+        latest = latest_snapshot(args.dir)
+        for path in list_snapshots(args.dir):
+            manifest = read_manifest(path)
+            marker = " (latest)" if path == latest else ""
+            print(f"{manifest['index_version']}  {manifest['points']} points  {manifest['created_at']}{marker}")
+    elif args.command == "verify":
+        path = args.path or latest_snapshot(args.dir)
+        ok = path is not None and verify_snapshot(path)
+        print(f"{path}: {'OK' if ok else 'FAILED'}")
+        sys.exit(0 if ok else 1)
+    elif args.command == "restore":
+        path = args.path or latest_snapshot(args.dir)
+        sys.exit(0 if restore_snapshot(path, args.collection, args.profile) else 1)
+
+if __name__ == "__main__":
+    main()
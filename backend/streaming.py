@@ -0,0 +1,138 @@
+# streaming.py - Async Server-Sent Events streaming shared by the API modules
+#
+# Handlers produce plain text pieces (async or sync iterables); sse_response
+# frames them as SSE events. Nothing here blocks a thread: pacing uses
+# asyncio.sleep, so any number of streams share the event loop. Pieces that
+# arrive close together are coalesced into one event (bounded by a time
+# window and a byte size), and a comment line is sent when a stream has been
+# quiet for a while so proxies and load balancers keep the connection open.
+import asyncio
+import os
+import re
+from typing import AsyncIterator, Iterable, List, Union
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import iterate_in_threadpool
+from metrics import gauge, histogram
+
+SSE_COALESCE_MS = float(os.getenv("SSE_COALESCE_MS", "40"))  # max time a piece waits for others; 0 disables
+SSE_COALESCE_BYTES = int(os.getenv("SSE_COALESCE_BYTES", "512"))  # flush early once this much is buffered
+SSE_HEARTBEAT_SECONDS = float(os.getenv("SSE_HEARTBEAT_SECONDS", "15"))  # 0 disables
+SSE_WORD_DELAY = float(os.getenv("SSE_WORD_DELAY", "0.02"))  # typing effect for canned answers; 0 disables
+
+SSE_HEARTBEAT = ": keep-alive\n\n"
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "X-Accel-Buffering": "no",  # stop nginx from buffering the stream
+}
+
+sse_first_event_seconds = histogram(
+    "sse_time_to_first_event_seconds", "Time from the start of a stream to its first data event"
+)
+sse_stream_seconds = histogram("sse_stream_duration_seconds", "Lifetime of SSE streams, including abandoned ones")
+sse_streams_open = gauge("sse_streams_open", "SSE streams currently being sent")
+
+WORD_RE = re.compile(r"\S+\s*")
+
+_END = object()
+
+def sse_event(data: str) -> str:
+    """Frame text as one SSE event. Each line gets its own data: field, which
+    clients join back together with newlines."""
+    lines = data.replace("\r\n", "\n").replace("\r", "\n").split("\n")
+    return "".join(f"data: {line}\n" for line in lines) + "\n"
+
+def split_words(text: str) -> List[str]:
+    """Words with their trailing whitespace (newlines included), so joining them restores the text"""
+    return WORD_RE.findall(text)
+
+async def paced_words(text: str, delay: float = SSE_WORD_DELAY) -> AsyncIterator[str]:
+    """Yield a prepared answer word by word, sleeping (without blocking) between words"""
+    for word in split_words(text):
+        yield word
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+def _aiter(chunks: Union[AsyncIterator[str], Iterable[str]]) -> AsyncIterator[str]:
+    if hasattr(chunks, "__aiter__"):
+        return chunks.__aiter__()
+    return iterate_in_threadpool(iter(chunks))
+
+async def sse_stream(chunks: Union[AsyncIterator[str], Iterable[str]], coalesce_ms: float = SSE_COALESCE_MS,
+                     coalesce_bytes: int = SSE_COALESCE_BYTES,
+                     heartbeat: float = SSE_HEARTBEAT_SECONDS) -> AsyncIterator[str]:
+    """SSE-framed stream of the text pieces in `chunks`.
+
+    The source runs in its own task feeding a small queue, so waiting for the
+    coalescing window or a heartbeat never cancels the source mid-step. When
+    the client goes away the source is cancelled, so its cleanup runs.
+    """
+    queue: asyncio.Queue = asyncio.Queue(maxsize=64)
+
+    async def produce():
+        source = _aiter(chunks)
+        try:
+            async for chunk in source:
+                await queue.put(chunk)
+            await queue.put(_END)
+        except Exception as e:
+            await queue.put(e)
+        finally:
+            # Close the source now rather than at garbage collection, so its cleanup runs promptly
+            if hasattr(source, "aclose"):
+                await source.aclose()
+
+    producer = asyncio.ensure_future(produce())
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    first_event_sent = False
+    buffer: List[str] = []
+    buffered_bytes = 0
+    flush_at = 0.0
+
+    def flush() -> str:
+        nonlocal buffer, buffered_bytes, first_event_sent
+        if not first_event_sent:
+            sse_first_event_seconds.observe(loop.time() - started)
+            first_event_sent = True
+        event = sse_event("".join(buffer))
+        buffer, buffered_bytes = [], 0
+        return event
+
+    sse_streams_open.inc()
+    try:
+        while True:
+            if buffer:
+                timeout = max(0.0, flush_at - loop.time())
+            else:
+                timeout = heartbeat if heartbeat > 0 else None
+            try:
+                item = await asyncio.wait_for(queue.get(), timeout)
+            except asyncio.TimeoutError:
+                if buffer:
+                    yield flush()
+                else:
+                    yield SSE_HEARTBEAT
+                continue
+
+            if item is _END:
+                break
+            if isinstance(item, Exception):
+                raise item
+            if not item:
+                continue
+            if not buffer:
+                flush_at = loop.time() + coalesce_ms / 1000.0
+            buffer.append(item)
+            buffered_bytes += len(item.encode("utf-8"))
+            if coalesce_ms <= 0 or buffered_bytes >= coalesce_bytes:
+                yield flush()
+        if buffer:
+            yield flush()
+    finally:
+        producer.cancel()
+        sse_streams_open.dec()
+        sse_stream_seconds.observe(loop.time() - started)
+
+def sse_response(chunks: Union[AsyncIterator[str], Iterable[str]], **kwargs) -> StreamingResponse:
+    """StreamingResponse that sends `chunks` as Server-Sent Events (see sse_stream for options)"""
+    return StreamingResponse(sse_stream(chunks, **kwargs), media_type="text/event-stream", headers=SSE_HEADERS)
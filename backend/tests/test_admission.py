@@ -0,0 +1,86 @@
+import asyncio
+import httpx
+import pytest
+from fastapi import FastAPI, HTTPException
+from admission import AdmissionController
+
+def controller(max_concurrent=1, max_queue=1, queue_timeout=0.2):
+    return AdmissionController("/test", max_concurrent, max_queue, queue_timeout, enabled=True)
+
+def test_full_queue_is_rejected_with_429_and_retry_after():
+    async def run():
+        limiter = controller(max_queue=1)
+        slot = await limiter.admit()
+        waiting = asyncio.ensure_future(limiter.admit())
+        await asyncio.sleep(0)
+        with pytest.raises(HTTPException) as rejected:
+            await limiter.admit()
+        slot.release()
+        (await waiting).release()
+        return rejected.value
+
+    error = asyncio.run(run())
+    assert error.status_code == 429
+    assert int(error.headers["Retry-After"]) >= 1
+
+def test_wait_past_the_deadline_is_rejected_with_503():
+    async def run():
+        limiter = controller(queue_timeout=0.05)
+        slot = await limiter.admit()
+        with pytest.raises(HTTPException) as timed_out:
+            await limiter.admit()
+        slot.release()
+        return timed_out.value, limiter.stats()
+
+    error, stats = asyncio.run(run())
+    assert error.status_code == 503
+    assert "Retry-After" in error.headers
+    assert stats["in_flight"] == 0 and stats["queued"] == 0
+
+def test_released_slot_goes_to_the_oldest_waiter():
+    async def run():
+        limiter = controller(max_queue=2, queue_timeout=1)
+        slot = await limiter.admit()
+        order = []
+
+        async def wait(name):
+            admitted = await limiter.admit()
+            order.append(name)
+            admitted.release()
+
+        waiters = [asyncio.ensure_future(wait("first")), asyncio.ensure_future(wait("second"))]
+        await asyncio.sleep(0)
+        slot.release()
+        await asyncio.gather(*waiters)
+        return order, limiter.stats()
+
+    order, stats = asyncio.run(run())
+    assert order == ["first", "second"]
+    assert stats["in_flight"] == 0
+
+def test_route_over_capacity_answers_429_with_retry_after():
+    limiter = controller(max_queue=0)
+    app = FastAPI()
+    release = asyncio.Event()
+
+    @app.get("/slow")
+    @limiter.limit
+    async def slow():
+        await release.wait()
+        return {"ok": True}
+
+    async def run():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            first = asyncio.ensure_future(client.get("/slow"))
+            while limiter.stats()["in_flight"] == 0:
+                await asyncio.sleep(0.01)
+            rejected = await client.get("/slow")
+            release.set()
+            return (await first), rejected
+
+    admitted, rejected = asyncio.run(run())
+    assert admitted.status_code == 200
+    assert rejected.status_code == 429
+    assert int(rejected.headers["retry-after"]) >= 1
+    assert limiter.stats()["in_flight"] == 0
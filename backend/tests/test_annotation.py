@@ -0,0 +1,9 @@
+from annotation import annotate_text, tagged_sentences
+
+def test_visa_classes_are_not_forms():
+    text = "H-1B and F-1 and EB-5 visas, also B-2 visitors. File I-485 with Form DS-260 or ETA-9089."
+    assert annotate_text(text)["forms"] == ["DS-260", "ETA-9089", "I-485"]
+
+def test_form_tag_needs_a_form_number():
+    chunk = {"text": "Students need an F-1 visa. Submit Form N-400 online."}
+    assert tagged_sentences(chunk, "form") == ["Submit Form N-400 online."]
@@ -0,0 +1,52 @@
+import asyncio
+import torch
+from benchmark_api import load_stub_llm
+from generation import GenerationScheduler
+
+PROMPTS = ["How do I apply?", "What does Form I-130 cost for a spouse abroad?", "H-1B"]
+
+def reference(model, tokenizer, prompt: str, max_new_tokens: int):
+    """Greedy continuation of one unpadded prompt with model.generate"""
+    input_ids = torch.tensor([tokenizer.encode(prompt)])
+    with torch.inference_mode():
+        output = model.generate(input_ids, attention_mask=torch.ones_like(input_ids), do_sample=False,
+                                max_new_tokens=max_new_tokens, pad_token_id=tokenizer.pad_token_id)
+    generated = output[0, input_ids.shape[1]:].tolist()
+    return generated[:generated.index(0) + 1] if 0 in generated else generated
+
+def run_batch(scheduler: GenerationScheduler, prompts, max_new_tokens: int):
+    async def run():
+        loop = asyncio.get_running_loop()
+        requests = [scheduler.submit(prompt, loop, max_new_tokens=max_new_tokens, temperature=0.0)
+                    for prompt in prompts]
+        for request in requests:
+            async for _ in request.stream():
+                pass
+        return [request.generated for request in requests]
+    return asyncio.run(run())
+
+def test_batched_left_padded_decoding_matches_generate():
+    model, tokenizer = load_stub_llm(seed=1)
+    scheduler = GenerationScheduler(model, tokenizer, max_batch_size=len(PROMPTS))
+    scheduler.start()
+    try:
+        # Prompts of different lengths share one left-padded batch
+        generated = run_batch(scheduler, PROMPTS, max_new_tokens=16)
+    finally:
+        scheduler.stop()
+    for prompt, tokens in zip(PROMPTS, generated):
+        assert tokens == reference(model, tokenizer, prompt, 16), prompt
+
+def test_cached_prefix_does_not_change_the_output():
+    model, tokenizer = load_stub_llm(seed=2)
+    prefix = "You are an immigration assistant. Answer briefly.\n"
+    scheduler = GenerationScheduler(model, tokenizer, max_batch_size=2, prefix_cache_tokens=4096)
+    scheduler.register_prefix(prefix)
+    scheduler.start()
+    try:
+        first = run_batch(scheduler, [[prefix, "How do I renew a green card?"]], max_new_tokens=12)
+        second = run_batch(scheduler, [[prefix, "How do I renew a green card?"]], max_new_tokens=12)
+    finally:
+        scheduler.stop()
+    assert scheduler.prefix_cache.stats()["hits"] >= 1
+    assert first == second == [reference(model, tokenizer, prefix + "How do I renew a green card?", 12)]
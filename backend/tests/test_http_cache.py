@@ -0,0 +1,62 @@
+import gzip
+import json
+import types
+import zlib
+from starlette.requests import Request
+import http_cache
+from http_cache import PrecomputedResponse
+
+CONTENT = {"recommended_path": "Family-Based Green Card", "next_steps": ["File Form I-130"] * 20}
+
+def request(**headers) -> Request:
+    raw = [(name.replace("_", "-").encode(), value.encode()) for name, value in headers.items()]
+    return Request({"type": "http", "method": "GET", "path": "/get-guidance", "headers": raw})
+
+def test_identity_without_accept_encoding():
+    response = PrecomputedResponse(CONTENT).respond(request())
+    assert response.status_code == 200
+    assert "content-encoding" not in response.headers
+    assert json.loads(response.body) == CONTENT
+    assert response.headers["cache-control"].startswith("public, max-age=")
+    assert response.headers["vary"] == "Accept-Encoding"
+
+def test_gzip_is_negotiated_and_decodes_to_the_same_json():
+    response = PrecomputedResponse(CONTENT).respond(request(accept_encoding="deflate, gzip;q=0.8"))
+    assert response.headers["content-encoding"] == "gzip"
+    assert json.loads(gzip.decompress(response.body)) == CONTENT
+
+def test_refused_and_unknown_encodings_fall_back_to_identity():
+    cached = PrecomputedResponse(CONTENT)
+    assert "content-encoding" not in cached.respond(request(accept_encoding="gzip;q=0")).headers
+    assert "content-encoding" not in cached.respond(request(accept_encoding="deflate")).headers
+    assert cached.respond(request(accept_encoding="*")).headers["content-encoding"] == "gzip"
+
+def test_br_is_preferred_when_available(monkeypatch):
+    # Any compressor will do for negotiation; the real one is optional
+    monkeypatch.setattr(http_cache, "brotli", types.SimpleNamespace(compress=lambda body, quality: zlib.compress(body)))
+    cached = PrecomputedResponse(CONTENT)
+    assert cached.respond(request(accept_encoding="gzip, br")).headers["content-encoding"] == "br"
+    assert cached.respond(request(accept_encoding="gzip, br;q=0")).headers["content-encoding"] == "gzip"
+    assert len(cached.etags) == 3
+
+def test_matching_etag_gets_304_for_any_representation():
+    cached = PrecomputedResponse(CONTENT)
+    gzip_etag = cached.respond(request(accept_encoding="gzip")).headers["etag"]
+    identity_etag = cached.respond(request()).headers["etag"]
+    assert gzip_etag != identity_etag
+
+    not_modified = cached.respond(request(accept_encoding="gzip", if_none_match=gzip_etag))
+    assert not_modified.status_code == 304
+    assert not_modified.body == b""
+    assert not_modified.headers["etag"] == gzip_etag
+    assert cached.respond(request(if_none_match=f'"other", W/{identity_etag}')).status_code == 304
+    assert cached.respond(request(if_none_match="*")).status_code == 304
+
+def test_stale_etag_gets_the_full_body():
+    old = PrecomputedResponse({"recommended_path": "old"}).respond(request()).headers["etag"]
+    response = PrecomputedResponse(CONTENT).respond(request(if_none_match=old))
+    assert response.status_code == 200
+    assert json.loads(response.body) == CONTENT
+
+def test_small_bodies_are_not_compressed():
+    assert list(PrecomputedResponse({"a": 1}).size()) == ["identity"]
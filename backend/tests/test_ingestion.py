@@ -0,0 +1,30 @@
+from ingestion import IngestionJob, STAGE_WEIGHTS
+
+def test_interleaved_stages_are_not_completed_by_switching():
+    job = IngestionJob("full")
+    job.status = "running"
+    job.skip_stages("scrape", "chunk")
+    job.update("annotate", 400, 400)
+    job.set_stage("embed", total=400)
+
+    # index_documents reports embed and upsert alternately, once per batch
+    job.update("embed", 100, 400)
+    job.update("upsert", 100, 400)
+    job.update("embed", 200, 400)
+    job.update("upsert", 200, 400)
+
+    finished = STAGE_WEIGHTS["scrape"] + STAGE_WEIGHTS["chunk"] + STAGE_WEIGHTS["annotate"]
+    expected = finished + (STAGE_WEIGHTS["embed"] + STAGE_WEIGHTS["upsert"]) / 2
+    assert abs(job.progress() - expected) < 1e-9
+    assert job.to_dict()["stage_progress"] == {"done": 200, "total": 400}
+
+    job.update("embed", 400, 400)
+    job.update("upsert", 400, 400)
+    assert abs(job.progress() - (finished + STAGE_WEIGHTS["embed"] + STAGE_WEIGHTS["upsert"])) < 1e-9
+
+def test_progress_is_capped_until_the_job_succeeds():
+    job = IngestionJob("full")
+    job.skip_stages(*STAGE_WEIGHTS)
+    assert job.progress() == 0.99
+    job.status = "succeeded"
+    assert job.progress() == 1.0
@@ -0,0 +1,34 @@
+import pytest
+from intents import IntentRouter, load_intent_rules, load_intent_router
+
+RULES = [
+    {"intent": "h1b", "keywords": ["h1b", "h-1b", "specialty occupation"]},
+    {"intent": "cost", "keywords": ["fee", "how much"]},
+    {"intent": "timeline", "keywords": ["time", "how long"]},
+]
+
+def test_earlier_intent_wins_wherever_it_appears():
+    router = IntentRouter(RULES)
+    assert router.match("How long does it take and what is the fee?") == "cost"
+    assert router.match("What fee applies to a specialty occupation petition?") == "h1b"
+    assert router.match("How much time?") == "cost"
+
+def test_keywords_match_whole_words_and_phrases_only():
+    router = IntentRouter(RULES)
+    assert router.match("Sometimes I wonder") is None
+    assert router.match("How is this processed?") is None
+    assert router.match("how LONG will it be") == "timeline"
+    assert router.match("Is H-1B possible?") == "h1b"
+
+def test_empty_keyword_is_rejected():
+    with pytest.raises(ValueError):
+        IntentRouter([{"intent": "broken", "keywords": ["--"]}])
+
+def test_shipped_rules_load_and_can_be_restricted():
+    names = [rule["intent"] for rule in load_intent_rules()]
+    assert len(load_intent_router()) == len(names)
+    router = load_intent_router(only=["cost", "timeline"])
+    assert router.intents == [name for name in names if name in ("cost", "timeline")]
+    assert router.match("What are the fees for an H-1B?") == "cost"
+    with pytest.raises(ValueError):
+        load_intent_router(only=["no_such_intent"])
@@ -0,0 +1,65 @@
+import math
+from collections import Counter
+from lexical_index import BM25_B, BM25_K1, LexicalIndex, tokenize
+
+CHUNKS = [
+    {"text": "File Form I-130 to petition for a relative. The I-130 fee is $675.", "chunk_id": "i130"},
+    {"text": "An H-1B visa needs a specialty occupation and an employer petition.", "chunk_id": "h1b"},
+    {"text": "Visa interviews happen at the consulate. Bring your visa appointment letter.", "chunk_id": "interview"},
+    {"text": "Naturalization uses Form N-400. Most applicants need five years as a resident.", "chunk_id": "n400"},
+    {"text": "A student visa requires admission to a school and proof of funds for the visa.", "chunk_id": "student"},
+]
+
+def reference_scores(query: str):
+    """Textbook BM25 over CHUNKS, for comparison"""
+    docs = [tokenize(chunk["text"]) for chunk in CHUNKS]
+    avg_length = sum(len(doc) for doc in docs) / len(docs)
+    scores = {}
+    for doc_id, doc in enumerate(docs):
+        tfs = Counter(doc)
+        score = 0.0
+        for term in set(tokenize(query)):
+            df = sum(1 for other in docs if term in other)
+            if not df or not tfs[term]:
+                continue
+            idf = math.log(1 + (len(docs) - df + 0.5) / (df + 0.5))
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * len(doc) / avg_length)
+            score += idf * tfs[term] * (BM25_K1 + 1) / (tfs[term] + norm)
+        if score:
+            scores[doc_id] = score
+    return scores
+
+def test_scores_and_ranking_match_bm25():
+    index = LexicalIndex.build(CHUNKS)
+    query = "visa petition for a specialty occupation"
+    expected = reference_scores(query)
+    hits = index.search(query, limit=len(CHUNKS))
+    assert [doc_id for doc_id, _ in hits] == sorted(expected, key=expected.get, reverse=True)
+    for doc_id, score in hits:
+        assert abs(score - expected[doc_id]) < 1e-4
+    assert index.docs[hits[0][0]]["chunk_id"] == "h1b"
+
+def test_identifiers_match_with_or_without_hyphen():
+    index = LexicalIndex.build(CHUNKS)
+    for query in ("I-130", "i130", "form I130 fee"):
+        assert index.docs[index.search(query, limit=1)[0][0]]["chunk_id"] == "i130"
+
+def test_exhausted_budget_still_scores_the_rarest_term():
+    index = LexicalIndex.build(CHUNKS)
+    # "visa" is in three chunks, "n-400" in one; with no budget left only the rarest term counts
+    hits = index.search("visa N-400", limit=5, budget_ms=0)
+    assert [index.docs[doc_id]["chunk_id"] for doc_id, _ in hits] == ["n400"]
+    assert len(index.search("visa N-400", limit=5)) == 4
+
+def test_limit_and_unknown_terms():
+    index = LexicalIndex.build(CHUNKS)
+    assert len(index.search("visa", limit=2)) == 2
+    assert index.search("asylum") == []
+
+def test_save_and_load_round_trip(tmp_path):
+    index = LexicalIndex.build(CHUNKS)
+    path = str(tmp_path / "lexical_index.pkl")
+    index.save(path)
+    loaded = LexicalIndex.load(path)
+    assert loaded.search("student visa funds") == index.search("student visa funds")
+    assert LexicalIndex.load(str(tmp_path / "missing.pkl")) is None
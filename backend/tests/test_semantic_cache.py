@@ -0,0 +1,41 @@
+import numpy as np
+import semantic_cache
+from semantic_cache import SemanticCache
+
+def unit(*values):
+    vector = np.zeros(8, dtype=np.float32)
+    vector[:len(values)] = values
+    return vector
+
+def test_paraphrase_hits_and_unrelated_question_misses():
+    cache = SemanticCache("test_paraphrase", dim=8, threshold=0.9)
+    cache.store("How much does an H-1B cost?", unit(1, 0.1), "About $2,000.")
+    assert cache.lookup(unit(1, 0.15) * 3) == "About $2,000."  # scale does not matter
+    assert cache.lookup(unit(0, 1)) is None
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+def test_least_recently_used_entry_is_evicted():
+    cache = SemanticCache("test_lru", dim=8, threshold=0.99, max_entries=2)
+    cache.store("a", unit(1), "A")
+    cache.store("b", unit(0, 1), "B")
+    assert cache.lookup(unit(1)) == "A"  # "b" is now the oldest
+    cache.store("c", unit(0, 0, 1), "C")
+    assert cache.lookup(unit(0, 1)) is None
+    assert cache.lookup(unit(1)) == "A"
+    assert cache.lookup(unit(0, 0, 1)) == "C"
+
+def test_expired_entries_miss_and_free_their_slot(monkeypatch):
+    cache = SemanticCache("test_ttl", dim=8, threshold=0.99, ttl=60, max_entries=1)
+    now = 1_000_000.0
+    monkeypatch.setattr(semantic_cache.time, "time", lambda: now)
+    cache.store("a", unit(1), "A")
+    now += 61
+    assert cache.lookup(unit(1)) is None
+    assert cache.stats()["entries"] == 0
+
+def test_new_index_version_clears_the_cache():
+    cache = SemanticCache("test_index_version", dim=8)
+    cache.store("a", unit(1), "A")
+    cache.on_index_version("v2")
+    assert cache.lookup(unit(1)) is None
+    assert cache.stats()["entries"] == 0
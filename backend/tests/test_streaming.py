@@ -0,0 +1,90 @@
+import asyncio
+from typing import List
+from streaming import SSE_HEARTBEAT, sse_event, sse_stream, split_words
+
+def parse_sse(raw: bytes, chunk_size: int) -> List[str]:
+    """Decode an SSE byte stream delivered in `chunk_size` pieces, as a browser would"""
+    events, data_lines, pending = [], [], b""
+    for start in range(0, len(raw), chunk_size):
+        pending += raw[start:start + chunk_size]
+        while b"\n" in pending:
+            line, pending = pending.split(b"\n", 1)
+            line = line.decode("utf-8")
+            if line == "":
+                if data_lines:
+                    events.append("\n".join(data_lines))
+                data_lines = []
+            elif line.startswith("data:"):
+                data_lines.append(line[5:].removeprefix(" "))
+    assert pending == b"", "stream ended mid-line"
+    return events
+
+async def collect(chunks, **kwargs) -> List[str]:
+    return [frame async for frame in sse_stream(chunks, **kwargs)]
+
+async def slow_words(words, delay):
+    for word in words:
+        yield word
+        await asyncio.sleep(delay)
+
+def test_events_survive_any_chunk_boundary():
+    text = "Line one of the answer.\nLine two, with a fee of $675 and ünïcode.\r\n\nAfter a blank line."
+    frames = asyncio.run(collect(split_words(text), coalesce_ms=0))
+    raw = "".join(frames).encode("utf-8")
+    for chunk_size in (1, 2, 3, 7, 64, len(raw)):
+        assert "".join(parse_sse(raw, chunk_size)) == text.replace("\r\n", "\n")
+
+def test_multiline_text_is_one_event():
+    event = sse_event("first\nsecond\r\nthird")
+    assert event == "data: first\ndata: second\ndata: third\n\n"
+    assert parse_sse(event.encode(), 4) == ["first\nsecond\nthird"]
+
+def test_close_pieces_are_coalesced_and_size_flushes_early():
+    words = [f"word{n} " for n in range(10)]
+    frames = asyncio.run(collect(words, coalesce_ms=1000, coalesce_bytes=1 << 20))
+    assert frames == [sse_event("".join(words))]
+
+    frames = asyncio.run(collect(words, coalesce_ms=1000, coalesce_bytes=12))
+    assert len(frames) == 5
+    assert "".join(parse_sse("".join(frames).encode(), 5)) == "".join(words)
+
+def test_quiet_stream_sends_heartbeats_that_clients_ignore():
+    frames = asyncio.run(collect(slow_words(["late answer"], 0.25), coalesce_ms=0, heartbeat=0.05))
+    assert SSE_HEARTBEAT in frames
+    assert parse_sse("".join(frames).encode(), 3) == ["late answer"]
+
+def test_source_is_closed_when_the_client_goes_away():
+    closed = asyncio.Event()
+
+    async def endless():
+        try:
+            while True:
+                yield "more "
+                await asyncio.sleep(0.001)
+        finally:
+            closed.set()
+
+    async def run():
+        stream = sse_stream(endless(), coalesce_ms=0)
+        await stream.__anext__()
+        await stream.aclose()  # what Starlette does on disconnect
+        await asyncio.wait_for(closed.wait(), timeout=1)
+
+    asyncio.run(run())
+
+def test_source_errors_reach_the_response():
+    async def failing():
+        yield "partial "
+        raise RuntimeError("generation failed")
+
+    async def run():
+        frames = []
+        try:
+            async for frame in sse_stream(failing(), coalesce_ms=0):
+                frames.append(frame)
+        except RuntimeError as e:
+            return frames, str(e)
+
+    frames, error = asyncio.run(run())
+    assert frames == [sse_event("partial ")]
+    assert error == "generation failed"
@@ -0,0 +1,101 @@
+# warmup.py - Background model warm-up and readiness state
+#
+# Loading models and running a first inference (which JITs kernels and
+# allocates buffers) takes seconds. The API starts a Warmup at startup and
+# its readiness endpoint reports ready only after every stage has run, so a
+# load balancer sends traffic to warmed instances only.
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Optional
+from embeddings import embed_model
+from lexical_index import get_lexical_index
+
+WARMUP_ENABLED = os.getenv("WARMUP", "true").lower() == "true"
+WARMUP_RETRIES = int(os.getenv("WARMUP_RETRIES", "5"))  # retries per stage before warm-up fails
+WARMUP_RETRY_DELAY = float(os.getenv("WARMUP_RETRY_DELAY", "2"))  # first retry delay, doubled each time
+
+class Warmup:
+    """Runs named warm-up stages in order on a background thread.
+
+    A failing stage is retried with exponential backoff (a file briefly
+    missing, Qdrant restarting); once its retries run out, warm-up fails for
+    good and liveness reports it, so the orchestrator restarts the instance.
+    """
+
+    def __init__(self, enabled: bool = WARMUP_ENABLED, retries: int = WARMUP_RETRIES,
+                 retry_delay: float = WARMUP_RETRY_DELAY):
+        self.enabled = enabled
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.status = "pending"  # pending, running, ready, failed
+        self.error: Optional[str] = None
+        self._stages: "OrderedDict[str, Callable[[], None]]" = OrderedDict()
+        self._timings: Dict[str, float] = {}
+        self._started_at: Optional[float] = None
+        self._finished_at: Optional[float] = None
+        self._thread: Optional[threading.Thread] = None
+
+    def add_stage(self, name: str, fn: Callable[[], None]):
+        self._stages[name] = fn
+
+    @property
+    def ready(self) -> bool:
+        return self.status == "ready"
+
+    @property
+    def failed(self) -> bool:
+        return self.status == "failed"
+
+    def start(self):
+        """Start warming up in the background (only once)"""
+        if self._thread is not None:
+            return
+        if not self.enabled:
+            self.status = "ready"
+            return
+        self._thread = threading.Thread(target=self._run, name="warmup", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        self.status = "running"
+        self._started_at = time.time()
+        for name, fn in self._stages.items():
+            start = time.perf_counter()
+            print(f"Warm-up: {name}...")
+            for attempt in range(self.retries + 1):
+                try:
+                    fn()
+                    break
+                except Exception as e:
+                    self.error = f"{name}: {e}"
+                    if attempt == self.retries:
+                        self.status = "failed"
+                        self._finished_at = time.time()
+                        print(f"Warm-up failed in stage {name} after {attempt + 1} attempts: {e}")
+                        return
+                    delay = min(self.retry_delay * 2 ** attempt, 60.0)
+                    print(f"Warm-up stage {name} failed ({e}); retrying in {delay:.0f}s")
+                    time.sleep(delay)
+            self.error = None
+            self._timings[name] = round(time.perf_counter() - start, 2)
+        self._finished_at = time.time()
+        self.status = "ready"
+        print(f"Warm-up complete in {self._finished_at - self._started_at:.1f}s: {self._timings}")
+
+    def to_dict(self) -> Dict:
+        return {
+            "status": self.status,
+            "stages": {name: self._timings.get(name) for name in self._stages},
+            "error": self.error,
+        }
+
+def warm_embedding_model():
+    """Encode once at single and batch sizes"""
+    embed_model.encode("How do I apply for a green card?")
+    embed_model.encode(["warm-up sentence"] * 8)
+
+def warm_lexical_index():
+    """Load the BM25 index from disk so the first hybrid search does not"""
+    get_lexical_index()
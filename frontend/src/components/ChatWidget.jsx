@@ -73,14 +73,14 @@ function ChatWidget({ onMessageSent }) {
     setIsLoading(true)
     
     try {
-      // Send profile to get guidance
-      const response = await fetch('http://localhost:8000/get-guidance', {
-        method: 'POST',
-        headers: {
-          'Content-Type': 'application/json',
-        },
-        body: JSON.stringify(userProfile),
+      // Send profile to get guidance (a GET, so the browser and CDN can cache the answer)
+      const params = new URLSearchParams()
+      Object.entries(userProfile).forEach(([key, value]) => {
+        if (value !== null && value !== undefined && value !== '') {
+          params.append(key, value)
+        }
       })
+      const response = await fetch(`http://localhost:8000/get-guidance?${params}`)
 
       if (!response.ok) {
         throw new Error(`HTTP error! status: ${response.status}`)
@@ -182,6 +182,7 @@ function ChatWidget({ onMessageSent }) {
       const decoder = new TextDecoder()
 
       let assistantContent = ''
+      let buffer = ''
 
       try {
         while (true) {
@@ -189,25 +190,30 @@ function ChatWidget({ onMessageSent }) {
           
           if (done) break
 
-          const chunk = decoder.decode(value, { stream: true })
-          const lines = chunk.split('\n')
-
-          for (const line of lines) {
-            if (line.startsWith('data: ')) {
-              const content = line.slice(6) // Remove 'data: ' prefix
-              if (content.trim()) {
-                assistantContent += content
-                
-                // Update the assistant message
-                setMessages(prev => {
-                  const newMessages = [...prev]
-                  const lastMessage = newMessages[newMessages.length - 1]
-                  if (lastMessage.role === 'assistant') {
-                    lastMessage.content = assistantContent
-                  }
-                  return newMessages
-                })
-              }
+          // Events end with a blank line and may span reads; an event's
+          // data: lines are joined with newlines, ':' lines are heartbeats
+          buffer += decoder.decode(value, { stream: true })
+          const events = buffer.split('\n\n')
+          buffer = events.pop()
+
+          for (const event of events) {
+            const content = event
+              .split('\n')
+              .filter(line => line.startsWith('data: '))
+              .map(line => line.slice(6)) // Remove 'data: ' prefix
+              .join('\n')
+            if (content) {
+              assistantContent += content
+              
+              // Update the assistant message
+              setMessages(prev => {
+                const newMessages = [...prev]
+                const lastMessage = newMessages[newMessages.length - 1]
+                if (lastMessage.role === 'assistant') {
+                  lastMessage.content = assistantContent
+                }
+                return newMessages
+              })
             }
           }
         }
@@ -9,12 +9,15 @@ class ApiService {
   async makeRequest(endpoint, options = {}) {
     try {
       const url = `${API_BASE_URL}${endpoint}`;
+      // Only requests with a body declare one: on a cross-origin GET the
+      // header would force a CORS preflight round trip
+      const headers = options.body ? { 'Content-Type': 'application/json' } : {};
       const response = await fetch(url, {
+        ...options,
         headers: {
-          'Content-Type': 'application/json',
+          ...headers,
           ...options.headers,
         },
-        ...options,
       });
 
       if (!response.ok) {
@@ -31,17 +34,18 @@ class ApiService {
   // Get personalized guidance based on user profile
   async getGuidance(userProfile) {
     try {
-      const response = await this.makeRequest('/get-guidance', {
-        method: 'POST',
-        body: JSON.stringify({
-          current_country: userProfile.country || 'unknown',
-          current_status: userProfile.status || 'none',
-          goal: userProfile.goal || 'unknown',
-          education_level: userProfile.education,
-          has_job_offer: userProfile.hasJobOffer,
-          family_in_us: userProfile.familyInUs
-        }),
+      // A GET, so the browser and CDN can cache the answer
+      const params = new URLSearchParams({
+        current_country: userProfile.country || 'unknown',
+        current_status: userProfile.status || 'none',
+        goal: userProfile.goal || 'unknown',
       });
+      if (userProfile.education) params.append('education_level', userProfile.education);
+      if (userProfile.hasJobOffer !== undefined && userProfile.hasJobOffer !== null) {
+        params.append('has_job_offer', userProfile.hasJobOffer);
+      }
+      if (userProfile.familyInUs) params.append('family_in_us', userProfile.familyInUs);
+      const response = await this.makeRequest(`/get-guidance?${params}`);
       return response;
     } catch (error) {
       console.error('Failed to get guidance:', error);
@@ -78,21 +82,23 @@ class ApiService {
       const reader = response.body.getReader();
       const decoder = new TextDecoder();
       let result = '';
+      let buffer = '';
 
       while (true) {
         const { done, value } = await reader.read();
         if (done) break;
         
-        const chunk = decoder.decode(value);
-        const lines = chunk.split('\n');
+        // Events end with a blank line and may span reads
+        buffer += decoder.decode(value, { stream: true });
+        const events = buffer.split('\n\n');
+        buffer = events.pop();
         
-        for (const line of lines) {
-          if (line.startsWith('data: ')) {
-            const word = line.slice(6);
-            if (word.trim()) {
-              result += word + ' ';
-            }
-          }
+        for (const event of events) {
+          result += event
+            .split('\n')
+            .filter(line => line.startsWith('data: '))
+            .map(line => line.slice(6))
+            .join('\n');
         }
       }
 